@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+    Small CPU bound benchmark kernels, modelled after the pyperformance
+    benchmarks of the same names.
+
+    Usage: cpu_tasks.py [-n loops] [-t task,...]
+
+    Runs each task n times in the current interpreter and writes a JSON
+    dictionary mapping the task names to the lists of durations in
+    seconds to stdout. suite.py runs this script with pyrun and with
+    CPython, to check that the frozen, static and patched pyrun runtime
+    doesn't slow down steady-state code.
+
+    The tasks only use the stdlib and work with Python 3.6+.
+
+"""
+import sys
+import time
+import json
+import pickle
+import re
+
+### Globals
+
+# Number of runs per task
+LOOPS = 5
+
+### Tasks
+
+# nbody: planet orbit simulation using float arithmetic and lists
+
+PI = 3.14159265358979323
+SOLAR_MASS = 4 * PI * PI
+DAYS_PER_YEAR = 365.24
+
+BODIES = (
+    # sun
+    ([0.0, 0.0, 0.0], [0.0, 0.0, 0.0], SOLAR_MASS),
+    # jupiter
+    ([4.84143144246472090e+00, -1.16032004402742839e+00,
+      -1.03622044471123109e-01],
+     [1.66007664274403694e-03 * DAYS_PER_YEAR,
+      7.69901118419740425e-03 * DAYS_PER_YEAR,
+      -6.90460016972063023e-05 * DAYS_PER_YEAR],
+     9.54791938424326609e-04 * SOLAR_MASS),
+    # saturn
+    ([8.34336671824457987e+00, 4.12479856412430479e+00,
+      -4.03523417114321381e-01],
+     [-2.76742510726862411e-03 * DAYS_PER_YEAR,
+      4.99852801234917238e-03 * DAYS_PER_YEAR,
+      2.30417297573763929e-05 * DAYS_PER_YEAR],
+     2.85885980666130812e-04 * SOLAR_MASS),
+    # uranus
+    ([1.28943695621391310e+01, -1.51111514016986312e+01,
+      -2.23307578892655734e-01],
+     [2.96460137564761618e-03 * DAYS_PER_YEAR,
+      2.37847173959480950e-03 * DAYS_PER_YEAR,
+      -2.96589568540237556e-05 * DAYS_PER_YEAR],
+     4.36624404335156298e-05 * SOLAR_MASS),
+    # neptune
+    ([1.53796971148509165e+01, -2.59193146099879641e+01,
+      1.79258772950371181e-01],
+     [2.68067772490389322e-03 * DAYS_PER_YEAR,
+      1.62824170038242295e-03 * DAYS_PER_YEAR,
+      -9.51592254519715870e-05 * DAYS_PER_YEAR],
+     5.15138902046611451e-05 * SOLAR_MASS),
+    )
+
+def nbody(steps=20000):
+
+    bodies = [([x for x in position], [v for v in velocity], mass)
+              for position, velocity, mass in BODIES]
+    pairs = [(bodies[i], bodies[j])
+             for i in range(len(bodies))
+             for j in range(i + 1, len(bodies))]
+    for step in range(steps):
+        for (([x1, y1, z1], v1, m1), ([x2, y2, z2], v2, m2)) in pairs:
+            dx = x1 - x2
+            dy = y1 - y2
+            dz = z1 - z2
+            mag = 0.01 * ((dx * dx + dy * dy + dz * dz) ** (-1.5))
+            b1m = m1 * mag
+            b2m = m2 * mag
+            v1[0] -= dx * b2m
+            v1[1] -= dy * b2m
+            v1[2] -= dz * b2m
+            v2[0] += dx * b1m
+            v2[1] += dy * b1m
+            v2[2] += dz * b1m
+        for (r, [vx, vy, vz], m) in bodies:
+            r[0] += 0.01 * vx
+            r[1] += 0.01 * vy
+            r[2] += 0.01 * vz
+
+# spectral_norm: eigenvalue approximation using function calls and
+# generators
+
+def eval_a(i, j):
+    return 1.0 / ((i + j) * (i + j + 1) // 2 + i + 1)
+
+def eval_times_u(function, u):
+    return [function((i, u)) for i in range(len(u))]
+
+def part_a_times_u(i_u):
+    i, u = i_u
+    return sum(eval_a(i, j) * u_j for j, u_j in enumerate(u))
+
+def part_at_times_u(i_u):
+    i, u = i_u
+    return sum(eval_a(j, i) * u_j for j, u_j in enumerate(u))
+
+def spectral_norm(n=100):
+
+    u = [1.0] * n
+    for dummy in range(10):
+        v = eval_times_u(part_at_times_u, eval_times_u(part_a_times_u, u))
+        u = eval_times_u(part_at_times_u, eval_times_u(part_a_times_u, v))
+    vbv = vv = 0.0
+    for ue, ve in zip(u, v):
+        vbv += ue * ve
+        vv += ve * ve
+    return vbv / vv
+
+# fannkuch: permutations using list slicing
+
+def fannkuch(n=8):
+
+    count = list(range(1, n + 1))
+    max_flips = 0
+    m = n - 1
+    r = n
+    perm1 = list(range(n))
+    perm = list(range(n))
+    perm1_ins = perm1.insert
+    perm1_pop = perm1.pop
+    while True:
+        while r != 1:
+            count[r - 1] = r
+            r -= 1
+        if perm1[0] != 0 and perm1[m] != m:
+            perm = perm1[:]
+            flips_count = 0
+            k = perm[0]
+            while k:
+                perm[:k + 1] = perm[k::-1]
+                flips_count += 1
+                k = perm[0]
+            if flips_count > max_flips:
+                max_flips = flips_count
+        while r != n:
+            perm1_ins(r, perm1_pop(0))
+            count[r] -= 1
+            if count[r] > 0:
+                break
+            r += 1
+        else:
+            return max_flips
+
+# float: object creation and float methods
+
+class Point(object):
+
+    __slots__ = ('x', 'y', 'z')
+
+    def __init__(self, i):
+        self.x = x = i
+        self.y = x * 3 - 2
+        self.z = (x * x) / 2
+
+    def normalize(self):
+        norm = (self.x * self.x + self.y * self.y + self.z * self.z) ** 0.5
+        self.x /= norm
+        self.y /= norm
+        self.z /= norm
+
+    def maximize(self, other):
+        self.x = self.x if self.x > other.x else other.x
+        self.y = self.y if self.y > other.y else other.y
+        self.z = self.z if self.z > other.z else other.z
+        return self
+
+def float_points(points=50000):
+
+    result = [Point(float(i)) for i in range(points)]
+    for point in result:
+        point.normalize()
+    current = result[0]
+    for point in result[1:]:
+        current = current.maximize(point)
+    return current
+
+# nqueens: sets, generators and permutations
+
+def permutations(iterable, r=None):
+    pool = tuple(iterable)
+    n = len(pool)
+    r = n if r is None else r
+    indices = list(range(n))
+    cycles = list(range(n - r + 1, n + 1))[::-1]
+    yield tuple(pool[i] for i in indices[:r])
+    while n:
+        for i in reversed(range(r)):
+            cycles[i] -= 1
+            if cycles[i] == 0:
+                indices[i:] = indices[i + 1:] + indices[i:i + 1]
+                cycles[i] = n - i
+            else:
+                j = cycles[i]
+                indices[i], indices[-j] = indices[-j], indices[i]
+                yield tuple(pool[i] for i in indices[:r])
+                break
+        else:
+            return
+
+def nqueens(queens=7):
+
+    columns = range(queens)
+    return [vec for vec in permutations(columns)
+            if (queens == len(set(vec[i] + i for i in columns)) ==
+                len(set(vec[i] - i for i in columns)))]
+
+# json and pickle: C accelerated serialization, which has to be linked
+# statically into pyrun
+
+DATA = {
+    'key': 'value',
+    'int': 12345,
+    'float': 3.14159,
+    'unicode': '\xe9\xe8\xea \u4e2d\u6587',
+    'list': [1, 2.5, 'three', None, True, False] * 10,
+    'dict': dict(('key%i' % i, {'value': i, 'items': list(range(i))})
+                 for i in range(20)),
+    }
+
+def json_dumps(loops=500):
+
+    for i in range(loops):
+        json.dumps(DATA)
+        json.dumps(DATA, sort_keys=True, indent=2)
+
+def json_loads(loops=500):
+
+    encoded = json.dumps(DATA)
+    for i in range(loops * 2):
+        json.loads(encoded)
+
+def pickle_dumps_loads(loops=1000):
+
+    for protocol in (2, pickle.HIGHEST_PROTOCOL):
+        for i in range(loops):
+            pickle.loads(pickle.dumps(DATA, protocol))
+
+# regex: matching with the (C) sre engine, using precompiled patterns
+
+TEXT = ''.join(
+    'user%i@example%i.com visited http://www.example%i.org/path/%i?q=%i '
+    'on 2024-%02i-%02i at %02i:%02i from 192.168.%i.%i\n' % (
+        i, i % 7, i % 13, i, i * 7, i % 12 + 1, i % 28 + 1, i % 24,
+        i % 60, i % 256, (i * 3) % 256)
+    for i in range(500))
+
+PATTERNS = [re.compile(pattern) for pattern in (
+    r'[\w.+-]+@[\w-]+\.[\w.]+',
+    r'https?://[^\s?]+(?:\?\S*)?',
+    r'(\d{4})-(\d{2})-(\d{2})',
+    r'\b(?:\d{1,3}\.){3}\d{1,3}\b',
+    r'(?i)EXAMPLE\d+\.(?:com|org)',
+    r'visited (\S+) on',
+    )]
+
+def regex(loops=10):
+
+    for i in range(loops):
+        for pattern in PATTERNS:
+            pattern.findall(TEXT)
+        PATTERNS[2].sub(r'\3.\2.\1', TEXT)
+
+# Task names and functions
+TASKS = (
+    ('nbody', nbody),
+    ('spectral_norm', spectral_norm),
+    ('fannkuch', fannkuch),
+    ('float', float_points),
+    ('nqueens', nqueens),
+    ('json_dumps', json_dumps),
+    ('json_loads', json_loads),
+    ('pickle', pickle_dumps_loads),
+    ('regex', regex),
+    )
+
+### Helpers
+
+def run_tasks(tasks, loops=LOOPS):
+
+    """ Run the tasks (a list of task names) loops times and return a
+        dictionary mapping the task names to the list of durations.
+
+    """
+    functions = dict(TASKS)
+    results = {}
+    for name in tasks:
+        function = functions[name]
+        # Warm up
+        function()
+        durations = []
+        for i in range(loops):
+            start = time.perf_counter()
+            function()
+            durations.append(time.perf_counter() - start)
+        results[name] = durations
+    return results
+
+###
+
+def main(argv):
+
+    loops = LOOPS
+    tasks = [name for name, function in TASKS]
+    args = argv[1:]
+    while args and args[0].startswith('-'):
+        option = args.pop(0)
+        if option == '-n':
+            loops = int(args.pop(0))
+        elif option == '-t':
+            tasks = args.pop(0).split(',')
+        else:
+            sys.stderr.write(__doc__)
+            return 1
+    unknown = set(tasks) - set(name for name, function in TASKS)
+    if unknown or args:
+        sys.stderr.write(__doc__)
+        return 1
+    json.dump(run_tasks(tasks, loops), sys.stdout)
+    sys.stdout.write('\n')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+    Measure the cost of looking up modules in the frozen module tables.
+
+    Usage: pyrun frozen_lookup.py [-n loops] [-j jsonfile]
+
+    Every import attempt first asks the FrozenImporter, which calls
+    _imp.find_frozen(). This benchmark times those calls for hits
+    (frozen modules) and misses (e.g. modules from site-packages or
+    lib-dynload), using names from different parts of the alphabet.
+
+    Run this with different pyrun builds to compare the lookup
+    implementations (linear scan vs. binary search).
+
+"""
+import sys
+import time
+import json
+import _imp
+
+### Globals
+
+# Number of loops over the names
+LOOPS = 200
+
+# Names to use for misses; these are modules typically found in
+# lib-dynload or site-packages, or not at all
+MISSES = (
+    'Cython',
+    '_ctypes',
+    '_decimal',
+    'aaa_not_found',
+    'certifi',
+    'mmmm_not_found',
+    'numpy',
+    'pip',
+    'readline',
+    'setuptools',
+    'yaml',
+    'zzz_not_found',
+    )
+
+### Helpers
+
+def frozen_names():
+
+    """ Return a sorted list of frozen module names.
+
+    """
+    candidates = set(sys.modules)
+    candidates.update(getattr(sys, 'stdlib_module_names', ()))
+    return sorted(name for name in candidates if _imp.is_frozen(name))
+
+def time_lookups(names, loops=LOOPS):
+
+    """ Return the average time per _imp.find_frozen() call for names
+        in nanoseconds.
+
+    """
+    find_frozen = _imp.find_frozen
+    clock = time.perf_counter
+    best = None
+    for repeat in range(5):
+        start = clock()
+        for i in range(loops):
+            for name in names:
+                find_frozen(name)
+        duration = clock() - start
+        if best is None or duration < best:
+            best = duration
+    return best / (loops * len(names)) * 1e9
+
+def time_baseline(names, loops=LOOPS):
+
+    """ Return the average time per call of a trivial builtin for
+        comparison, in nanoseconds.
+
+    """
+    function = len
+    clock = time.perf_counter
+    best = None
+    for repeat in range(5):
+        start = clock()
+        for i in range(loops):
+            for name in names:
+                function(name)
+        duration = clock() - start
+        if best is None or duration < best:
+            best = duration
+    return best / (loops * len(names)) * 1e9
+
+###
+
+def main(argv):
+
+    loops = LOOPS
+    json_file = None
+    args = argv[1:]
+    while args:
+        option = args.pop(0)
+        if option == '-n':
+            loops = int(args.pop(0))
+        elif option == '-j':
+            json_file = args.pop(0)
+        else:
+            sys.stderr.write(__doc__)
+            return 1
+    if not hasattr(_imp, 'find_frozen'):
+        sys.stderr.write('_imp.find_frozen() is not available\n')
+        return 1
+    hits = frozen_names()
+    misses = [name for name in MISSES if not _imp.is_frozen(name)]
+    baseline = time_baseline(hits, loops)
+    result = {
+        'executable': sys.executable,
+        'version': sys.version,
+        'frozen_modules': len(hits),
+        'baseline_ns': baseline,
+        'hit_ns': time_lookups(hits, loops) - baseline,
+        'miss_ns': time_lookups(misses, loops) - baseline,
+        }
+    print('Frozen module lookups with %s' % sys.executable)
+    print('  frozen modules found: %i' % result['frozen_modules'])
+    print('  hit:  %8.1f ns per lookup' % result['hit_ns'])
+    print('  miss: %8.1f ns per lookup' % result['miss_ns'])
+    if json_file:
+        with open(json_file, 'w') as file:
+            json.dump(result, file, indent=1)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+    Measure the import latency of stdlib modules.
+
+    Usage: imports.py [-n runs] [-j jsonfile] [-m module,...]
+                      <binary> [<binary> ...]
+
+    Each module is imported in a fresh process, timing only the import
+    statement itself, so that modules already loaded during startup
+    don't distort the results. The best and median times of n runs
+    are reported.
+
+    Run this with different pyrun builds (e.g. with and without
+    deepfrozen modules) to compare them.
+
+    Binaries which don't exist are skipped.
+
+"""
+import sys
+import os
+import json
+import subprocess
+
+### Globals
+
+# Number of runs per module
+RUNS = 10
+
+# Modules to import
+MODULES = (
+    'json',
+    'email.message',
+    'email.parser',
+    'http.client',
+    'urllib.request',
+    'argparse',
+    'typing',
+    'decimal',
+    'logging',
+    'asyncio',
+    )
+
+# Code used for timing an import
+PROBE = '''\
+import time
+start = time.perf_counter()
+import %s
+print(time.perf_counter() - start)
+'''
+
+### Helpers
+
+def time_import(binary, module):
+
+    """ Return the time needed for importing module in a fresh
+        binary process in seconds.
+
+    """
+    env = dict(os.environ)
+    for name in ('PYRUN_SERVER', 'PYRUN_IMPORTTIME'):
+        env.pop(name, None)
+    output = subprocess.check_output([binary, '-c', PROBE % module],
+                                     env=env)
+    return float(output.decode('ascii').split()[-1])
+
+def median(values):
+
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+def benchmark(binary, modules=MODULES, runs=RUNS):
+
+    """ Benchmark the imports of modules with binary and return a
+        dictionary with the results.
+
+    """
+    result = {
+        'binary': binary,
+        'imports': {},
+        }
+    for module in modules:
+        # Warm up the OS caches
+        time_import(binary, module)
+        durations = [time_import(binary, module) for i in range(runs)]
+        result['imports'][module] = {
+            'best_ms': min(durations) * 1e3,
+            'median_ms': median(durations) * 1e3,
+            }
+    return result
+
+def print_results(results, modules=MODULES):
+
+    print('%-20s' % 'module [ms]' +
+          ''.join(' %14s' % os.path.basename(result['binary'])[:14]
+                  for result in results))
+    print('-' * (20 + 15 * len(results)))
+    for module in modules:
+        print('%-20s' % module +
+              ''.join(' %14.2f' % result['imports'][module]['median_ms']
+                      for result in results))
+    print('')
+    print('Times are medians.')
+
+###
+
+def main(argv):
+
+    runs = RUNS
+    json_file = None
+    modules = MODULES
+    args = argv[1:]
+    while args and args[0].startswith('-'):
+        option = args.pop(0)
+        if option == '-n':
+            runs = int(args.pop(0))
+        elif option == '-j':
+            json_file = args.pop(0)
+        elif option == '-m':
+            modules = tuple(args.pop(0).split(','))
+        else:
+            sys.stderr.write(__doc__)
+            return 1
+    binaries = [binary for binary in args if os.path.exists(binary)]
+    if not binaries:
+        sys.stderr.write(__doc__)
+        return 1
+    results = [benchmark(os.path.abspath(binary), modules, runs)
+               for binary in binaries]
+    print_results(results, modules)
+    if json_file:
+        with open(json_file, 'w') as file:
+            json.dump(results, file, indent=1)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
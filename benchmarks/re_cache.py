@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+    Measure the effect of the precompiled regular expressions on import
+    latency.
+
+    Usage: re_cache.py [-n runs] [-j jsonfile] [-m module,...]
+                       <binary> [<binary> ...]
+
+    Each module is imported in a fresh process, once with the
+    precompiled patterns enabled and once with them disabled via
+    PYRUN_RECACHE=0. The modules used by default compile regular
+    expressions at import time. The median times of n runs are
+    reported.
+
+    The binaries have to be built with PYRUNFREEZERECACHE. Binaries
+    which don't exist are skipped.
+
+"""
+import sys
+import os
+import json
+import subprocess
+
+### Globals
+
+# Number of runs per module
+RUNS = 10
+
+# Modules to import; these compile regular expressions at module level
+MODULES = (
+    'email.utils',
+    'email.feedparser',
+    'http.cookies',
+    'http.cookiejar',
+    'tokenize',
+    'string',
+    'textwrap',
+    'urllib.parse',
+    'csv',
+    'json',
+    )
+
+# Code used for timing an import
+PROBE = '''\
+import time
+start = time.perf_counter()
+import %s
+print(time.perf_counter() - start)
+'''
+
+### Helpers
+
+def time_import(binary, module, re_cache):
+
+    """ Return the time needed for importing module in a fresh
+        binary process in seconds.
+
+        re_cache enables or disables the use of the precompiled
+        patterns.
+
+    """
+    env = dict(os.environ)
+    for name in ('PYRUN_SERVER', 'PYRUN_IMPORTTIME'):
+        env.pop(name, None)
+    env['PYRUN_RECACHE'] = '1' if re_cache else '0'
+    output = subprocess.check_output([binary, '-c', PROBE % module],
+                                     env=env)
+    return float(output.decode('ascii').split()[-1])
+
+def median(values):
+
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+def benchmark(binary, modules=MODULES, runs=RUNS):
+
+    """ Benchmark the imports of modules with binary with and without
+        precompiled patterns and return a dictionary with the results.
+
+    """
+    result = {
+        'binary': binary,
+        'imports': {},
+        }
+    for module in modules:
+        entry = {}
+        for re_cache, name in ((1, 'cached_ms'), (0, 'uncached_ms')):
+            # Warm up the OS caches
+            time_import(binary, module, re_cache)
+            durations = [time_import(binary, module, re_cache)
+                         for i in range(runs)]
+            entry[name] = median(durations) * 1e3
+        result['imports'][module] = entry
+    return result
+
+def print_results(results, modules=MODULES):
+
+    for result in results:
+        print('%s:' % result['binary'])
+        print('%-20s %12s %12s %8s' % ('module [ms]', 'uncached',
+                                       'cached', 'saved'))
+        print('-' * 55)
+        for module in modules:
+            entry = result['imports'][module]
+            print('%-20s %12.2f %12.2f %7.0f%%' % (
+                module,
+                entry['uncached_ms'],
+                entry['cached_ms'],
+                100.0 * (1.0 - entry['cached_ms'] /
+                         max(entry['uncached_ms'], 1e-9))))
+        print('')
+    print('Times are medians.')
+
+###
+
+def main(argv):
+
+    runs = RUNS
+    json_file = None
+    modules = MODULES
+    args = argv[1:]
+    while args and args[0].startswith('-'):
+        option = args.pop(0)
+        if option == '-n':
+            runs = int(args.pop(0))
+        elif option == '-j':
+            json_file = args.pop(0)
+        elif option == '-m':
+            modules = tuple(args.pop(0).split(','))
+        else:
+            sys.stderr.write(__doc__)
+            return 1
+    binaries = [binary for binary in args if os.path.exists(binary)]
+    if not binaries:
+        sys.stderr.write(__doc__)
+        return 1
+    results = [benchmark(os.path.abspath(binary), modules, runs)
+               for binary in binaries]
+    print_results(results, modules)
+    if json_file:
+        with open(json_file, 'w') as file:
+            json.dump(results, file, indent=1)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
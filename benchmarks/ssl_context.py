@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+    Measure the effect of the cached default HTTPS context on many short
+    HTTPS requests.
+
+    Usage: ssl_context.py [-n requests] [-r runs] [-j jsonfile]
+                          <binary> [<binary> ...]
+
+    A local HTTPS test server is started using a certificate signed by
+    a temporary CA, which is added to a copy of the system CA file, so
+    that creating a context loads as many certificates as usual. The
+    binaries then run n requests against the server, each using a new
+    http.client.HTTPSConnection, like connection pools or clients
+    creating a connection per request do, once with the context cache
+    enabled and once with it disabled via PYRUN_SSLCONTEXTCACHE=0. The
+    median time per request and the peak memory use of r runs are
+    reported. The connection objects are kept, like connection pools
+    do, so the peak memory use includes their contexts.
+
+    Needs the openssl command line tool for creating the certificates.
+    Binaries which don't exist are skipped.
+
+"""
+import sys
+import os
+import json
+import shutil
+import ssl
+import subprocess
+import tempfile
+import threading
+import http.server
+
+### Globals
+
+# Number of requests per run
+REQUESTS = 100
+
+# Number of runs
+RUNS = 5
+
+# Code run by the binaries
+PROBE = '''\
+import sys, time, resource, http.client
+port = int(sys.argv[1])
+requests = int(sys.argv[2])
+connections = []
+start = time.perf_counter()
+for i in range(requests):
+    connection = http.client.HTTPSConnection('localhost', port)
+    connection.request('GET', '/')
+    connection.getresponse().read()
+    connection.close()
+    # Keep the connection and its context, like a connection pool
+    connections.append(connection)
+duration = time.perf_counter() - start
+print(duration / requests, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+'''
+
+### Test server
+
+class Handler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        body = b'ok\n'
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def openssl(*args):
+
+    subprocess.check_call(('openssl',) + args,
+                          stdout=subprocess.DEVNULL,
+                          stderr=subprocess.DEVNULL)
+
+def create_certificates(workdir):
+
+    """ Create a CA and a server certificate for localhost in workdir.
+
+        Returns the (CA file, server certificate file, server key file)
+        tuple. The CA file also contains the system CA certificates.
+
+    """
+    ca_key = os.path.join(workdir, 'ca.key')
+    ca_cert = os.path.join(workdir, 'ca.pem')
+    key = os.path.join(workdir, 'server.key')
+    request = os.path.join(workdir, 'server.csr')
+    cert = os.path.join(workdir, 'server.pem')
+    extensions = os.path.join(workdir, 'server.ext')
+    openssl('req', '-x509', '-newkey', 'rsa:2048', '-nodes',
+            '-keyout', ca_key, '-out', ca_cert, '-days', '1',
+            '-subj', '/CN=PyRun benchmark CA')
+    openssl('req', '-newkey', 'rsa:2048', '-nodes',
+            '-keyout', key, '-out', request, '-subj', '/CN=localhost')
+    with open(extensions, 'w') as file:
+        file.write('subjectAltName = DNS:localhost, IP:127.0.0.1\n'
+                   'basicConstraints = CA:FALSE\n'
+                   'keyUsage = digitalSignature, keyEncipherment\n'
+                   'extendedKeyUsage = serverAuth\n')
+    openssl('x509', '-req', '-in', request, '-CA', ca_cert, '-CAkey', ca_key,
+            '-CAcreateserial', '-out', cert, '-days', '1',
+            '-extfile', extensions)
+    cafile = os.path.join(workdir, 'cafile.pem')
+    with open(cafile, 'wb') as output:
+        system_cafile = ssl.get_default_verify_paths().cafile
+        if system_cafile:
+            with open(system_cafile, 'rb') as file:
+                output.write(file.read())
+        with open(ca_cert, 'rb') as file:
+            output.write(b'\n' + file.read())
+    return cafile, cert, key
+
+def start_server(cert, key):
+
+    """ Start the HTTPS test server in a thread and return it.
+
+    """
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+### Helpers
+
+def run_requests(binary, port, cafile, requests, cache):
+
+    """ Run requests HTTPS requests against the test server on port
+        with binary and return the time per request in seconds and the
+        peak memory use in kB.
+
+        cache enables or disables the context cache.
+
+    """
+    env = dict(os.environ)
+    for name in ('PYRUN_SERVER', 'PYRUN_IMPORTTIME', 'PYRUN_HTTPSVERIFY'):
+        env.pop(name, None)
+    env['SSL_CERT_FILE'] = cafile
+    env['PYRUN_SSLCONTEXTCACHE'] = '1' if cache else '0'
+    output = subprocess.check_output(
+        [binary, '-c', PROBE, str(port), str(requests)],
+        env=env)
+    duration, maxrss = output.decode('ascii').split()[-2:]
+    return float(duration), int(maxrss)
+
+def median(values):
+
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+def benchmark(binary, port, cafile, requests=REQUESTS, runs=RUNS):
+
+    """ Benchmark the HTTPS requests with binary with and without the
+        context cache and return a dictionary with the results.
+
+    """
+    result = {
+        'binary': binary,
+        'requests': requests,
+        }
+    for cache, name in ((1, 'cached'), (0, 'uncached')):
+        # Warm up the OS caches
+        run_requests(binary, port, cafile, 1, cache)
+        measurements = [run_requests(binary, port, cafile, requests, cache)
+                        for i in range(runs)]
+        result[name] = {
+            'request_ms': median([m[0] for m in measurements]) * 1e3,
+            'maxrss_kb': median([m[1] for m in measurements]),
+            }
+    return result
+
+def print_results(results):
+
+    print('%-40s %12s %12s %12s %12s' % ('binary', 'uncached', 'cached',
+                                         'uncached', 'cached'))
+    print('%-40s %12s %12s %12s %12s' % ('', '[ms/req]', '[ms/req]',
+                                         '[MB]', '[MB]'))
+    print('-' * 92)
+    for result in results:
+        print('%-40s %12.2f %12.2f %12.1f %12.1f' % (
+            os.path.basename(result['binary']),
+            result['uncached']['request_ms'],
+            result['cached']['request_ms'],
+            result['uncached']['maxrss_kb'] / 1024.0,
+            result['cached']['maxrss_kb'] / 1024.0))
+    print('')
+    print('Times per request and peak memory use are medians.')
+
+###
+
+def main(argv):
+
+    requests = REQUESTS
+    runs = RUNS
+    json_file = None
+    args = argv[1:]
+    while args and args[0].startswith('-'):
+        option = args.pop(0)
+        if option == '-n':
+            requests = int(args.pop(0))
+        elif option == '-r':
+            runs = int(args.pop(0))
+        elif option == '-j':
+            json_file = args.pop(0)
+        else:
+            sys.stderr.write(__doc__)
+            return 1
+    binaries = [binary for binary in args if os.path.exists(binary)]
+    if not binaries:
+        sys.stderr.write(__doc__)
+        return 1
+    if shutil.which('openssl') is None:
+        sys.stderr.write('The openssl command line tool is needed for '
+                         'this benchmark.\n')
+        return 1
+    workdir = tempfile.mkdtemp(prefix='pyrun-ssl-benchmark-')
+    try:
+        cafile, cert, key = create_certificates(workdir)
+        server = start_server(cert, key)
+        port = server.server_address[1]
+        try:
+            results = [benchmark(os.path.abspath(binary), port, cafile,
+                                 requests, runs)
+                       for binary in binaries]
+        finally:
+            server.shutdown()
+    finally:
+        shutil.rmtree(workdir)
+    print_results(results)
+    if json_file:
+        with open(json_file, 'w') as file:
+            json.dump(results, file, indent=1)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
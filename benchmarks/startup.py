@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+    Compare startup time and memory use of pyrun binaries.
+
+    Usage: startup.py [-n runs] [-j jsonfile] <binary> [<binary> ...]
+
+    For each binary, the script measures the wall clock time of running
+    "-c pass" and "-c 'import json, email.message'" (best and median
+    of n runs), the max. RSS and page faults of the process and, on
+    Linux, the memory
+    breakdown of a running process taken from /proc/<pid>/smaps_rollup
+    (file backed pages can be shared between processes, anonymous ones
+    cannot).
+
+    This is useful for comparing e.g. the standard, UPX compressed and
+    compressed frozen data (freeze.py -z) variants of pyrun, or builds
+    with and without a layout profile for the frozen data (freeze.py
+    -L). Minor page faults are counted for pages already in the page
+    cache; major ones need disk I/O and only show up with cold caches.
+
+    Binaries which don't exist are skipped.
+
+"""
+import sys
+import os
+import time
+import json
+import subprocess
+
+### Globals
+
+# Number of runs per measurement
+RUNS = 20
+
+# Code to time
+TIMINGS = (
+    ('pass', 'pass'),
+    ('import', 'import json, email.message'),
+    )
+
+# smaps_rollup entries to report (in kB)
+SMAPS_ENTRIES = (
+    'Rss',
+    'Pss',
+    'Shared_Clean',
+    'Private_Clean',
+    'Private_Dirty',
+    'Anonymous',
+    )
+
+### Helpers
+
+def run_command(args):
+
+    """ Run the command args and return (wall clock time in seconds,
+        max. RSS in kB, minor page faults, major page faults).
+
+    """
+    env = dict(os.environ)
+    for name in ('PYRUN_SERVER', 'PYRUN_IMPORTTIME'):
+        env.pop(name, None)
+    start = time.perf_counter()
+    process = subprocess.Popen(args, stdin=subprocess.DEVNULL, env=env)
+    pid, status, rusage = os.wait4(process.pid, 0)
+    duration = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise RuntimeError('%s failed with exit code %i' %
+                           (args[0], process.returncode))
+    maxrss = rusage.ru_maxrss
+    if sys.platform == 'darwin':
+        # macOS reports bytes
+        maxrss //= 1024
+    return duration, maxrss, rusage.ru_minflt, rusage.ru_majflt
+
+def run_timed(binary, code, options=()):
+
+    """ Run binary with the command line options and -c code and
+        return the result of run_command().
+
+    """
+    return run_command([binary] + list(options) + ['-c', code])
+
+def smaps_rollup(binary):
+
+    """ Return a dictionary with the SMAPS_ENTRIES of a running binary
+        process (in kB), or None, if not available.
+
+    """
+    if not os.path.exists('/proc/self/smaps_rollup'):
+        return None
+    process = subprocess.Popen(
+        [binary, '-c', 'import sys; sys.stdout.write("ready\\n"); '
+                       'sys.stdout.flush(); sys.stdin.read()'],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE)
+    try:
+        process.stdout.readline()
+        with open('/proc/%i/smaps_rollup' % process.pid) as file:
+            lines = file.read().splitlines()
+    finally:
+        process.communicate()
+    result = {}
+    for line in lines:
+        key, sep, value = line.partition(':')
+        if key in SMAPS_ENTRIES:
+            result[key] = int(value.split()[0])
+    return result
+
+def median(values):
+
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+def benchmark(binary, runs=RUNS):
+
+    """ Benchmark binary and return a dictionary with the results.
+
+    """
+    result = {
+        'binary': binary,
+        'size': os.path.getsize(binary),
+        }
+    for name, code in TIMINGS:
+        # Warm up the OS caches
+        run_timed(binary, code)
+        durations = []
+        maxrss = []
+        minflt = []
+        majflt = []
+        for i in range(runs):
+            duration, rss, minor, major = run_timed(binary, code)
+            durations.append(duration)
+            maxrss.append(rss)
+            minflt.append(minor)
+            majflt.append(major)
+        result[name] = {
+            'best_ms': min(durations) * 1e3,
+            'median_ms': median(durations) * 1e3,
+            'maxrss_kb': max(maxrss),
+            'minflt': median(minflt),
+            'majflt': median(majflt),
+            }
+    result['smaps_kb'] = smaps_rollup(binary)
+    return result
+
+def print_results(results):
+
+    print('%-30s %10s %11s %11s %11s %11s %10s %10s' % (
+        'binary', 'size [kB]',
+        'pass [ms]', 'import [ms]', 'pass [kB]', 'import [kB]',
+        'anon [kB]', 'faults'))
+    print('-' * 111)
+    for result in results:
+        smaps = result['smaps_kb'] or {}
+        print('%-30s %10i %11.2f %11.2f %11i %11i %10s %10i' % (
+            os.path.basename(result['binary']),
+            result['size'] // 1024,
+            result['pass']['median_ms'],
+            result['import']['median_ms'],
+            result['pass']['maxrss_kb'],
+            result['import']['maxrss_kb'],
+            smaps.get('Anonymous', '-'),
+            result['pass']['minflt'] + result['pass']['majflt']))
+    print('')
+    print('Times are medians, memory is max. RSS; anon is the amount of '
+          'non-shareable')
+    print('anonymous memory of an idle process; faults is the median '
+          'number of page faults')
+    print('of a "-c pass" run.')
+
+###
+
+def main(argv):
+
+    runs = RUNS
+    json_file = None
+    args = argv[1:]
+    while args and args[0].startswith('-'):
+        option = args.pop(0)
+        if option == '-n':
+            runs = int(args.pop(0))
+        elif option == '-j':
+            json_file = args.pop(0)
+        else:
+            sys.stderr.write(__doc__)
+            return 1
+    binaries = [binary for binary in args if os.path.exists(binary)]
+    if not binaries:
+        sys.stderr.write(__doc__)
+        return 1
+    results = [benchmark(os.path.abspath(binary), runs)
+               for binary in binaries]
+    print_results(results)
+    if json_file:
+        with open(json_file, 'w') as file:
+            json.dump(results, file, indent=1)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,565 @@
+#!/usr/bin/env python3
+"""
+    Benchmark suite comparing pyrun binaries with upstream CPython.
+
+    Usage: suite.py [-n runs] [-p python] [-s section,...] [-c jsonfile]
+                    [-j jsonfile] <binary> [<binary> ...]
+
+    Runs the following sections for each binary and for the reference
+    CPython given with -p, which should be the same Python version as
+    the pyrun binaries:
+
+    startup: wall clock time of "-c pass" with warm OS caches, also
+             with -S and -I, and with cold caches: before each cold
+             run, the binary and the files it uses (loaded modules,
+             shared libraries) are evicted from the page cache using
+             posix_fadvise() (Linux). Pages mapped by running processes
+             stay in the cache, so for the Python running this script,
+             the cold times are only an estimate.
+
+    app:     time of running an app with a package of 20 modules; for
+             pyrun, the package is appended as ZIP payload to a copy of
+             the binary (with and without a pyrun_appimport index), for
+             CPython, the ZIP file is run as zipapp.
+
+    imports: import latency of heavy stdlib packages in a fresh process
+             (see imports.py).
+
+    cpu:     small CPU bound pyperformance style kernels (see
+             cpu_tasks.py), to check that the frozen, static and
+             patched runtime doesn't slow down steady-state code.
+
+    All sections are run by default; use -s to select some of them.
+    The medians of n runs are reported together with the ratio to the
+    reference CPython; lower is better. The JSON file written with -j
+    also includes the Python version, platform and date, for tracking
+    the results across releases. Use -c to compare with the JSON file
+    of a previous run.
+
+    Binaries which don't exist are skipped.
+
+"""
+import sys
+import os
+import time
+import json
+import platform
+import shutil
+import subprocess
+import tempfile
+import zipfile
+
+import startup
+import imports
+
+### Globals
+
+# Number of runs per measurement
+RUNS = 10
+
+# Number of cold startup runs; these are slow, since the files have to
+# be read again
+COLD_RUNS = 5
+
+# Number of runs per CPU task
+CPU_LOOPS = 5
+
+# Sections
+SECTIONS = ('startup', 'app', 'imports', 'cpu')
+
+# Startup variants: (name, command line options)
+STARTUP_VARIANTS = (
+    ('pass', ()),
+    ('-S', ('-S',)),
+    ('-I', ('-I',)),
+    )
+
+# Heavy stdlib packages to import
+IMPORT_MODULES = (
+    'json',
+    'argparse',
+    'typing',
+    'decimal',
+    'logging.handlers',
+    'email.parser',
+    'http.client',
+    'http.server',
+    'urllib.request',
+    'xml.etree.ElementTree',
+    'ssl',
+    'sqlite3',
+    'unittest',
+    'multiprocessing.pool',
+    'asyncio',
+    )
+
+# CPU tasks script
+CPU_TASKS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'cpu_tasks.py')
+
+# Code printing the Python version and the pyrun version ("-" for
+# CPython)
+INFO_PROBE = '''\
+import sys
+print(sys.version.split()[0])
+try:
+    import pyrun_config
+except ImportError:
+    print('-')
+else:
+    print(pyrun_config.pyrun_version)
+'''
+
+# Code printing the files used by a "-c pass" process
+FILES_PROBE = '''\
+import sys
+files = set()
+for module in list(sys.modules.values()):
+    for name in ('__file__', '__cached__'):
+        path = getattr(module, name, None)
+        if isinstance(path, str):
+            files.add(path)
+try:
+    with open('/proc/self/maps') as maps:
+        for line in maps:
+            fields = line.split()
+            if len(fields) >= 6 and fields[5].startswith('/'):
+                files.add(fields[5])
+except OSError:
+    pass
+for path in sorted(files):
+    print(path)
+'''
+
+# Number of modules in the app package
+APP_MODULES = 20
+
+# App main module and package
+APP_MAIN = '''\
+import app
+app.main()
+'''
+
+APP_INIT = '''\
+from . import %(modules)s
+
+def main():
+    for module in (%(modules)s):
+        module.run()
+'''
+
+APP_MODULE = '''\
+""" App module %(index)i """
+import os, collections
+
+DEFAULTS = {
+    'name': 'module%(index)i',
+    'values': [%(index)i, %(index)i * 2, %(index)i * 3],
+    'enabled': True,
+    }
+
+Entry = collections.namedtuple('Entry', 'name value')
+
+class Handler%(index)i(object):
+
+    """ Handler class %(index)i """
+
+    def __init__(self, **options):
+        self.options = dict(DEFAULTS, **options)
+        self.entries = []
+
+    def add(self, name, value):
+        self.entries.append(Entry(name, value))
+        return len(self.entries)
+
+    def total(self):
+        return sum(entry.value for entry in self.entries)
+
+    def describe(self):
+        return '%%s: %%i entries' %% (self.options['name'], len(self.entries))
+
+def helper(path):
+    return os.path.join(os.path.dirname(path), DEFAULTS['name'])
+
+def run():
+    handler = Handler%(index)i()
+    handler.add('a', 1)
+    return handler.total()
+'''
+
+### Helpers
+
+def binary_info(binary):
+
+    """ Return (Python version, pyrun version) for binary; the pyrun
+        version is None for CPython.
+
+    """
+    output = subprocess.check_output([binary, '-c', INFO_PROBE])
+    version, pyrun_version = output.decode('ascii').split()[-2:]
+    if pyrun_version == '-':
+        pyrun_version = None
+    return version, pyrun_version
+
+def used_files(binary):
+
+    """ Return the list of files used by a "-c pass" process of binary.
+
+    """
+    output = subprocess.check_output([binary, '-c', FILES_PROBE])
+    files = set(output.decode('utf-8', 'surrogateescape').splitlines())
+    files.add(os.path.realpath(binary))
+    return sorted(path for path in files if os.path.isfile(path))
+
+def evict(files):
+
+    """ Evict the files from the page cache.
+
+    """
+    for path in files:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+def timings(measurements):
+
+    """ Return the result dictionary for the list of run_command()
+        results measurements.
+
+    """
+    durations = [m[0] for m in measurements]
+    return {
+        'best_ms': min(durations) * 1e3,
+        'median_ms': startup.median(durations) * 1e3,
+        'maxrss_kb': max(m[1] for m in measurements),
+        'minflt': startup.median([m[2] for m in measurements]),
+        'majflt': startup.median([m[3] for m in measurements]),
+        }
+
+def bytecode(binary, source, filename):
+
+    """ Return .pyc data for source, compiled by binary.
+
+    """
+    return subprocess.check_output(
+        [binary, '-c',
+         'import sys, marshal, importlib.util; '
+         'sys.stdout.buffer.write(importlib.util.MAGIC_NUMBER + '
+         'bytes(12 if sys.version_info >= (3, 7) else 8) + '
+         'marshal.dumps(compile(sys.stdin.read(), %r, "exec")))' %
+         filename],
+        input=source.encode('utf-8'))
+
+def build_app_zip(binary, zip_file):
+
+    """ Write the app ZIP file zip_file, using .pyc files compiled by
+        binary for the package modules.
+
+    """
+    names = ['mod%02i' % i for i in range(APP_MODULES)]
+    archive = zipfile.ZipFile(zip_file, 'w')
+    try:
+        archive.writestr('__main__.py', APP_MAIN)
+        archive.writestr('app/__init__.pyc', bytecode(
+            binary,
+            APP_INIT % dict(modules=', '.join(names)),
+            'app/__init__.py'))
+        for index, name in enumerate(names):
+            archive.writestr('app/%s.pyc' % name, bytecode(
+                binary,
+                APP_MODULE % dict(index=index),
+                'app/%s.py' % name))
+    finally:
+        archive.close()
+
+def build_app(binary, zip_file, app_file):
+
+    """ Create a pyrun app app_file by appending zip_file to a copy of
+        binary.
+
+    """
+    with open(app_file, 'wb') as app:
+        with open(binary, 'rb') as file:
+            shutil.copyfileobj(file, app)
+        with open(zip_file, 'rb') as file:
+            shutil.copyfileobj(file, app)
+    os.chmod(app_file, 0o755)
+
+def time_command(args, runs):
+
+    """ Run the command args runs times (after a warm up run) and
+        return the result dictionary.
+
+    """
+    startup.run_command(args)
+    return timings([startup.run_command(args) for i in range(runs)])
+
+### Sections
+
+def benchmark_startup(binary, runs):
+
+    result = {'warm': {}, 'cold': None}
+    for name, options in STARTUP_VARIANTS:
+        # Warm up the OS caches
+        startup.run_timed(binary, 'pass', options)
+        result['warm'][name] = timings(
+            [startup.run_timed(binary, 'pass', options)
+             for i in range(runs)])
+    if hasattr(os, 'posix_fadvise'):
+        files = used_files(binary)
+        measurements = []
+        for i in range(COLD_RUNS):
+            evict(files)
+            measurements.append(startup.run_timed(binary, 'pass'))
+        result['cold'] = {'pass': timings(measurements)}
+    return result
+
+def benchmark_app(binary, pyrun, runs):
+
+    workdir = tempfile.mkdtemp(prefix='pyrun-benchmark-app-')
+    try:
+        zip_file = os.path.join(workdir, 'app.zip')
+        build_app_zip(binary, zip_file)
+        if not pyrun:
+            return {'zipapp': time_command([binary, zip_file], runs)}
+        result = {}
+        app_file = os.path.join(workdir, 'app')
+        build_app(binary, zip_file, app_file)
+        try:
+            result['plain'] = time_command([app_file], runs)
+            subprocess.check_call([binary, '-m', 'pyrun_appimport',
+                                   app_file],
+                                  stdout=subprocess.DEVNULL)
+            result['indexed'] = time_command([app_file], runs)
+        except (OSError, RuntimeError,
+                subprocess.CalledProcessError) as reason:
+            sys.stderr.write('app mode failed for %s: %s\n' %
+                             (binary, reason))
+        return result
+    finally:
+        shutil.rmtree(workdir)
+
+def benchmark_imports(binary, runs):
+
+    result = {}
+    for module in IMPORT_MODULES:
+        try:
+            # Warm up the OS caches
+            imports.time_import(binary, module)
+        except subprocess.CalledProcessError:
+            # Module not available
+            result[module] = None
+            continue
+        durations = [imports.time_import(binary, module)
+                     for i in range(runs)]
+        result[module] = {
+            'best_ms': min(durations) * 1e3,
+            'median_ms': startup.median(durations) * 1e3,
+            }
+    return result
+
+def benchmark_cpu(binary, loops):
+
+    output = subprocess.check_output([binary, CPU_TASKS, '-n', str(loops)])
+    tasks = json.loads(output.decode('ascii').splitlines()[-1])
+    result = {}
+    for name, durations in tasks.items():
+        result[name] = {
+            'best_ms': min(durations) * 1e3,
+            'median_ms': startup.median(durations) * 1e3,
+            }
+    return result
+
+def benchmark(binary, runs=RUNS, sections=SECTIONS, reference=False):
+
+    """ Benchmark binary and return a dictionary with the results.
+
+    """
+    version, pyrun_version = binary_info(binary)
+    pyrun = pyrun_version is not None
+    result = {
+        'binary': binary,
+        'name': os.path.basename(binary),
+        'python': version,
+        'pyrun': pyrun_version,
+        'reference': reference,
+        'size': os.path.getsize(binary),
+        }
+    if 'startup' in sections:
+        result['startup'] = benchmark_startup(binary, runs)
+    if 'app' in sections:
+        result['app'] = benchmark_app(binary, pyrun, runs)
+    if 'imports' in sections:
+        result['imports'] = benchmark_imports(binary, runs)
+    if 'cpu' in sections:
+        result['cpu'] = benchmark_cpu(binary, CPU_LOOPS)
+    return result
+
+### Reporting
+
+def metrics(result):
+
+    """ Return a list of (metric name, median time in ms) tuples for
+        result; the time is None for metrics not available.
+
+        App mode metrics of pyrun binaries and of CPython are reported
+        under the same names, so that they can be compared.
+
+    """
+    values = []
+    def add(name, entry):
+        values.append((name, entry['median_ms'] if entry else None))
+    if 'startup' in result:
+        for name, options in STARTUP_VARIANTS:
+            add('startup %s' % name, result['startup']['warm'].get(name))
+        cold = result['startup']['cold'] or {}
+        add('startup pass (cold)', cold.get('pass'))
+    if 'app' in result:
+        app = result['app']
+        add('app', app.get('plain') or app.get('zipapp'))
+        add('app (indexed)', app.get('indexed') or app.get('zipapp'))
+    for name in sorted(result.get('imports', ())):
+        add('import %s' % name, result['imports'][name])
+    for name in sorted(result.get('cpu', ())):
+        add('cpu %s' % name, result['cpu'][name])
+    return values
+
+def format_value(value, reference):
+
+    if value is None:
+        return '%20s' % '-'
+    if not reference:
+        return '%20.2f' % value
+    return '%12.2f (%4.2fx)' % (value, value / reference)
+
+def print_results(results):
+
+    reference = None
+    for result in results:
+        if result['reference']:
+            reference = dict(metrics(result))
+    names = [name for name, value in metrics(results[0])]
+    print('%-30s' % '[ms]' +
+          ''.join(' %20s' % result['name'][:20] for result in results))
+    print('-' * (30 + 21 * len(results)))
+    print('%-30s' % 'size [kB]' +
+          ''.join(' %20i' % (result['size'] // 1024) for result in results))
+    for name in names:
+        line = '%-30s' % name
+        for result in results:
+            value = dict(metrics(result)).get(name)
+            if reference is None or result['reference']:
+                line += ' ' + format_value(value, None)
+            else:
+                line += ' ' + format_value(value, reference.get(name))
+        print(line)
+    print('')
+    if reference is None:
+        print('Times are medians.')
+    else:
+        print('Times are medians; ratios are relative to the reference '
+              'CPython (lower is')
+        print('better).')
+
+def version(result):
+
+    if result['pyrun']:
+        return 'pyrun %s, Python %s' % (result['pyrun'], result['python'])
+    return 'Python %s' % result['python']
+
+def print_comparison(results, previous):
+
+    """ Print the changes of the results compared to the previous
+        results, matching the binaries by name.
+
+    """
+    print('')
+    print('Changes compared to the previous results (%s):' %
+          previous['date'])
+    previous = dict((result['name'], result)
+                    for result in previous['results'])
+    for result in results:
+        old = previous.get(result['name'])
+        if old is None:
+            continue
+        print('')
+        print('%s (%s, was %s)' % (result['name'], version(result),
+                                   version(old)))
+        print('  %-28s %10s %10s %9s' % ('[ms]', 'previous', 'current',
+                                           'change'))
+        old_metrics = dict(metrics(old))
+        for name, value in metrics(result):
+            old_value = old_metrics.get(name)
+            if value is None or not old_value:
+                continue
+            print('  %-28s %10.2f %10.2f %+8.1f%%' % (
+                name, old_value, value, (value / old_value - 1) * 100))
+
+###
+
+def main(argv):
+
+    runs = RUNS
+    python = None
+    sections = SECTIONS
+    compare_file = None
+    json_file = None
+    args = argv[1:]
+    while args and args[0].startswith('-'):
+        option = args.pop(0)
+        if option == '-n':
+            runs = int(args.pop(0))
+        elif option == '-p':
+            python = args.pop(0)
+        elif option == '-s':
+            sections = tuple(args.pop(0).split(','))
+        elif option == '-c':
+            compare_file = args.pop(0)
+        elif option == '-j':
+            json_file = args.pop(0)
+        else:
+            sys.stderr.write(__doc__)
+            return 1
+    binaries = [binary for binary in args if os.path.exists(binary)]
+    if not binaries or set(sections) - set(SECTIONS):
+        sys.stderr.write(__doc__)
+        return 1
+    results = [benchmark(os.path.abspath(binary), runs, sections)
+               for binary in binaries]
+    if python:
+        if os.sep not in python:
+            python = shutil.which(python) or python
+        reference = benchmark(os.path.abspath(python), runs, sections,
+                              reference=True)
+        for result in results:
+            if (result['python'].split('.')[:2] !=
+                reference['python'].split('.')[:2]):
+                sys.stderr.write(
+                    'Warning: %s uses Python %s, the reference Python %s\n'
+                    % (result['name'], result['python'],
+                       reference['python']))
+        results.append(reference)
+    print_results(results)
+    data = {
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'runs': runs,
+        'results': results,
+        }
+    if compare_file:
+        with open(compare_file) as file:
+            previous = json.load(file)
+        print_comparison(results, previous)
+    if json_file:
+        with open(json_file, 'w') as file:
+            json.dump(data, file, indent=1)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -1,8 +1,10 @@
 # Shared module stub for {so_file}
 #
 # This Python module will replaces the shared module file inside ZIP app
-# packages and redirects the import to the file living next to the pyrun
-# binary.
+# packages. If the ZIP package contains the shared module file (next to
+# this stub), it gets loaded directly from the package using
+# pyrun_appimport (via memfd_create() or an extraction cache), otherwise
+# the import is redirected to the file living next to the pyrun binary.
 #
 # After import, the shared module replaces this module, so there should
 # be no compatibility problems (so he says ;-)).
@@ -16,15 +18,25 @@
 def _load_shared_mod(absmodname, so_file):
     import sys
     import os
-    from importlib import machinery, util
     absmodname = __name__
-    so_dir = os.path.split(sys.executable)[0]
-    so_path = os.path.join(so_dir, so_file)
-    loader = machinery.ExtensionFileLoader(absmodname, so_path)
-    spec = util.spec_from_loader(absmodname, loader)
-    module = loader.create_module(spec)
-    loader.exec_module(module)
-    sys.modules[absmodname] = module
+    module = None
+    so_path = os.path.join(os.path.dirname(__file__), so_file)
+    try:
+        import pyrun_appimport
+        so_data = __loader__.get_data(so_path)
+        module = pyrun_appimport.load_extension(absmodname, so_data, so_path)
+    except (ImportError, OSError):
+        # Not in the package or the extraction cache is not usable
+        module = None
+    if module is None:
+        from importlib import machinery, util
+        so_dir = os.path.split(sys.executable)[0]
+        so_path = os.path.join(so_dir, so_file)
+        loader = machinery.ExtensionFileLoader(absmodname, so_path)
+        spec = util.spec_from_loader(absmodname, loader)
+        module = loader.create_module(spec)
+        loader.exec_module(module)
+        sys.modules[absmodname] = module
     globals().update(module.__dict__)
 _load_shared_mod(__name__, '{so_file}')
 del _load_shared_mod
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+    Create a size report for a pyrun build.
+
+    Usage: bloatreport.py [-s setupfile] [-b builddir] [-x binary]
+                          [-p previous.json] [-o output.json] [-n top]
+                          <frozen-report.json>
+
+    Takes the frozen module report written by freeze.py -R, adds the
+    sizes of the statically linked extension modules listed in the
+    Setup.PyRun-X.Y file setupfile (taken from their object files in the
+    Python build dir builddir) and the size of the pyrun binary, and
+    computes the differences to the report previous.json of an earlier
+    build.
+
+    The combined report is written to output.json (which may be the
+    same file as previous.json). A summary of the top largest packages
+    and extensions and of the largest changes is printed.
+
+"""
+import sys
+import os
+import json
+import subprocess
+
+### Globals
+
+# Version of the report format
+REPORT_VERSION = 1
+
+# Number of entries to show in the summary
+TOP = 20
+
+# Fields to compare for modules and packages
+SIZE_FIELDS = ('size', 'stored_size', 'docstrings', 'linetables')
+
+# Source file extensions in Setup files
+SOURCE_EXTENSIONS = ('.c', '.cc', '.cpp', '.m')
+
+### Helpers
+
+def parse_setup(setupfile):
+
+    """ Return a dictionary mapping the names of the statically linked
+        extension modules in setupfile to lists of their source files.
+
+    """
+    modules = {}
+    static = True
+    with open(setupfile) as file:
+        for line in file:
+            line = line.split('#')[0].strip()
+            if not line or '=' in line.split()[0]:
+                continue
+            if line in ('*static*', '*shared*', '*disabled*'):
+                static = (line == '*static*')
+                continue
+            if not static:
+                continue
+            words = line.split()
+            modules[words[0]] = [
+                word for word in words[1:]
+                if not word.startswith('-') and
+                word.endswith(SOURCE_EXTENSIONS)]
+    return modules
+
+def object_size(filename):
+
+    """ Return the size of the code and data in object file filename, or
+        the file size, if the size tool is not available.
+
+    """
+    try:
+        output = subprocess.check_output(['size', filename],
+                                         stderr=subprocess.DEVNULL)
+        header, values = output.decode('ascii').splitlines()[:2]
+        return int(values.split()[header.split().index('dec')])
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        return os.path.getsize(filename)
+
+def extension_sizes(setupfile, builddir):
+
+    """ Return a dictionary with the sizes of the statically linked
+        extension modules in setupfile.
+
+        The size is None, if the object files are not available.
+
+    """
+    extensions = {}
+    for name, sources in parse_setup(setupfile).items():
+        size = 0
+        for source in sources:
+            objfile = os.path.join(builddir, 'Modules',
+                                   os.path.splitext(source)[0] + '.o')
+            if not os.path.exists(objfile):
+                size = None
+                break
+            size += object_size(objfile)
+        extensions[name] = {
+            'sources': sources,
+            'size': size,
+            }
+    return extensions
+
+def diff_entries(current, previous, fields):
+
+    """ Return a dictionary with the differences of fields for all
+        entries in the dictionaries current and previous.
+
+        Entries only present in one of them are compared to 0.
+
+    """
+    result = {}
+    for name in set(current) | set(previous):
+        entry = current.get(name) or {}
+        old_entry = previous.get(name) or {}
+        diff = {}
+        for field in fields:
+            value = (entry.get(field) or 0) - (old_entry.get(field) or 0)
+            if value:
+                diff[field] = value
+        if diff:
+            result[name] = diff
+    return result
+
+def compute_delta(report, previous):
+
+    """ Return a dictionary with the changes between the reports
+        previous and report.
+
+    """
+    delta = {
+        'totals': diff_entries({'': report['totals']},
+                               {'': previous.get('totals', {})},
+                               SIZE_FIELDS).get('', {}),
+        'packages': diff_entries(report['packages'],
+                                 previous.get('packages', {}),
+                                 SIZE_FIELDS),
+        'extensions': diff_entries(report.get('extensions', {}),
+                                   previous.get('extensions', {}),
+                                   ('size',)),
+        'added_modules': sorted(set(report['modules']) -
+                                set(previous.get('modules', {}))),
+        'removed_modules': sorted(set(previous.get('modules', {})) -
+                                  set(report['modules'])),
+        }
+    binary = report.get('binary')
+    old_binary = previous.get('binary')
+    if binary and old_binary:
+        delta['binary_size'] = binary['size'] - old_binary['size']
+    return delta
+
+def print_summary(report, top=TOP):
+
+    totals = report['totals']
+    print('Frozen modules: %i, marshal data: %i kB, stored: %i kB, '
+          'docstrings: %i kB, line tables: %i kB' % (
+              totals['modules'],
+              totals['size'] // 1024,
+              totals['stored_size'] // 1024,
+              totals['docstrings'] // 1024,
+              totals['linetables'] // 1024))
+    constpool = report.get('constpool')
+    if constpool:
+        print('Constant pool: %i objects, %i kB, saving %i kB and %i '
+              'allocations on import' % (
+                  constpool['objects'],
+                  constpool['pool_size'] // 1024,
+                  constpool['saved_bytes'] // 1024,
+                  constpool['saved_allocations']))
+    if report.get('binary'):
+        print('Binary %s: %i kB' % (report['binary']['file'],
+                                    report['binary']['size'] // 1024))
+    print('')
+    print('%-30s %8s %10s %10s %10s' % (
+        'package', 'modules', 'size [kB]', 'docs [kB]', 'lines [kB]'))
+    print('-' * 72)
+    packages = sorted(report['packages'].items(),
+                      key=lambda item: -item[1]['stored_size'])
+    for name, package in packages[:top]:
+        print('%-30s %8i %10.1f %10.1f %10.1f' % (
+            name, package['modules'],
+            package['stored_size'] / 1024.0,
+            package['docstrings'] / 1024.0,
+            package['linetables'] / 1024.0))
+    extensions = [(name, extension['size'])
+                  for name, extension in report.get('extensions', {}).items()
+                  if extension['size'] is not None]
+    if extensions:
+        print('')
+        print('%-30s %10s' % ('static extension', 'size [kB]'))
+        print('-' * 41)
+        extensions.sort(key=lambda item: -item[1])
+        for name, size in extensions[:top]:
+            print('%-30s %10.1f' % (name, size / 1024.0))
+    delta = report.get('delta')
+    if delta is None:
+        return
+    print('')
+    print('Changes to the previous report:')
+    if 'binary_size' in delta:
+        print('  binary: %+i bytes' % delta['binary_size'])
+    for field, value in sorted(delta['totals'].items()):
+        print('  %s: %+i bytes' % (field, value))
+    changes = sorted(delta['packages'].items(),
+                     key=lambda item: -abs(item[1].get('stored_size', 0)))
+    for name, diff in changes[:top]:
+        if diff.get('stored_size'):
+            print('  package %s: %+i bytes' % (name, diff['stored_size']))
+    for name, diff in sorted(delta['extensions'].items()):
+        print('  extension %s: %+i bytes' % (name, diff['size']))
+    for name in delta['added_modules']:
+        print('  added module %s' % name)
+    for name in delta['removed_modules']:
+        print('  removed module %s' % name)
+
+###
+
+def main(argv):
+
+    setupfile = None
+    builddir = None
+    binary = None
+    previous_file = None
+    output_file = None
+    top = TOP
+    args = argv[1:]
+    while args and args[0].startswith('-'):
+        option = args.pop(0)
+        if option == '-s':
+            setupfile = args.pop(0)
+        elif option == '-b':
+            builddir = args.pop(0)
+        elif option == '-x':
+            binary = args.pop(0)
+        elif option == '-p':
+            previous_file = args.pop(0)
+        elif option == '-o':
+            output_file = args.pop(0)
+        elif option == '-n':
+            top = int(args.pop(0))
+        else:
+            sys.stderr.write(__doc__)
+            return 1
+    if len(args) != 1:
+        sys.stderr.write(__doc__)
+        return 1
+    with open(args[0]) as file:
+        report = json.load(file)
+    report['version'] = REPORT_VERSION
+    if setupfile:
+        report['extensions'] = extension_sizes(setupfile,
+                                               builddir or os.getcwd())
+    if binary and os.path.exists(binary):
+        report['binary'] = {
+            'file': os.path.basename(binary),
+            'size': os.path.getsize(binary),
+            }
+    if previous_file and os.path.exists(previous_file):
+        with open(previous_file) as file:
+            report['delta'] = compute_delta(report, json.load(file))
+    print_summary(report, top)
+    if output_file:
+        output_dir = os.path.dirname(output_file)
+        if output_dir and not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+        with open(output_file, 'w') as file:
+            json.dump(report, file, indent=1, sort_keys=True)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
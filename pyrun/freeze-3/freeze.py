@@ -68,6 +68,78 @@ Options:
               Replace prefix with f in the source path references
               contained in the resulting binary.
 
+-z method:    Store the frozen module data in compressed form, using
+              the given compression method (only 'zlib' is supported).
+              The data is decompressed when importing the module.
+              (eGenix PyRun; needs the PyRun import.c patch.)
+
+-g srcdir:    Also write statically initialized ("deepfrozen") code
+              objects for all frozen modules, using the deepfreeze tool
+              from the Python source distribution in srcdir. Imports of
+              these modules don't have to unmarshal the code.
+              (eGenix PyRun; needs the PyRun import.c patch.)
+
+-b:           Write the frozen module data of all modules into a single
+              binary blob file, which is included into the binary using
+              the assembler's .incbin directive, instead of writing one
+              C array per module. This speeds up compiling considerably.
+              (eGenix PyRun; needs gcc or clang.)
+
+-C dir:       Cache the code objects compiled by the module dependency
+              scan in dir, keyed by source file hash, so that repeated
+              runs only have to compile changed modules. The cache index
+              in dir also lists the modules found by the last run and
+              their imports. (eGenix PyRun)
+
+-j jobs:      Compile the modules for the dependency scan in parallel
+              using jobs worker processes; 0 means one per CPU.
+              (eGenix PyRun)
+
+-R file:      Write a JSON report with the marshal data size, stored
+              size, docstring and line number table bytes of each frozen
+              module and package to file (see pyrun/bloatreport.py).
+              (eGenix PyRun)
+
+-L profile:   Lay out the frozen module data in the order given by the
+              layout profile (module names in first access order, one per
+              line, e.g. an import manifest written by pyrun with
+              PYRUN_IMPORTTRACE set), followed by the remaining modules,
+              instead of alphabetically. This keeps the data needed at
+              startup together. (eGenix PyRun)
+
+-D:           Remove the docstrings from the code objects of the frozen
+              modules, as -OO does, but keep them in the separate frozen
+              module pyrun_docstrings_data, from which they are loaded on
+              demand by help() and inspect (see pyrun_docstrings).
+              (eGenix PyRun)
+
+-T:           Replace the line number tables of the frozen code objects
+              with short stub tables and keep the original tables in the
+              separate frozen module pyrun_linetables_data, from which
+              they are loaded on demand for tracebacks, inspect, warnings
+              and logging (see pyrun_linetables). frame.f_lineno, pdb
+              and sys.settrace() still only see the first line of the
+              frozen functions. Python 3.11+. (eGenix PyRun)
+
+-c:           Precompile the regular expressions compiled at module level
+              by the frozen modules and store them in the separate frozen
+              module pyrun_re_cache_data, from which the re module loads
+              them instead of compiling them again (see pyrun_re_cache).
+              (eGenix PyRun)
+
+-Z:           Replace the code objects of the larger module and class
+              level functions with stubs, which unmarshal the original
+              code object on the first call from the frozen module
+              pyrun_lazycode_data (see pyrun_lazycode). Python 3.11+.
+              (eGenix PyRun)
+
+-K:           Move the strings, names tuples and tables used by several
+              frozen modules into a shared constant pool stored in the
+              frozen module pyrun_constpool_data, which the module data
+              references (see makeconstpool.py). The -R report lists the
+              bytes and allocations saved. (eGenix PyRun; needs the PyRun
+              import.c patch.)
+
 Arguments:
 
 script:       The Python script to be executed by the resulting binary.
@@ -102,6 +174,7 @@ import checkextensions
 import makeconfig
 import makefreeze
 import makemakefile
+import modulecache
 import parsesetup
 import bkfile
 
@@ -122,6 +195,18 @@ def main():
     win = sys.platform[:3] == 'win'
     replace_paths = []                  # settable with -r option
     error_if_any_missing = 0
+    compress = None                     # settable with -z option
+    deepfreeze_dir = None               # settable with -g option
+    blob = 0                            # settable with -b option
+    cache_dir = None                    # settable with -C option
+    jobs = 1                            # settable with -j option
+    report = None                       # settable with -R option
+    layout = None                       # settable with -L option
+    lazy_docstrings = 0                 # settable with -D option
+    lazy_linetables = 0                 # settable with -T option
+    re_cache = 0                        # settable with -c option
+    lazy_code = 0                       # settable with -Z option
+    const_pool = 0                      # settable with -K option
 
     # default the exclude list for each platform
     if win: exclude = exclude + [
@@ -160,7 +245,7 @@ def main():
 
     # Now parse the command line with the extras inserted.
     try:
-        opts, args = getopt.getopt(sys.argv[1:], 'r:a:dEe:hmo:p:P:qs:wX:x:l:')
+        opts, args = getopt.getopt(sys.argv[1:], 'r:R:a:bcC:dDEe:g:hj:KL:mo:p:P:qs:TwX:x:l:z:Z')
     except getopt.error as msg:
         usage('getopt error: ' + str(msg))
 
@@ -203,6 +288,32 @@ def main():
         if o == '-r':
             f,r = a.split("=", 2)
             replace_paths.append( (f,r) )
+        if o == '-z':
+            if a not in makefreeze.COMPRESS_METHODS:
+                usage('-z: unsupported compression method %s' % a)
+            compress = a
+        if o == '-g':
+            deepfreeze_dir = a
+        if o == '-b':
+            blob = 1
+        if o == '-C':
+            cache_dir = a
+        if o == '-j':
+            jobs = int(a) or None
+        if o == '-R':
+            report = a
+        if o == '-L':
+            layout = a
+        if o == '-D':
+            lazy_docstrings = 1
+        if o == '-T':
+            lazy_linetables = 1
+        if o == '-c':
+            re_cache = 1
+        if o == '-Z':
+            lazy_code = 1
+        if o == '-K':
+            const_pool = 1
 
     # modules that are imported by the Python runtime
     implicits = []
@@ -351,13 +462,32 @@ def main():
     # collect all modules of the program
     dir = os.path.dirname(scriptfile)
     path[0] = dir
-    mf = modulefinder.ModuleFinder(path, debug, exclude, replace_paths)
+    if cache_dir or jobs != 1:
+        cache = modulecache.ModuleCache(cache_dir, debug)
+        mf = modulecache.CachingModuleFinder(path, debug, exclude,
+                                             replace_paths, cache=cache)
+    else:
+        cache = None
+        mf = modulefinder.ModuleFinder(path, debug, exclude, replace_paths)
 
     if win and subsystem=='service':
         # If a Windows service, then add the "built-in" module.
         mod = mf.add_module("servicemanager")
         mod.__file__="dummy.pyd" # really built-in to the resulting EXE
 
+    if cache is not None:
+        # Compile the modules imported by the scripts and the ones found
+        # by the last run in parallel
+        names = set(implicits) | set(cache.old_modules)
+        for mod in modules + [scriptfile]:
+            if mod == '-m':
+                continue
+            if mod.endswith('.py'):
+                names.update(modulecache.script_imports(mod))
+            else:
+                names.add(mod.rstrip('.*'))
+        cache.precompile(mf.find_sources(names), jobs)
+
     for mod in implicits:
         mf.import_hook(mod)
     for mod in modules:
@@ -389,6 +519,8 @@ def main():
         mf.report()
         print()
     dict = mf.modules
+    if cache is not None:
+        cache.save(mf)
 
     if error_if_any_missing:
         missing = mf.any_missing()
@@ -397,7 +529,10 @@ def main():
 
     # generate output for frozen modules
     files = makefreeze.makefreeze(base, dict, debug, custom_entry_point,
-                                  fail_import)
+                                  fail_import, compress, deepfreeze_dir,
+                                  blob, report, layout,
+                                  lazy_docstrings, lazy_linetables,
+                                  re_cache, lazy_code, const_pool)
 
     # look for unfrozen modules (builtin and of unknown origin)
     builtins = []
@@ -478,7 +613,8 @@ def main():
             ['$(MODLIBS)', '$(LIBS)', '$(SYSLIBS)']
 
     with bkfile.open(makefile, 'w') as outfp:
-        makemakefile.makemakefile(outfp, somevars, files, base_target)
+        makemakefile.makemakefile(outfp, somevars, files, base_target,
+                                  os.path.basename(makefile))
 
     # Done!
 
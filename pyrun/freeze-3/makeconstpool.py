@@ -0,0 +1,245 @@
+# Share constants and strings across the frozen modules (eGenix PyRun).
+#
+# The marshal data of each frozen module is an independent stream, so the
+# same identifiers, names tuples, qualified names and small line and
+# exception tables are stored again for every module using them, and
+# unmarshalling a module allocates its own copies of them.
+#
+# makeconstpool() collects the objects used by several frozen modules
+# into one constant pool, which is stored as marshal data of a list in the
+# frozen module pyrun_constpool_data, after the marshal data of an empty
+# module. The code objects of the modules are rewritten to use the pool
+# objects, so that marshal writes references to them instead of the
+# objects themselves: the module data is the marshal data of the list
+# pool + [code], without the part written for the pool. Such data is
+# marked with the magic "PYRP".
+#
+# The PyRun import.c patch loads the pool once and passes its object
+# references to marshal as initial reference table when unmarshalling
+# module data marked with the magic. Only supported for the Python
+# versions the patch is available for.
+
+import marshal
+import modulefinder
+import struct
+import sys
+import types
+
+# Python versions supported by the PyRun import.c patch
+CONSTPOOL_VERSIONS = ((3, 12),)
+
+# Name of the frozen module holding the pool
+DATA_MODULE = 'pyrun_constpool_data'
+
+# Code object of DATA_MODULE and its marshal data, which the pool is
+# appended to
+DATA_CODE = compile('', '<pyrun>/%s.py' % DATA_MODULE, 'exec')
+DATA_HEADER = marshal.dumps(DATA_CODE)
+
+# Header of module data using the pool (see the PyRun import.c patch)
+POOL_MAGIC = b'PYRP'
+
+# Size of a marshal object reference (TYPE_REF + 4-byte index); only
+# objects with larger marshal data are worth pooling
+REF_SIZE = 5
+
+# Minimum number of modules which have to use an object for it to be
+# added to the pool
+MIN_MODULES = 2
+
+# Size of the marshal list header (TYPE_LIST + 4-byte length)
+LIST_HEADER_SIZE = 5
+
+def pool_key(obj):
+    """ Return the pool key for obj, or None, if obj cannot be pooled.
+
+        Pooled are str and bytes objects and tuples of str objects (e.g.
+        names tuples). The type is part of the key, since e.g. 1 == 1.0,
+        and only exact types are used, since marshal doesn't store
+        subclasses.
+
+    """
+    t = type(obj)
+    if t is str or t is bytes:
+        return (t.__name__, obj)
+    if t is tuple and obj and all(type(item) is str for item in obj):
+        return ('tuple', obj)
+    return None
+
+def code_objects(code):
+    """ Yield the pool candidates referenced by code and its nested code
+        objects.
+
+    """
+    yield code.co_names
+    yield code.co_name
+    yield code.co_qualname
+    yield code.co_linetable
+    yield code.co_exceptiontable
+    for name in code.co_varnames + code.co_cellvars + code.co_freevars:
+        yield name
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            yield from code_objects(const)
+        else:
+            yield const
+            if type(const) is tuple:
+                yield from const
+
+def canonical(obj, pool):
+    """ Return the pool object for obj, or obj itself, if it is not
+        pooled.
+
+    """
+    key = pool_key(obj)
+    if key is None:
+        return obj
+    return pool.get(key, obj)
+
+def pooled_code(code, pool):
+    """ Return a copy of code using the objects in the pool dictionary
+        (mapping pool keys to objects), where possible.
+
+        Names in co_varnames, etc. are interned strings and thus already
+        identical to the pool objects.
+
+    """
+    consts = []
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            const = pooled_code(const, pool)
+        elif type(const) is tuple and pool_key(const) is None:
+            const = tuple(canonical(item, pool) for item in const)
+        else:
+            const = canonical(const, pool)
+        consts.append(const)
+    names = code.co_names
+    if pool_key(names) in pool:
+        names = pool[pool_key(names)]
+    else:
+        names = tuple(canonical(name, pool) for name in names)
+    return code.replace(
+        co_consts=tuple(consts),
+        co_names=names,
+        co_name=canonical(code.co_name, pool),
+        co_qualname=canonical(code.co_qualname, pool),
+        co_linetable=canonical(code.co_linetable, pool),
+        co_exceptiontable=canonical(code.co_exceptiontable, pool))
+
+def build_pool(codes):
+    """ Return the pool dictionary for the list of module code objects
+        codes, mapping pool keys to the pool objects.
+
+    """
+    counts = {}
+    for code in codes:
+        keys = set()
+        for obj in code_objects(code):
+            key = pool_key(obj)
+            if key is not None:
+                keys.add(key)
+        for key in keys:
+            counts[key] = counts.get(key, 0) + 1
+    pool = {}
+    for key, count in counts.items():
+        if count < MIN_MODULES:
+            continue
+        size = len(marshal.dumps(key[1]))
+        # The pool stores the object once, each module a reference
+        if size <= REF_SIZE or count * (size - REF_SIZE) <= size:
+            continue
+        kind, value = key
+        if kind == 'str':
+            # Use the interned object, since names (and thus the
+            # strings used by the modules) are interned
+            value = sys.intern(value)
+        pool[key] = value
+    # Tuples have to reference the pooled strings
+    for key, value in pool.items():
+        if key[0] == 'tuple':
+            pool[key] = tuple(canonical(item, pool) for item in value)
+    return pool
+
+def pooled_data(code, pool_list, pool_data):
+    """ Return the module data for code using the pool, or None, if the
+        marshal data written for the pool differs from pool_data.
+
+    """
+    objects = pool_list + [code]
+    data = marshal.dumps(objects)
+    prefix = len(pool_data)
+    # Only the list lengths in the headers differ
+    if (data[:1] != pool_data[:1] or
+        data[LIST_HEADER_SIZE:prefix] != pool_data[LIST_HEADER_SIZE:]):
+        return None
+    return POOL_MAGIC + data[prefix:]
+
+def unpooled(data, pool_data):
+    """ Return the object stored in the module data data using the pool
+        with the marshal data pool_data.
+
+        This does the same as the PyRun import.c patch, by unmarshalling
+        the pool together with the module data. It is used for checking
+        the module data.
+
+    """
+    assert data.startswith(POOL_MAGIC)
+    length = struct.unpack('<i', pool_data[1:LIST_HEADER_SIZE])[0]
+    return marshal.loads(pool_data[:1] +
+                         struct.pack('<i', length + 1) +
+                         pool_data[LIST_HEADER_SIZE:] +
+                         data[len(POOL_MAGIC):])[-1]
+
+def makeconstpool(dict, exclude=()):
+    """ Rewrite the modules in the modulefinder dictionary dict to use
+        a shared constant pool and add the DATA_MODULE holding the pool
+        to dict.
+
+        The module data is stored in the __pooled__ attribute of the
+        modules, which makefreeze uses instead of the marshal data of
+        __code__. Modules listed in exclude and modules with a
+        __trailer__ are left alone.
+
+        Returns a dictionary with statistics for the report: the number
+        of pool objects, the pool size and per module the marshal data
+        size without and with the pool and the number of pool objects
+        used.
+
+    """
+    mods = [mod
+            for mod in sorted(dict)
+            if (dict[mod].__code__ and
+                mod not in exclude and
+                not getattr(dict[mod], '__trailer__', None))]
+    pool = build_pool([dict[mod].__code__ for mod in mods])
+    pool_list = [pool[key] for key in sorted(pool)]
+    pool_data = marshal.dumps(pool_list)
+    pool_ids = set(map(id, pool_list))
+    stats = {
+        'objects': len(pool_list),
+        'pool_size': len(DATA_HEADER) + len(pool_data),
+        'modules': {},
+        }
+    for mod in mods:
+        m = dict[mod]
+        size = len(marshal.dumps(m.__code__))
+        code = pooled_code(m.__code__, pool)
+        data = pooled_data(code, pool_list, pool_data)
+        if data is None:
+            continue
+        assert unpooled(data, pool_data) == code, mod
+        m.__code__ = code
+        m.__pooled__ = data
+        used = set(id(obj)
+                   for obj in code_objects(code)
+                   if id(obj) in pool_ids)
+        stats['modules'][mod] = {
+            'size': size,
+            'pooled_size': len(data),
+            'pool_objects': len(used),
+            }
+    m = modulefinder.Module(DATA_MODULE)
+    m.__code__ = DATA_CODE
+    m.__trailer__ = pool_data
+    dict[DATA_MODULE] = m
+    return stats
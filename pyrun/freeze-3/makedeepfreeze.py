@@ -0,0 +1,158 @@
+# Write a C file containing statically initialized ("deepfrozen") code
+# objects for the frozen modules (eGenix PyRun).
+#
+# This uses the deepfreeze tool from the Python source distribution
+# (Tools/build/deepfreeze.py), which CPython itself uses for its small set
+# of frozen bootstrap modules. Importing a deepfrozen module doesn't
+# need to unmarshal the module's code.
+#
+# The marshal data of the modules is still written by makefreeze and
+# used as fallback, e.g. for sub-interpreters or in case a module uses
+# constants which deepfreeze doesn't support.
+#
+# The code objects of a module are initialized when the module is first
+# imported. _PyRun_Deepfreeze_Fini() finalizes the initialized ones
+# again; the PyRun Python 3.12 patch calls it from Py_FinalizeEx()
+# through the _PyRun_Deepfreeze_Fini_Hook pointer, next to CPython's own
+# _Py_Deepfreeze_Fini().
+
+import io
+import os
+import sys
+import types
+import bkfile
+
+# Deepfreeze is supported by the PyRun import.c patch for these Python
+# versions
+DEEPFREEZE_VERSIONS = ((3, 12),)
+
+# Name of the generated C file
+DEEPFREEZE_C = 'deepfreeze.c'
+
+# Constant types supported by deepfreeze
+SUPPORTED_CONSTANTS = (
+    types.CodeType,
+    tuple,
+    frozenset,
+    str,
+    bytes,
+    int,
+    float,
+    complex,
+    bool,
+    type(None),
+    type(Ellipsis),
+    )
+
+# Version numbers to use for the code objects; these must not clash with
+# the ones used by the Python runtime, which start at the number of code
+# objects deepfrozen by CPython itself
+FIRST_CODE_VERSION = 1 << 30
+
+def load_deepfreeze(python_source_dir):
+    """ Import and return the deepfreeze module from the Python source
+        distribution in python_source_dir.
+
+    """
+    tools_dir = os.path.join(python_source_dir, 'Tools', 'build')
+    if not os.path.exists(os.path.join(tools_dir, 'deepfreeze.py')):
+        raise ValueError('deepfreeze.py not found in %s' % tools_dir)
+    sys.path.insert(0, tools_dir)
+    try:
+        import deepfreeze
+    finally:
+        del sys.path[0]
+    deepfreeze.next_code_version = FIRST_CODE_VERSION
+    return deepfreeze
+
+def unsupported_constant(code):
+    """ Return the first constant in code (or its nested code objects)
+        which deepfreeze cannot handle, or None.
+
+    """
+    for const in code.co_consts:
+        if isinstance(const, (tuple, frozenset)):
+            for item in const:
+                if not isinstance(item, SUPPORTED_CONSTANTS):
+                    return item
+        elif isinstance(const, types.CodeType):
+            item = unsupported_constant(const)
+            if item is not None:
+                return item
+        elif not isinstance(const, SUPPORTED_CONSTANTS):
+            return const
+    return None
+
+def makedeepfreeze(base, modules, python_source_dir, debug=0):
+    """ Write the deepfrozen code objects for modules to
+        base + DEEPFREEZE_C.
+
+        modules has to be a list of (module name, mangled name, code
+        object) tuples.
+
+        Returns the set of mangled names of the modules which were
+        deepfrozen. For these, a function _PyRun_get_<mangled>()
+        returning the code object is available.
+
+    """
+    deepfreeze = load_deepfreeze(python_source_dir)
+    output = io.StringIO()
+    output.write('/* Deepfrozen code objects generated by PyRun makefreeze */\n')
+    output.write('#define Py_BUILD_CORE 1\n')
+    printer = deepfreeze.Printer(output)
+    printer.write('')
+    printer.write('/* Defined in the PyRun import.c patch */')
+    printer.write('extern void (*_PyRun_Deepfreeze_Fini_Hook)(void);')
+    printer.write('static void _PyRun_Deepfreeze_Fini(void);')
+    done = set()
+    # List of (mangled name, finis) tuples
+    finalizers = []
+    for mod, mangled, code in modules:
+        const = unsupported_constant(code)
+        if const is not None:
+            if debug:
+                print('not deepfreezing %s: unsupported constant %r' %
+                      (mod, const))
+            continue
+        if debug:
+            print('deepfreezing', mod, '...')
+        first_init = len(printer.inits)
+        first_fini = len(printer.finis)
+        code_ref = printer.generate('%s_toplevel' % mangled, code)
+        inits = printer.inits[first_init:]
+        finis = printer.finis[first_fini:]
+        printer.write('')
+        printer.write('static int _PyRun_initialized_%s = 0;' % mangled)
+        printer.write('')
+        printer.write('PyObject *')
+        printer.write('_PyRun_get_%s(void)' % mangled)
+        printer.write('{')
+        printer.write('    if (!_PyRun_initialized_%s) {' % mangled)
+        for init in inits:
+            printer.write('        if (%s < 0) {' % init)
+            printer.write('            return NULL;')
+            printer.write('        }')
+        printer.write('        _PyRun_initialized_%s = 1;' % mangled)
+        printer.write('        _PyRun_Deepfreeze_Fini_Hook = _PyRun_Deepfreeze_Fini;')
+        printer.write('    }')
+        printer.write('    return Py_NewRef((PyObject *) %s);' % code_ref)
+        printer.write('}')
+        finalizers.append((mangled, finis))
+        done.add(mangled)
+    # Finalize the code objects of the modules which were initialized;
+    # resetting the flags allows initializing them again after
+    # Py_Finalize() + Py_Initialize()
+    printer.write('')
+    printer.write('static void')
+    printer.write('_PyRun_Deepfreeze_Fini(void)')
+    printer.write('{')
+    for mangled, finis in finalizers:
+        printer.write('    if (_PyRun_initialized_%s) {' % mangled)
+        for fini in finis:
+            printer.write('        %s' % fini)
+        printer.write('        _PyRun_initialized_%s = 0;' % mangled)
+        printer.write('    }')
+    printer.write('}')
+    with bkfile.open(base + DEEPFREEZE_C, 'w') as outfp:
+        outfp.write(output.getvalue())
+    return done
@@ -0,0 +1,142 @@
+# Move the docstrings of frozen modules into a side table (eGenix PyRun).
+#
+# Docstrings make up a good part of the marshal data of the stdlib, but
+# are only needed by help(), inspect and other introspection tools.
+# Freezing with -OO removes them completely, which breaks these tools and
+# libraries relying on __doc__.
+#
+# makedocstrings() replaces the docstrings in the code objects of the
+# frozen modules with None, which has the same effect as -OO, and stores
+# them in the frozen module pyrun_docstrings_data instead: one zlib
+# compressed marshal blob per module, mapping the qualified name of the
+# documented module, class or function (plus the first line number for
+# functions, to tell apart redefinitions such as property setters) to
+# its docstring. The pyrun_docstrings module looks them up on demand.
+
+import dis
+import inspect
+import marshal
+import modulefinder
+import types
+import zlib
+
+# Lazy docstrings need code.replace()
+DOCSTRINGS_MINVERSION = (3, 8)
+
+# Name of the frozen module holding the docstring tables
+DATA_MODULE = 'pyrun_docstrings_data'
+
+def is_function(code):
+    return bool(code.co_flags & inspect.CO_NEWLOCALS)
+
+def const_references(code, index):
+    """ Return the number of instructions in code referencing the
+        constant code.co_consts[index].
+
+    """
+    return sum(1
+               for instruction in dis.get_instructions(code)
+               if instruction.opcode in dis.hasconst and
+               instruction.arg == index)
+
+def docstring_index(code):
+    """ Return the index of the docstring in code.co_consts, or None, if
+        code doesn't have a docstring which can be removed safely.
+
+        Functions store their docstring as first constant. Modules and
+        classes assign it to __doc__. Constants which are also used by
+        the code for other purposes are left alone.
+
+    """
+    consts = code.co_consts
+    if is_function(code):
+        # Lambdas and comprehensions don't have docstrings
+        if code.co_name.startswith('<'):
+            return None
+        if (consts and isinstance(consts[0], str) and
+            not const_references(code, 0)):
+            return 0
+        return None
+    if '__doc__' not in code.co_names:
+        return None
+    previous = None
+    for instruction in dis.get_instructions(code):
+        if (instruction.opname == 'STORE_NAME' and
+            instruction.argval == '__doc__'):
+            if (previous is not None and
+                previous.opname == 'LOAD_CONST' and
+                isinstance(previous.argval, str) and
+                const_references(code, previous.arg) == 1):
+                return previous.arg
+            return None
+        previous = instruction
+    return None
+
+def docstring_key(code, qualname):
+    """ Return the docstring table key for code with the qualified name
+        qualname.
+
+        Has to match pyrun_docstrings.docstring_key().
+
+    """
+    if is_function(code):
+        return '%s:%i' % (qualname, code.co_firstlineno)
+    return qualname
+
+def strip_code(code, qualname, table):
+    """ Return a copy of code and its nested code objects without
+        docstrings and add these to table.
+
+        qualname is the qualified name of the object defined by code,
+        '' for modules.
+
+    """
+    if is_function(code):
+        prefix = qualname + '.<locals>.'
+    elif qualname:
+        prefix = qualname + '.'
+    else:
+        prefix = ''
+    consts = list(code.co_consts)
+    for i, const in enumerate(consts):
+        if isinstance(const, types.CodeType):
+            # co_qualname is only available in Python 3.11+
+            consts[i] = strip_code(
+                const,
+                getattr(const, 'co_qualname', prefix + const.co_name),
+                table)
+    index = docstring_index(code)
+    if index is not None:
+        table[docstring_key(code, qualname)] = consts[index]
+        consts[index] = None
+    return code.replace(co_consts=tuple(consts))
+
+def makedocstrings(dict):
+    """ Remove the docstrings from the code objects of the modules in the
+        modulefinder dictionary dict and add the DATA_MODULE holding them
+        to dict.
+
+        Returns the number of docstrings moved.
+
+    """
+    docstrings = {}
+    files = {}
+    count = 0
+    for mod in sorted(dict):
+        m = dict[mod]
+        if not m.__code__ or mod == DATA_MODULE:
+            continue
+        table = {}
+        m.__code__ = strip_code(m.__code__, '', table)
+        if not table:
+            continue
+        docstrings[mod] = zlib.compress(marshal.dumps(table), 9)
+        files[m.__code__.co_filename] = mod
+        count += len(table)
+    m = modulefinder.Module(DATA_MODULE)
+    m.__code__ = compile(
+        'DOCSTRINGS = %r\nFILES = %r\n' % (docstrings, files),
+        '<pyrun>/%s.py' % DATA_MODULE,
+        'exec')
+    dict[DATA_MODULE] = m
+    return count
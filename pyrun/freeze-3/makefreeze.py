@@ -1,10 +1,47 @@
 import marshal
 import bkfile
 import sys
+import os
+import glob
+import hashlib
 
 # The frozen array struct changed in 3.11
 PY311GE = (sys.version_info[:2] >= (3, 11))
 
+# Compressed frozen module data is supported by the PyRun import.c patch
+# for these Python versions
+COMPRESS_VERSIONS = ((3, 12),)
+
+# Supported compression methods
+COMPRESS_METHODS = ('zlib',)
+
+# Header of compressed frozen module data: magic + uncompressed size as
+# 4-byte little endian integer (see the PyRun import.c patch)
+COMPRESS_MAGIC = b'PYRZ'
+
+# Modules which are needed before the zlib module can be imported and
+# thus must not be compressed
+COMPRESS_EXCLUDES = (
+    '_frozen_importlib',
+    '_frozen_importlib_external',
+    'importlib._bootstrap',
+    'importlib._bootstrap_external',
+    'zipimport',
+    )
+
+# Modules which are always loaded from the Python runtime's own frozen
+# bootstrap modules and thus don't need to be deepfrozen
+DEEPFREEZE_EXCLUDES = (
+    '_frozen_importlib',
+    '_frozen_importlib_external',
+    'zipimport',
+    )
+
+# Names of the binary blob file holding the frozen module data and of the
+# C file including it in the binary (see makefreeze(..., blob=1))
+BLOB_FILE = 'frozen.bin'
+BLOB_C = 'frozen_blob.c'
+
 # Write a file containing frozen code for the modules in the dictionary.
 
 header = """
@@ -69,33 +106,321 @@ main(int argc, char **argv)
 
 """
 
-def makefreeze(base, dict, debug=0, entry_point=None, fail_import=()):
+# The blob is included using the assembler's .incbin directive, which is
+# much faster than having the C compiler parse huge initializers. The hash
+# makes sure that the C file changes whenever the blob changes, so that
+# make rebuilds the object file.
+#
+# A top level asm statement has to leave the assembler in the section it
+# was in, which need not be .text. For ELF, .pushsection/.popsection
+# restore it. Mach-O only gets the .const section switch and an explicit
+# .text afterwards, which is what clang expects there.
+blob_template = """\
+/* Frozen module data generated by PyRun makefreeze
+
+   Blob: %(blobfile)s
+   SHA-256: %(hash)s
+*/
+
+#if defined(__APPLE__)
+# define PYRUN_BLOB_SECTION ".const"
+# define PYRUN_BLOB_PREVIOUS ".text"
+# define PYRUN_BLOB_SYMBOL "__PyRun_FrozenBlob"
+#else
+# define PYRUN_BLOB_SECTION ".pushsection .rodata"
+# define PYRUN_BLOB_PREVIOUS ".popsection"
+# define PYRUN_BLOB_SYMBOL "_PyRun_FrozenBlob"
+#endif
+
+__asm__(
+    PYRUN_BLOB_SECTION "\\n"
+    ".globl " PYRUN_BLOB_SYMBOL "\\n"
+    ".balign 16\\n"
+    PYRUN_BLOB_SYMBOL ":\\n"
+    ".incbin \\"%(blobfile)s\\"\\n"
+    ".byte 0\\n"
+    PYRUN_BLOB_PREVIOUS "\\n"
+);
+"""
+
+# First line of the per module C files; used for finding out whether the
+# module data changed since the last run
+hash_header = "/* SHA-256: %s */\n"
+
+def uptodate(filename, hash):
+    """ Return true, if the C file filename was written for module data
+        with the given hash.
+
+    """
+    try:
+        with open(filename) as file:
+            return file.readline() == hash_header % hash
+    except OSError:
+        return False
+
+def remove_stale_files(base, files):
+    """ Remove per module C files and their object files from earlier
+        runs, which are not needed anymore, e.g. because a module is no
+        longer frozen.
+
+    """
+    for filename in glob.glob(base + '_Py_M_*.c'):
+        if os.path.basename(filename) in files:
+            continue
+        for stale in (filename, filename[:-2] + '.o'):
+            if os.path.exists(stale):
+                os.unlink(stale)
+
+def read_layout_profile(filename):
+    """ Return a dictionary mapping the module names listed in the
+        layout profile filename to their rank.
+
+        The profile lists module names, one per line, in the order in
+        which they are first accessed, e.g. an import manifest written
+        by pyrun with PYRUN_IMPORTTRACE set. If a module is listed more
+        than once (e.g. because the profile combines several runs), the
+        first occurrence counts.
+
+    """
+    ranks = {}
+    with open(filename) as file:
+        for line in file:
+            mod = line.strip()
+            if mod and not mod.startswith('#') and mod not in ranks:
+                ranks[mod] = len(ranks)
+    return ranks
+
+def layout_order(mods, profile=None):
+    """ Return the module names mods in the order in which their data
+        should be laid out in the binary.
+
+        Without profile, this is alphabetical. Otherwise, the modules
+        listed in the layout profile come first, in profile order, so
+        that the data of modules needed at startup is kept together
+        and touches as few pages as possible.
+
+    """
+    if not profile:
+        return sorted(mods)
+    ranks = read_layout_profile(profile)
+    return sorted(mods,
+                  key=lambda mod: (0, ranks[mod], '') if mod in ranks
+                                  else (1, 0, mod))
+
+def module_data(m):
+    """ Return the frozen module data for the modulefinder Module m.
+
+        This is the marshal data of its code object, followed by the
+        data in its optional __trailer__ attribute, which marshal
+        ignores when loading the module (see makelazycode), or the
+        module data using the constant pool in its __pooled__ attribute
+        (see makeconstpool).
+
+    """
+    pooled = getattr(m, '__pooled__', None)
+    if pooled is not None:
+        return pooled
+    return marshal.dumps(m.__code__) + getattr(m, '__trailer__', b'')
+
+def compress_data(mod, data, compress):
+    """ Return the compressed version of the marshal data for module mod,
+        if compress is given and compressing saves space, or data as is.
+
+    """
+    if not compress or mod in COMPRESS_EXCLUDES:
+        return data
+    import zlib, struct
+    compressed = (COMPRESS_MAGIC +
+                  struct.pack('<I', len(data)) +
+                  zlib.compress(data, 9))
+    if len(compressed) >= len(data):
+        return data
+    return compressed
+
+def makefreeze(base, dict, debug=0, entry_point=None, fail_import=(),
+               compress=None, deepfreeze_dir=None, blob=0, report=None,
+               layout=None, lazy_docstrings=0, lazy_linetables=0,
+               re_cache=0, lazy_code=0, const_pool=0):
     if entry_point is None: entry_point = default_entry_point
+    if lazy_docstrings:
+        import makedocstrings
+        if sys.version_info[:2] < makedocstrings.DOCSTRINGS_MINVERSION:
+            print('lazy docstrings are not supported by this '
+                  'Python version; disabling lazy docstrings')
+        else:
+            if debug:
+                print("moving docstrings to", makedocstrings.DATA_MODULE)
+            count = makedocstrings.makedocstrings(dict)
+            if debug:
+                print("%i docstrings moved" % count)
+    if re_cache:
+        import makerecache
+        if debug:
+            print("precompiling regular expressions into",
+                  makerecache.DATA_MODULE)
+        count = makerecache.makerecache(dict)
+        if debug:
+            print("%i regular expressions precompiled" % count)
+    if lazy_linetables:
+        import makelinetables
+        if sys.version_info[:2] < makelinetables.LINETABLES_MINVERSION:
+            print('lazy line tables are not supported by this '
+                  'Python version; disabling lazy line tables')
+        else:
+            if debug:
+                print("moving line tables to", makelinetables.DATA_MODULE)
+            size = makelinetables.makelinetables(dict)
+            if debug:
+                print("%i bytes of line tables moved" % size)
+    if lazy_code:
+        # This has to run last, since the other passes don't look into
+        # the marshalled function code objects of the stubs
+        import makelazycode
+        if sys.version_info[:2] < makelazycode.LAZYCODE_MINVERSION:
+            print('lazy function code is not supported by this '
+                  'Python version; disabling lazy function code')
+        else:
+            if debug:
+                print("replacing function code objects with stubs")
+            count, size = makelazycode.makelazycode(dict)
+            if debug:
+                print("%i function code objects (%i bytes) replaced" %
+                      (count, size))
+    constpool = None
+    if const_pool:
+        # This has to run after all other passes changing the code
+        # objects
+        import makeconstpool
+        if sys.version_info[:2] not in makeconstpool.CONSTPOOL_VERSIONS:
+            print('shared constant pools are not supported by this '
+                  'Python version; disabling the constant pool')
+        else:
+            if debug:
+                print("moving shared constants to", makeconstpool.DATA_MODULE)
+            constpool = makeconstpool.makeconstpool(dict, COMPRESS_EXCLUDES)
+            if debug:
+                print("%i shared constants (%i bytes) moved" %
+                      (constpool['objects'], constpool['pool_size']))
+    if deepfreeze_dir:
+        import makedeepfreeze
+        if sys.version_info[:2] not in makedeepfreeze.DEEPFREEZE_VERSIONS:
+            print('deepfrozen modules are not supported by this '
+                  'Python version; disabling deepfreeze')
+            deepfreeze_dir = None
+    if compress:
+        if compress not in COMPRESS_METHODS:
+            raise ValueError('unsupported compression method %r' % compress)
+        if sys.version_info[:2] not in COMPRESS_VERSIONS:
+            print('compressed frozen modules are not supported by this '
+                  'Python version; disabling compression')
+            compress = None
     done = []
     files = []
-    mods = sorted(dict.keys())
+    # C expressions referencing the module data, by mangled name
+    refs = {}
+    blobdata = []
+    bloboffset = 0
+    unchanged = 0
+    marshal_sizes = {}
+    # The module data (blob data or C files) is written in layout order;
+    # the table of frozen modules is always sorted by name
+    mods = layout_order(dict.keys(), layout)
     for mod in mods:
         m = dict[mod]
         mangled = "__".join(mod.split("."))
-        if m.__code__:
+        if m.__code__ and blob:
+            if debug:
+                print("freezing", mod, "...")
+            data = module_data(m)
+            marshal_sizes[mod] = len(data)
+            # Module data with trailer is read directly from the binary
+            # and thus cannot be compressed
+            if getattr(m, '__trailer__', None):
+                str = data
+            else:
+                str = compress_data(mod, data, compress)
+            size = len(str)
+            refs[mangled] = '_PyRun_FrozenBlob + %d' % bloboffset
+            blobdata.append(str)
+            bloboffset += size
+            if m.__path__:
+                # Indicate package by negative size
+                size = -size
+            done.append((mod, mangled, size))
+        elif m.__code__:
             file = '_Py_M_' + mangled + '.c'
+            files.append(file)
+            refs[mangled] = '_Py_M_%s' % mangled
+            data = module_data(m)
+            marshal_sizes[mod] = len(data)
+            # Module data with trailer is read directly from the binary
+            # and thus cannot be compressed
+            if getattr(m, '__trailer__', None):
+                str = data
+            else:
+                str = compress_data(mod, data, compress)
+            size = len(str)
+            if m.__path__:
+                # Indicate package by negative size
+                size = -size
+            done.append((mod, mangled, size))
+            # Leave the C files of unchanged modules alone, so that make
+            # only has to recompile the changed ones
+            hash = hashlib.sha256(str).hexdigest()
+            if uptodate(base + file, hash):
+                unchanged += 1
+                continue
+            if debug:
+                print("freezing", mod, "...")
             with bkfile.open(base + file, 'w') as outfp:
-                files.append(file)
-                if debug:
-                    print("freezing", mod, "...")
-                str = marshal.dumps(m.__code__)
-                size = len(str)
-                if m.__path__:
-                    # Indicate package by negative size
-                    size = -size
-                done.append((mod, mangled, size))
+                outfp.write(hash_header % hash)
                 writecode(outfp, mangled, str)
+    if unchanged and debug:
+        print("%i frozen modules unchanged" % unchanged)
+    remove_stale_files(base, files)
+    if blob:
+        if debug:
+            print("writing frozen module data blob")
+        writeblob(base, b''.join(blobdata))
+        files.append(BLOB_C)
+    deepfrozen = set()
+    if deepfreeze_dir:
+        if debug:
+            print("generating deepfrozen code objects")
+        deepfrozen = makedeepfreeze.makedeepfreeze(
+            base,
+            [(mod, mangled, dict[mod].__code__)
+             for mod, mangled, size in done
+             if mod not in DEEPFREEZE_EXCLUDES],
+            deepfreeze_dir,
+            debug)
+        files.append(makedeepfreeze.DEEPFREEZE_C)
+    if report:
+        if debug:
+            print("writing frozen module report", report)
+        import makereport
+        makereport.makereport(
+            report,
+            [(mod, dict[mod].__code__, marshal_sizes[mod], abs(size),
+              size < 0, mangled in deepfrozen)
+             for mod, mangled, size in done],
+            constpool)
     if debug:
         print("generating table of frozen modules")
     with bkfile.open(base + 'frozen.c', 'w') as outfp:
+        if blob:
+            outfp.write('extern const unsigned char _PyRun_FrozenBlob[];\n')
         for mod, mangled, size in done:
-            outfp.write('extern const unsigned char _Py_M_%s[];\n' % mangled)
+            if not blob:
+                outfp.write('extern const unsigned char _Py_M_%s[];\n' % mangled)
+            if mangled in deepfrozen:
+                # Python.h is not yet included, so use the PyObject
+                # struct name
+                outfp.write('extern struct _object *_PyRun_get_%s(void);\n' % mangled)
         outfp.write(header)
+        # The table is written sorted by module name, so that the PyRun
+        # import.c patch can use a binary search for looking up modules.
+        entries = []
         for mod, mangled, size in done:
             if PY311GE:
                 # New 3.11 format for packages
@@ -104,17 +429,27 @@ def makefreeze(base, dict, debug=0, entry_point=None, fail_import=()):
                     is_package = 1
                 else:
                     is_package = 0
-                outfp.write('\t{"%s", _Py_M_%s, %d, %d},\n' % (mod, mangled, size, is_package))
+                if mangled in deepfrozen:
+                    # Deepfrozen code object available
+                    entries.append((mod, '\t{"%s", %s, %d, %d, _PyRun_get_%s},\n' % (mod, refs[mangled], size, is_package, mangled)))
+                else:
+                    entries.append((mod, '\t{"%s", %s, %d, %d},\n' % (mod, refs[mangled], size, is_package)))
             else:
                 # Old format
-                outfp.write('\t{"%s", _Py_M_%s, %d},\n' % (mod, mangled, size))
-        outfp.write('\n')
+                entries.append((mod, '\t{"%s", %s, %d},\n' % (mod, refs[mangled], size)))
         # The following modules have a NULL code pointer, indicating
         # that the frozen program should not search for them on the host
         # system. Importing them will *always* raise an ImportError.
         # The zero value size is never used.
-        for mod in fail_import:
-            outfp.write('\t{"%s", NULL, 0},\n' % (mod,))
+        frozen = set(mod for mod, mangled, size in done)
+        for mod in set(fail_import):
+            if mod not in frozen:
+                entries.append((mod, '\t{"%s", NULL, 0},\n' % (mod,)))
+        # Sort by the UTF-8 encoded names, to get the same order as
+        # strcmp()
+        entries.sort(key=lambda entry: entry[0].encode('utf-8'))
+        for mod, line in entries:
+            outfp.write(line)
         outfp.write(trailer)
         outfp.write(entry_point)
     return files
@@ -133,3 +468,16 @@ def writecode(fp, mod, data):
             print('%d,' % c, file=fp, end='')
         print('', file=fp)
     print('};', file=fp)
+
+# Write the frozen module data of all modules to a single binary blob
+# file and a C file including it as _PyRun_FrozenBlob. The modules'
+# table entries point into the blob.
+
+def writeblob(base, data):
+    with bkfile.open(base + BLOB_FILE, 'wb') as outfp:
+        outfp.write(data)
+    with bkfile.open(base + BLOB_C, 'w') as outfp:
+        outfp.write(blob_template % {
+            'blobfile': os.path.abspath(base + BLOB_FILE),
+            'hash': hashlib.sha256(data).hexdigest(),
+            })
@@ -0,0 +1,288 @@
+# Store the function bodies of frozen modules as lazily unmarshalled
+# stubs (eGenix PyRun).
+#
+# Importing a frozen module unmarshals the code objects of all its
+# functions and methods, even though most of them are never called in a
+# given process.
+#
+# makelazycode() replaces the code objects of the module and class level
+# functions of the frozen modules with stub code objects, which have the
+# same signature, and moves the marshalled original code objects into
+# the frozen module pyrun_lazycode_data. Its frozen data consists of the
+# marshal data of an empty module followed by the marshalled code
+# objects, which marshal ignores when importing the module. The stubs
+# only hold the offset and size of their code object in the frozen data.
+#
+# On the first call, the stub has pyrun_lazycode.load() unmarshal the
+# original code object directly from the frozen data in the binary and
+# put it into the function's __code__, and then calls the function with
+# its arguments (see pyrun_lazycode).
+#
+# Generators, coroutines, functions with free variables (closures and
+# methods using super()) and small functions are left alone. So are
+# functions looking at the stack (directly or by calling a function of
+# the same module doing so), since the stub's frame is on the stack
+# during the first call.
+
+import marshal
+import modulefinder
+import types
+
+# Reading the frozen data requires _imp.find_frozen(), which was added
+# in 3.11
+LAZYCODE_MINVERSION = (3, 11)
+
+# Name of the frozen module holding the original code objects
+DATA_MODULE = 'pyrun_lazycode_data'
+
+# Code object of DATA_MODULE and its marshal data, which the original
+# code objects are appended to
+DATA_CODE = compile('', '<pyrun>/%s.py' % DATA_MODULE, 'exec')
+DATA_HEADER = marshal.dumps(DATA_CODE)
+
+# Marshalled size of the smallest code object to replace with a stub;
+# smaller functions are not worth the first call overhead
+MIN_SIZE = 512
+
+# Modules which have to be left alone: the module loading the code, the
+# modules it imports and the import machinery, which the stubs use via
+# __import__()
+MODULE_EXCLUDES = (
+    'pyrun_lazycode',
+    'types',
+    'importlib._bootstrap',
+    'importlib._bootstrap_external',
+    'zipimport',
+    )
+
+# Constant used in the stubs to mark them as such; has to match
+# pyrun_lazycode.STUB_MARKER
+STUB_MARKER = 'pyrun_lazycode'
+
+# Functions using these names are not replaced with stubs, since they
+# look at the stack (directly or via warnings' stacklevel)
+STACK_NAMES = frozenset((
+    '_deprecated',
+    '_getframe',
+    '_getframemodulename',
+    'currentframe',
+    'stack',
+    'extract_stack',
+    'format_stack',
+    'print_stack',
+    'walk_stack',
+    'warn',
+    ))
+
+# Code object flags
+CO_OPTIMIZED = 0x01
+CO_NEWLOCALS = 0x02
+CO_VARARGS = 0x04
+CO_VARKEYWORDS = 0x08
+CO_GENERATOR = 0x20
+CO_COROUTINE = 0x80
+CO_ITERABLE_COROUTINE = 0x100
+CO_ASYNC_GENERATOR = 0x200
+
+# Functions with these flags are not replaced with stubs, since the
+# stub would have to use the same flags
+NO_STUB_FLAGS = (CO_GENERATOR | CO_COROUTINE | CO_ITERABLE_COROUTINE |
+                 CO_ASYNC_GENERATOR)
+
+# Stub source code template
+STUB_TEMPLATE = """\
+def stub(%(parameters)s):
+    return __import__(%(marker)r).load(%(location)r, %(qualname)r)(%(arguments)s)
+"""
+
+def is_function(code):
+    """ Return True, if code is the code of a function (and not that of
+        a class body).
+
+    """
+    return code.co_flags & (CO_OPTIMIZED | CO_NEWLOCALS) == (CO_OPTIMIZED |
+                                                             CO_NEWLOCALS)
+
+def is_stub(code):
+    """ Return True, if code is a stub code object.
+
+        Has to match pyrun_lazycode.is_stub().
+
+    """
+    consts = code.co_consts
+    return (len(consts) >= 3 and
+            consts[1] == STUB_MARKER and
+            type(consts[2]) is tuple)
+
+def code_names(code):
+    """ Return the set of names used by code and its nested code
+        objects.
+
+    """
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names.update(code_names(const))
+    return names
+
+def functions(code):
+    """ Yield the function code objects nested in code.
+
+    """
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            if is_function(const):
+                yield const
+            for nested in functions(const):
+                yield nested
+
+def stack_names(code):
+    """ Return the set of names, which refer to functions looking at
+        the stack, for the module code object code.
+
+        These are STACK_NAMES and the names of the functions of the
+        module using one of them, directly or indirectly.
+
+    """
+    names = set(STACK_NAMES)
+    function_names = [(function.co_name, code_names(function))
+                      for function in functions(code)]
+    changed = True
+    while changed:
+        changed = False
+        for name, used in function_names:
+            if name not in names and used & names:
+                names.add(name)
+                changed = True
+    return names
+
+def parameters(code):
+    """ Return the tuple of parameter names of code.
+
+    """
+    count = code.co_argcount + code.co_kwonlyargcount
+    if code.co_flags & CO_VARARGS:
+        count += 1
+    if code.co_flags & CO_VARKEYWORDS:
+        count += 1
+    return code.co_varnames[:count]
+
+def use_stub(code, data, stack):
+    """ Return True, if the function code object code with marshal data
+        data should be replaced with a stub.
+
+        stack is the set of names referring to functions looking at the
+        stack.
+
+    """
+    return (not code.co_flags & NO_STUB_FLAGS and
+            not code.co_freevars and
+            not code.co_name.startswith('<') and
+            code.co_name not in stack and
+            len(data) >= MIN_SIZE and
+            '__import__' not in parameters(code) and
+            not code_names(code) & stack)
+
+def stub_code(code, location, qualname):
+    """ Return the stub code object for the function code object code
+        with qualified name qualname.
+
+        location is the (offset, size) tuple of the marshalled code
+        object in the frozen data of DATA_MODULE.
+
+    """
+    names = list(parameters(code))
+    posonly = code.co_posonlyargcount
+    positional = code.co_argcount
+    kwonly = code.co_kwonlyargcount
+    params = names[:positional]
+    args = names[:positional]
+    if posonly:
+        params.insert(posonly, '/')
+    index = positional + kwonly
+    if code.co_flags & CO_VARARGS:
+        params.append('*' + names[index])
+        args.append('*' + names[index])
+        index += 1
+    elif kwonly:
+        params.append('*')
+    params.extend(names[positional:positional + kwonly])
+    args.extend('%s=%s' % (name, name)
+                for name in names[positional:positional + kwonly])
+    if code.co_flags & CO_VARKEYWORDS:
+        params.append('**' + names[index])
+        args.append('**' + names[index])
+    source = STUB_TEMPLATE % dict(parameters=', '.join(params),
+                                  arguments=', '.join(args),
+                                  marker=STUB_MARKER,
+                                  location=location,
+                                  qualname=qualname)
+    stub = compile(source, code.co_filename, 'exec').co_consts[0]
+    consts = list(stub.co_consts)
+    assert consts[:4] == [None, STUB_MARKER, location, qualname], consts
+    # The first constant is the docstring
+    consts[0] = code.co_consts[0] if code.co_consts else None
+    return stub.replace(
+        co_flags=code.co_flags,
+        co_consts=tuple(consts),
+        co_name=code.co_name,
+        co_qualname=code.co_qualname,
+        co_firstlineno=code.co_firstlineno)
+
+def lazy_code(code, trailer, stack=None, prefix=''):
+    """ Return a copy of the module or class body code object code,
+        using stubs for the function code objects in its constants.
+
+        The marshal data of the replaced code objects is appended to the
+        bytearray trailer, which follows DATA_HEADER in the frozen data.
+        stack is the set of names referring to functions looking at the
+        stack, prefix the qualified name prefix for the functions in
+        code.
+
+    """
+    if stack is None:
+        stack = stack_names(code)
+    consts = []
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            if not is_function(const):
+                # Class body
+                const = lazy_code(const, trailer, stack,
+                                  prefix + const.co_name + '.')
+            else:
+                data = marshal.dumps(const)
+                if use_stub(const, data, stack):
+                    offset = len(DATA_HEADER) + len(trailer)
+                    trailer += data
+                    const = stub_code(const,
+                                      (offset, len(data)),
+                                      prefix + const.co_name)
+        consts.append(const)
+    return code.replace(co_consts=tuple(consts))
+
+def makelazycode(dict):
+    """ Replace the function code objects of the modules in the
+        modulefinder dictionary dict with stubs and add the DATA_MODULE
+        holding the original code objects to dict.
+
+        The marshal data of the original code objects is stored in the
+        __trailer__ attribute of the DATA_MODULE, which makefreeze
+        appends to its marshal data.
+
+        Returns the number of replaced code objects and their total
+        marshalled size.
+
+    """
+    trailer = bytearray()
+    count = 0
+    for mod in sorted(dict):
+        m = dict[mod]
+        if not m.__code__ or mod in MODULE_EXCLUDES:
+            continue
+        m.__code__ = lazy_code(m.__code__, trailer)
+        count += sum(1 for code in functions(m.__code__) if is_stub(code))
+    m = modulefinder.Module(DATA_MODULE)
+    m.__code__ = DATA_CODE
+    m.__trailer__ = bytes(trailer)
+    dict[DATA_MODULE] = m
+    return count, len(trailer)
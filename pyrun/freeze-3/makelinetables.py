@@ -0,0 +1,111 @@
+# Move the line number tables of frozen modules into a side table
+# (eGenix PyRun).
+#
+# Every code object carries a line number table (co_linetable), which is
+# only needed for tracebacks, warnings, tracing and introspection, but is
+# part of the marshal data and gets unmarshalled and allocated on every
+# import.
+#
+# makelinetables() replaces the line tables of the code objects of the
+# frozen modules with short stub tables, which map all instructions to
+# the first line of the code object, so that line numbers remain valid
+# integers. The original tables are stored in the frozen module
+# pyrun_linetables_data: one zlib compressed marshal blob per source
+# file, mapping the qualified name, first line number and code size of
+# each code object to its line table. The pyrun_linetables module
+# restores them on demand for tracebacks and inspect.
+#
+# The exception tables (co_exceptiontable) are needed for running the
+# code and are left alone.
+
+import marshal
+import modulefinder
+import types
+import zlib
+
+# The line table format used by this module was introduced in 3.11
+LINETABLES_MINVERSION = (3, 11)
+
+# Name of the frozen module holding the line tables
+DATA_MODULE = 'pyrun_linetables_data'
+
+# Line table entry type for entries with line, but without column
+# information (PY_CODE_LOCATION_INFO_NO_COLUMNS)
+NO_COLUMNS = 13
+
+# Max. number of code units covered by a line table entry
+MAX_ENTRY_LENGTH = 8
+
+def linetable_key(code):
+    """ Return the line table key for code.
+
+        Has to match pyrun_linetables.linetable_key().
+
+    """
+    return '%s:%i:%i' % (code.co_qualname, code.co_firstlineno,
+                         len(code.co_code))
+
+def stub_linetable(code):
+    """ Return a line table for code, which maps all instructions to
+        code.co_firstlineno.
+
+    """
+    entries = []
+    units = len(code.co_code) // 2
+    while units > 0:
+        length = min(units, MAX_ENTRY_LENGTH)
+        # Entry header and a line delta of 0 (signed varint)
+        entries.append(bytes((0x80 | (NO_COLUMNS << 3) | (length - 1), 0)))
+        units -= length
+    return b''.join(entries)
+
+def strip_code(code, table):
+    """ Return a copy of code and its nested code objects using stub line
+        tables and add the original line tables to table.
+
+    """
+    consts = tuple(strip_code(const, table)
+                   if isinstance(const, types.CodeType) else const
+                   for const in code.co_consts)
+    linetable = code.co_linetable
+    stub = stub_linetable(code)
+    if len(stub) < len(linetable):
+        key = linetable_key(code)
+        if key in table and table[key] != linetable:
+            # Ambiguous key; keep the stub tables for both code objects
+            table[key] = None
+        else:
+            table[key] = linetable
+        linetable = stub
+    return code.replace(co_consts=consts, co_linetable=linetable)
+
+def makelinetables(dict):
+    """ Replace the line tables of the code objects of the modules in the
+        modulefinder dictionary dict with stub tables and add the
+        DATA_MODULE holding the original tables to dict.
+
+        Returns the number of bytes moved.
+
+    """
+    linetables = {}
+    size = 0
+    for mod in sorted(dict):
+        m = dict[mod]
+        if not m.__code__ or mod == DATA_MODULE:
+            continue
+        table = {}
+        m.__code__ = strip_code(m.__code__, table)
+        if not table:
+            continue
+        linetables[m.__code__.co_filename] = zlib.compress(
+            marshal.dumps(table), 9)
+        size += sum(len(linetable)
+                    for linetable in table.values()
+                    if linetable is not None)
+    m = modulefinder.Module(DATA_MODULE)
+    m.__code__ = compile(
+        'LINETABLES = %r\n' % (linetables,),
+        '<pyrun>/%s.py' % DATA_MODULE,
+        'exec')
+    dict[DATA_MODULE] = m
+    return size
@@ -23,7 +23,7 @@ def filter_module_ldflags(value):
     ]
     return ' '.join(shared_libs)
 
-def makemakefile(outfp, makevars, files, target):
+def makemakefile(outfp, makevars, files, target, makefile=None):
     outfp.write("# Makefile generated by freeze.py script\n\n")
 
     keys = sorted(makevars.keys())
@@ -35,13 +35,19 @@ def makemakefile(outfp, makevars, files, target):
         outfp.write("%s=%s\n" % (key, value))
     outfp.write("\nall: %s\n\n" % target)
 
+    # Object files have to be rebuilt when the Makefile changes, e.g.
+    # because of different compiler flags
+    if makefile:
+        makefile_dep = ' ' + makefile
+    else:
+        makefile_dep = ''
     deps = []
     for i in range(len(files)):
         file = files[i]
         if file[-2:] == '.c':
             base = os.path.basename(file)
             dest = base[:-2] + '.o'
-            outfp.write("%s: %s\n" % (dest, file))
+            outfp.write("%s: %s%s\n" % (dest, file, makefile_dep))
             outfp.write("\t$(CC) $(PY_CFLAGS) $(PY_CPPFLAGS) -c %s\n" % file)
             files[i] = dest
             deps.append(dest)
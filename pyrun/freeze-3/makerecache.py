@@ -0,0 +1,197 @@
+# Precompile the module level regular expressions of frozen modules
+# (eGenix PyRun).
+#
+# Many stdlib modules compile regular expressions when they are imported,
+# which runs the pure Python re parser and compiler in every process.
+#
+# makerecache() looks for module level re.compile() calls with constant
+# arguments in the sources of the frozen modules, compiles the patterns
+# once and stores the arguments the re compiler passes to _sre.compile()
+# (pattern, flags, code, groups, group index) in the frozen module
+# pyrun_re_cache_data, keyed by pattern and flags. The re module is
+# patched to look up patterns missing from its cache there (see
+# pyrun_re_cache), so only the fast _sre.compile() step remains at
+# runtime.
+
+import ast
+import marshal
+import modulefinder
+import re
+import warnings
+import _sre
+
+try:
+    # Python 3.11+
+    from re import _compiler as sre_compiler
+except ImportError:
+    import sre_compile as sre_compiler
+
+# Name of the frozen module holding the precompiled patterns
+DATA_MODULE = 'pyrun_re_cache_data'
+
+def import_time_nodes(tree):
+    """ Yield the nodes of the module AST tree, which are run when
+        importing the module, i.e. all nodes except for those in function
+        and lambda bodies.
+
+    """
+    todo = [tree]
+    while todo:
+        node = todo.pop()
+        yield node
+        for child in ast.iter_child_nodes(node):
+            if not isinstance(child, (ast.FunctionDef,
+                                      ast.AsyncFunctionDef,
+                                      ast.Lambda)):
+                todo.append(child)
+
+def re_aliases(tree):
+    """ Return the set of names the re module is imported as at module
+        level in tree.
+
+    """
+    aliases = set()
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.name == 're':
+                    aliases.add(alias.asname or 're')
+    return aliases
+
+def evaluate(node, aliases):
+    """ Return the value of the constant pattern or flags expression
+        node.
+
+        Supported are str, bytes and int constants, re flags accessed
+        via the re module names aliases and the + and | operators.
+        Raises ValueError for all other expressions.
+
+    """
+    if (isinstance(node, ast.Attribute) and
+        isinstance(node.value, ast.Name) and
+        node.value.id in aliases):
+        flag = getattr(re, node.attr, None)
+        if isinstance(flag, re.RegexFlag):
+            return flag.value
+    elif isinstance(node, ast.BinOp):
+        left = evaluate(node.left, aliases)
+        right = evaluate(node.right, aliases)
+        if (isinstance(node.op, ast.Add) and
+            type(left) is type(right) and
+            isinstance(left, (str, bytes))):
+            return left + right
+        if (isinstance(node.op, ast.BitOr) and
+            isinstance(left, int) and isinstance(right, int)):
+            return left | right
+    else:
+        # Python 3.8+ uses ast.Constant, older versions ast.Str, etc.
+        try:
+            value = ast.literal_eval(node)
+        except (ValueError, TypeError, SyntaxError):
+            pass
+        else:
+            if (isinstance(value, (str, bytes, int)) and
+                not isinstance(value, bool)):
+                return value
+    raise ValueError('not a constant expression')
+
+def find_patterns(source, filename='<unknown>'):
+    """ Return a list of (pattern, flags) tuples of the module level
+        re.compile() calls with constant arguments in the module source.
+
+    """
+    try:
+        tree = ast.parse(source, filename)
+    except (SyntaxError, ValueError):
+        return []
+    aliases = re_aliases(tree)
+    if not aliases:
+        return []
+    patterns = []
+    for node in import_time_nodes(tree):
+        if not (isinstance(node, ast.Call) and
+                isinstance(node.func, ast.Attribute) and
+                node.func.attr == 'compile' and
+                isinstance(node.func.value, ast.Name) and
+                node.func.value.id in aliases):
+            continue
+        args = list(node.args)
+        for keyword in node.keywords:
+            if keyword.arg == 'pattern' and not args:
+                args.append(keyword.value)
+            elif keyword.arg == 'flags' and len(args) == 1:
+                args.append(keyword.value)
+            else:
+                args = None
+                break
+        if not args or len(args) > 2:
+            continue
+        try:
+            pattern = evaluate(args[0], aliases)
+            flags = evaluate(args[1], aliases) if len(args) > 1 else 0
+        except ValueError:
+            continue
+        if isinstance(pattern, (str, bytes)) and isinstance(flags, int):
+            patterns.append((pattern, flags))
+    return patterns
+
+def compile_args(pattern, flags):
+    """ Return the arguments the re compiler passes to _sre.compile()
+        for pattern and flags, or None, if the pattern cannot be
+        precompiled.
+
+        Patterns which fail to compile or issue warnings are left to the
+        re module, so that the behavior doesn't change.
+
+    """
+    if flags & re.DEBUG:
+        return None
+    calls = []
+    sre_compile = _sre.compile
+    def record(*args):
+        calls.append(args)
+        return sre_compile(*args)
+    _sre.compile = record
+    try:
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            sre_compiler.compile(pattern, flags)
+    except Exception:
+        return None
+    finally:
+        _sre.compile = sre_compile
+    if caught or len(calls) != 1:
+        return None
+    # The code list contains int subclass opcode constants, which
+    # marshal doesn't support
+    pattern, flags, code = calls[0][:3]
+    return (pattern, int(flags), [int(op) for op in code]) + calls[0][3:]
+
+def makerecache(dict):
+    """ Precompile the module level regular expressions of the modules
+        in the modulefinder dictionary dict and add the DATA_MODULE
+        holding them to dict.
+
+        Returns the number of precompiled patterns.
+
+    """
+    patterns = {}
+    for mod in sorted(dict):
+        m = dict[mod]
+        if not m.__code__ or not m.__file__ or not m.__file__.endswith('.py'):
+            continue
+        with open(m.__file__, 'rb') as file:
+            source = file.read()
+        for pattern, flags in find_patterns(source, m.__file__):
+            if (pattern, flags) in patterns:
+                continue
+            args = compile_args(pattern, flags)
+            if args is not None:
+                patterns[pattern, flags] = marshal.dumps(args)
+    m = modulefinder.Module(DATA_MODULE)
+    m.__code__ = compile(
+        'PATTERNS = %r\n' % (patterns,),
+        '<pyrun>/%s.py' % DATA_MODULE,
+        'exec')
+    dict[DATA_MODULE] = m
+    return len(patterns)
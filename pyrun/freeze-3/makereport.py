@@ -0,0 +1,152 @@
+# Write a JSON report with the sizes of the frozen modules (eGenix PyRun).
+#
+# For every frozen module, the report lists the size of its marshal data,
+# the size actually stored in the binary (after compression), and how
+# many of these bytes are taken up by docstrings and line number tables.
+# The modules are also summed up per top-level package. For builds with
+# a shared constant pool (see makeconstpool), the report lists the bytes
+# and the allocations on import saved by it.
+#
+# The report is processed further by pyrun/bloatreport.py, which adds
+# the sizes of the statically linked extension modules and compares it
+# to a previous report.
+
+import dis
+import inspect
+import json
+import sys
+import types
+
+# Version of the report format
+REPORT_VERSION = 1
+
+# Fields which are summed up for the package totals
+SIZE_FIELDS = ('size', 'stored_size', 'docstrings', 'linetables')
+
+def walk_code(code):
+    """ Yield code and all code objects nested in it.
+
+    """
+    yield code
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            yield from walk_code(const)
+
+def docstring(code):
+    """ Return the docstring stored by code, or None.
+
+        Functions store their docstring as first constant. Modules and
+        classes assign it to __doc__.
+
+    """
+    if code.co_flags & inspect.CO_NEWLOCALS:
+        # A function
+        if code.co_consts and isinstance(code.co_consts[0], str):
+            return code.co_consts[0]
+        return None
+    if '__doc__' not in code.co_names:
+        return None
+    previous = None
+    for instruction in dis.get_instructions(code):
+        if (instruction.opname == 'STORE_NAME' and
+            instruction.argval == '__doc__'):
+            if (previous is not None and
+                previous.opname == 'LOAD_CONST' and
+                isinstance(previous.argval, str)):
+                return previous.argval
+            return None
+        previous = instruction
+    return None
+
+def code_stats(code):
+    """ Return a dictionary with the number of code objects and the
+        number of bytes used for docstrings and line number tables in
+        code and its nested code objects.
+
+    """
+    docstrings = 0
+    linetables = 0
+    count = 0
+    for c in walk_code(code):
+        count += 1
+        doc = docstring(c)
+        if doc is not None:
+            docstrings += len(doc.encode('utf-8', 'surrogatepass'))
+        linetables += len(getattr(c, 'co_linetable', None) or
+                          getattr(c, 'co_lnotab', b''))
+    return {
+        'code_objects': count,
+        'docstrings': docstrings,
+        'linetables': linetables,
+        }
+
+def package_name(mod):
+    return mod.split('.')[0]
+
+def constpool_stats(constpool):
+    """ Return the constant pool section of the report for the
+        statistics returned by makeconstpool.makeconstpool().
+
+        saved_bytes is the reduction of the marshal data size including
+        the pool. saved_allocations is the number of objects, which
+        unmarshalling all frozen modules doesn't have to create anymore,
+        less the objects created when loading the pool.
+
+    """
+    modules = constpool['modules']
+    size = sum(entry['size'] for entry in modules.values())
+    pooled_size = sum(entry['pooled_size'] for entry in modules.values())
+    pool_objects = sum(entry['pool_objects'] for entry in modules.values())
+    return {
+        'objects': constpool['objects'],
+        'pool_size': constpool['pool_size'],
+        'size': size,
+        'pooled_size': pooled_size,
+        'saved_bytes': size - pooled_size - constpool['pool_size'],
+        'saved_allocations': pool_objects - constpool['objects'],
+        'modules': modules,
+        }
+
+def makereport(filename, modules, constpool=None):
+    """ Write the report for modules to filename.
+
+        modules has to be a list of (module name, code object, marshal
+        data size, stored size, is package, deepfrozen) tuples.
+        constpool may be given as the statistics returned by
+        makeconstpool.makeconstpool().
+
+    """
+    report_modules = {}
+    packages = {}
+    totals = dict.fromkeys(SIZE_FIELDS, 0)
+    totals['modules'] = 0
+    for mod, code, size, stored_size, is_package, deepfrozen in modules:
+        entry = {
+            'size': size,
+            'stored_size': stored_size,
+            'package': bool(is_package),
+            'deepfrozen': bool(deepfrozen),
+            }
+        entry.update(code_stats(code))
+        report_modules[mod] = entry
+        package = packages.get(package_name(mod))
+        if package is None:
+            package = packages[package_name(mod)] = dict.fromkeys(
+                SIZE_FIELDS, 0)
+            package['modules'] = 0
+        package['modules'] += 1
+        totals['modules'] += 1
+        for field in SIZE_FIELDS:
+            package[field] += entry[field]
+            totals[field] += entry[field]
+    report = {
+        'version': REPORT_VERSION,
+        'python': sys.version.split()[0],
+        'modules': report_modules,
+        'packages': packages,
+        'totals': totals,
+        }
+    if constpool is not None:
+        report['constpool'] = constpool_stats(constpool)
+    with open(filename, 'w') as file:
+        json.dump(report, file, indent=1, sort_keys=True)
@@ -0,0 +1,356 @@
+# Persistent cache for the modulefinder dependency scan (eGenix PyRun).
+#
+# Most of the time needed by modulefinder goes into compiling the source
+# of every module it finds, which for PyRun is the complete stdlib, and
+# scanning the byte code for imports. The cache stores the compiled code
+# objects together with the scan results, keyed by the source file path
+# and the SHA-256 of its contents (files are only hashed again if their
+# mtime or size changed), so that repeated freeze runs don't have to
+# compile and scan unchanged modules again. Missing entries are created
+# in parallel using worker processes before modulefinder starts.
+#
+# The cache index is a JSON file which also lists the modules found by
+# the last run, together with their source files and the imports of each
+# module, so it doubles as manifest of the frozen set.
+#
+# Different Python versions and optimization settings use separate
+# index files and code directories, so one cache directory can be shared
+# between builds.
+
+import ast
+import hashlib
+import json
+import marshal
+import modulefinder
+import os
+import sys
+import types
+
+# Version of the index file format
+CACHE_VERSION = 1
+
+def cache_tag():
+    """ Return a string identifying the Python version and compiler
+        settings the cached code objects are valid for.
+
+    """
+    tag = '%s-O%i' % (sys.implementation.cache_tag, sys.flags.optimize)
+    if 'no_debug_ranges' in sys._xoptions:
+        tag += '-nodebugranges'
+    return tag
+
+def walk_code(code):
+    """ Yield code and all code objects nested in it, in the order
+        used by ModuleFinder.scan_code().
+
+    """
+    yield code
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            yield from walk_code(const)
+
+def compile_and_scan(source, pathname):
+    """ Compile source and return the code object and a list with the
+        results of ModuleFinder.scan_opcodes() for all code objects as
+        returned by walk_code().
+
+    """
+    code = compile(source, pathname, 'exec')
+    scans = [list(modulefinder.ModuleFinder.scan_opcodes(None, c))
+             for c in walk_code(code)]
+    return code, scans
+
+def compile_source(pathname):
+    """ Compile and scan the Python source file pathname and return the
+        marshal data of the compile_and_scan() result, or None, if the
+        file cannot be compiled.
+
+        Used by the worker processes.
+
+    """
+    try:
+        with open(pathname, 'rb') as file:
+            return marshal.dumps(compile_and_scan(file.read(), pathname))
+    except Exception:
+        # Let modulefinder report the problem
+        return None
+
+def file_hash(pathname):
+    with open(pathname, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+class ModuleCache:
+
+    """ Cache for compiled module code.
+
+        If directory is None, code objects are only cached in memory,
+        which still allows compiling them in parallel.
+
+    """
+    def __init__(self, directory=None, debug=0):
+        self.directory = directory
+        self.debug = debug
+        self.tag = cache_tag()
+        # Index entries of the last run: pathname -> dict(mtime, size,
+        # sha256)
+        self.old_files = {}
+        # Index entries used by this run
+        self.files = {}
+        # Code objects compiled by this run: pathname -> marshal data
+        self.code = {}
+        self.hits = 0
+        self.misses = 0
+        # Module names found by the last run
+        self.old_modules = ()
+        if directory is not None:
+            self.index_file = os.path.join(
+                directory, 'modulecache-%s.json' % self.tag)
+            self.code_dir = os.path.join(directory, 'code-%s' % self.tag)
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.index_file) as file:
+                index = json.load(file)
+        except (OSError, ValueError):
+            return
+        if (index.get('version') != CACHE_VERSION or
+            index.get('tag') != self.tag):
+            return
+        self.old_files = index.get('files', {})
+        self.old_modules = tuple(index.get('modules', {}))
+
+    def source_hash(self, pathname):
+        """ Return the SHA-256 of the source file pathname and record it
+            in the index.
+
+        """
+        stat = os.stat(pathname)
+        entry = self.files.get(pathname) or self.old_files.get(pathname)
+        if (entry is None or
+            entry['mtime'] != stat.st_mtime_ns or
+            entry['size'] != stat.st_size):
+            entry = {
+                'mtime': stat.st_mtime_ns,
+                'size': stat.st_size,
+                'sha256': file_hash(pathname),
+                }
+        self.files[pathname] = entry
+        return entry['sha256']
+
+    def code_file(self, pathname, hash):
+        """ Return the filename of the cached code for pathname with
+            the given source hash.
+
+        """
+        # Include the path, since it's stored in the code object
+        key = hashlib.sha256(
+            ('%s\0%s' % (pathname, hash)).encode('utf-8')).hexdigest()
+        return os.path.join(self.code_dir, key + '.marshal')
+
+    def read_code(self, pathname):
+        """ Return the cached marshal data for pathname, or None.
+
+        """
+        data = self.code.get(pathname)
+        if data is not None or self.directory is None:
+            return data
+        try:
+            with open(self.code_file(pathname,
+                                     self.source_hash(pathname)),
+                      'rb') as file:
+                return file.read()
+        except OSError:
+            return None
+
+    def has_code(self, pathname):
+        if pathname in self.code:
+            return True
+        if self.directory is None:
+            return False
+        return os.path.exists(self.code_file(pathname,
+                                             self.source_hash(pathname)))
+
+    def write_code(self, pathname, data):
+        self.code[pathname] = data
+        if self.directory is None:
+            return
+        code_file = self.code_file(pathname, self.source_hash(pathname))
+        os.makedirs(self.code_dir, exist_ok=True)
+        tempfile = '%s.%i' % (code_file, os.getpid())
+        with open(tempfile, 'wb') as file:
+            file.write(data)
+        os.replace(tempfile, code_file)
+
+    def get_code(self, pathname):
+        """ Return the code object for the Python source file pathname
+            and its scan results (see compile_and_scan()), compiling it
+            if necessary.
+
+        """
+        data = self.read_code(pathname)
+        if data is not None:
+            self.hits += 1
+            return marshal.loads(data)
+        self.misses += 1
+        with open(pathname, 'rb') as file:
+            code, scans = compile_and_scan(file.read(), pathname)
+        self.write_code(pathname, marshal.dumps((code, scans)))
+        return code, scans
+
+    def precompile(self, pathnames, jobs=None):
+        """ Compile the source files pathnames which are not in the cache
+            using jobs worker processes (defaults to the number of CPUs).
+
+        """
+        missing = sorted(pathname
+                         for pathname in set(pathnames)
+                         if not self.has_code(pathname))
+        if not missing:
+            return
+        if self.debug:
+            print('compiling %i modules in parallel' % len(missing))
+        if jobs == 1 or len(missing) == 1:
+            results = map(compile_source, missing)
+            self.store_results(missing, results)
+            return
+        import concurrent.futures
+        with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+            results = executor.map(compile_source, missing, chunksize=16)
+            self.store_results(missing, results)
+
+    def store_results(self, pathnames, results):
+        for pathname, data in zip(pathnames, results):
+            if data is not None:
+                self.write_code(pathname, data)
+
+    def save(self, finder):
+        """ Write the index, including the manifest of the modules found
+            by finder, and remove unused code files.
+
+        """
+        if self.directory is None:
+            return
+        modules = {}
+        for name, module in sorted(finder.modules.items()):
+            modules[name] = {
+                'file': module.__file__,
+                'package': module.__path__ is not None,
+                'frozen': module.__code__ is not None,
+                'imports': sorted(finder.imports.get(name, ())),
+                }
+        index = {
+            'version': CACHE_VERSION,
+            'tag': self.tag,
+            'python': sys.version,
+            'files': self.files,
+            'modules': modules,
+            }
+        os.makedirs(self.directory, exist_ok=True)
+        tempfile = '%s.%i' % (self.index_file, os.getpid())
+        with open(tempfile, 'w') as file:
+            json.dump(index, file, indent=1, sort_keys=True)
+        os.replace(tempfile, self.index_file)
+        used = set(os.path.basename(self.code_file(pathname, entry['sha256']))
+                   for pathname, entry in self.files.items())
+        if not os.path.isdir(self.code_dir):
+            return
+        for filename in os.listdir(self.code_dir):
+            if filename not in used:
+                os.unlink(os.path.join(self.code_dir, filename))
+        if self.debug:
+            print('module cache: %i hits, %i misses' %
+                  (self.hits, self.misses))
+
+class CachingModuleFinder(modulefinder.ModuleFinder):
+
+    """ ModuleFinder using a ModuleCache for compiling modules.
+
+        The imports done by each module are recorded in .imports.
+
+    """
+    def __init__(self, *args, cache=None, **kws):
+        modulefinder.ModuleFinder.__init__(self, *args, **kws)
+        self.cache = cache
+        # Module name -> set of imported names
+        self.imports = {}
+        # id(code object) -> cached scan_opcodes() result
+        self.scans = {}
+
+    def import_hook(self, name, caller=None, fromlist=None, level=-1):
+        if caller is not None:
+            if level > 0:
+                imported = '.' * level + name
+            else:
+                imported = name
+            self.imports.setdefault(caller.__name__, set()).add(imported)
+        return modulefinder.ModuleFinder.import_hook(
+            self, name, caller, fromlist, level)
+
+    def load_module(self, fqname, fp, pathname, file_info):
+        suffix, mode, type = file_info
+        if type != modulefinder._PY_SOURCE:
+            return modulefinder.ModuleFinder.load_module(
+                self, fqname, fp, pathname, file_info)
+        self.msgin(2, "load_module", fqname, fp and "fp", pathname)
+        co, scans = self.cache.get_code(pathname)
+        m = self.add_module(fqname)
+        m.__file__ = pathname
+        if self.replace_paths:
+            co = self.replace_paths_in_code(co)
+        m.__code__ = co
+        # The code objects are kept alive by the module, so their ids
+        # stay valid
+        self.scans.update(zip(map(id, walk_code(co)), scans))
+        self.scan_code(co, m)
+        self.msgout(2, "load_module ->", m)
+        return m
+
+    def scan_opcodes(self, co):
+        scan = self.scans.pop(id(co), None)
+        if scan is None:
+            return modulefinder.ModuleFinder.scan_opcodes(self, co)
+        return iter(scan)
+
+    def find_sources(self, names):
+        """ Return the source files of the modules names (and their
+            parent packages) without loading them.
+
+        """
+        sources = set()
+        for name in names:
+            path = None
+            parent = None
+            for part in name.split('.'):
+                try:
+                    fp, pathname, (suffix, mode, type) = \
+                        self.find_module(part, path, parent)
+                except ImportError:
+                    break
+                if fp is not None:
+                    fp.close()
+                if type == modulefinder._PY_SOURCE:
+                    sources.add(pathname)
+                    break
+                if type != modulefinder._PKG_DIRECTORY:
+                    break
+                sources.add(os.path.join(pathname, '__init__.py'))
+                path = [pathname]
+                parent = modulefinder.Module(
+                    parent.__name__ + '.' + part if parent else part)
+        return sources
+
+def script_imports(pathname):
+    """ Return the names of the modules imported by the Python script
+        pathname.
+
+    """
+    with open(pathname, 'rb') as file:
+        tree = ast.parse(file.read(), pathname)
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module)
+    return names
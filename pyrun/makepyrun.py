@@ -3,10 +3,17 @@
 """ eGenix PyRun bootstrap file generator
 
     Usage: makepyrun <inputfile> <outputfile> <version> <libdir> <setupfile>
+           makepyrun --compile <dir>
+           makepyrun --sidecar <dir>
 
     Output is written to outputfile (a Python script which must be
     passed to freeze.py).
 
+    With --compile, all Python modules in dir are byte compiled
+    instead, using the PYRUN_COMPILE_JOBS and PYRUN_PYC_INVALIDATION
+    settings. With --sidecar, the sidecar lib dir used by tree-shaken
+    builds is created in dir (see PYRUN_IMPORT_MANIFESTS).
+
     ---------------------------------------------------------------------
 
     Copyright (c) 1997-2000, IKDS Marc-Andre Lemburg; mailto:mal@lemburg.com
@@ -37,6 +44,7 @@
 import sys
 import os
 import re
+import marshal
 
 try:
     # sysconfig was added to Python 2.7 as top-level module
@@ -62,6 +70,7 @@ ENCODING = 'utf-8'
 # Python version flags
 PY2 = (sys.version_info[0] == 2)
 PY3 = (sys.version_info[0] == 3)
+PY39GE = (sys.version_info[:2] >= (3, 9))
 PY310GE = (sys.version_info[:2] >= (3, 10))
 PY311 = (sys.version_info[:2] == (3, 11))
 PY311GE = (sys.version_info[:2] >= (3, 11))
@@ -97,6 +106,24 @@ PYRUN_VERSION = sys.version.split()[0]
 # PyRun release
 PYRUN_RELEASE = __version__
 
+# Number of worker processes to use for byte compiling modules; 0 means
+# one per CPU
+COMPILE_JOBS = int(os.environ.get('PYRUN_COMPILE_JOBS', 0))
+
+# .pyc invalidation mode to use for byte compiled modules: 'timestamp',
+# 'checked-hash' or 'unchecked-hash' (Python 3.7+); empty for the Python
+# default. Unchecked hash based .pyc files are never checked against
+# their source, which saves a stat() per import on immutable installs.
+PYC_INVALIDATION = os.environ.get('PYRUN_PYC_INVALIDATION', '')
+
+# Import manifests written by pyrun processes run with PYRUN_IMPORTTRACE
+# set; if given, only the modules listed in them are included in the
+# generated pyrun.py (see find_imports())
+IMPORT_MANIFESTS = os.environ.get('PYRUN_IMPORT_MANIFESTS', '').split()
+
+# Files queued by compile_module() while compiling is deferred
+_compile_queue = None
+
 ### Python 2 vs. 3
 
 if PY2:
@@ -344,10 +371,25 @@ def find_modules(libdir=LIBDIR, recurse=1, packageprefix=''):
 
     return files
 
-def find_imports(libdir=LIBDIR, setupfile=SETUPFILE):
+def find_imports(libdir=LIBDIR, setupfile=SETUPFILE,
+                 manifests=IMPORT_MANIFESTS):
+
+    """ Return the import statements for the pyrun.py freeze file.
 
+        If import manifests are given (see pyrun_importtrace.py), only
+        the stdlib modules listed in them are imported (tree-shaken
+        build). freeze.py then adds the modules these depend on.
+
+    """
+    stdlib_modules = find_modules(libdir)
+    if manifests:
+        from pyrun_importtrace import read_manifests
+        traced = read_manifests(manifests)
+        print('Tree-shaken build using %i modules from the import '
+              'manifests %s' % (len(traced), ', '.join(manifests)))
+        stdlib_modules = [mod for mod in stdlib_modules if mod in traced]
     modules = sorted((include_list
-               + find_modules(libdir)
+               + stdlib_modules
                + find_builtin_modules(setupfile)))
     for mod in exclude_list:
         try:
@@ -362,28 +404,128 @@ def find_module_source(modname):
     mod = __import__(modname, None, None, ['*'])
     return '%s.py' % os.path.splitext(mod.__file__)[0]
 
-def compile_module(filename):
+def pyc_invalidation_mode(mode=PYC_INVALIDATION):
 
-    """ Byte compile a Python module filename to .pyc/.pyo files.
+    """ Return the py_compile.PycInvalidationMode for mode, or None for
+        the default mode.
+
+    """
+    if not mode:
+        return None
+    import py_compile
+    return py_compile.PycInvalidationMode[mode.upper().replace('-', '_')]
+
+def _compile_file(args):
+
+    """ Byte compile a single file for one optimization level; helper
+        for compile_modules().
+
+    """
+    import compileall
+    filename, optimize, invalidation_mode = args
+    return compileall.compile_file(
+        filename,
+        quiet=1,
+        optimize=optimize,
+        invalidation_mode=pyc_invalidation_mode(invalidation_mode),
+    )
+
+def compile_modules(filenames,
+                    jobs=COMPILE_JOBS,
+                    invalidation_mode=PYC_INVALIDATION):
+
+    """ Byte compile the Python modules filenames to .pyc/.pyo files.
 
         Files for all supported optimization levels are generated (0-2).
 
+        In Python 3, the files are compiled using jobs worker processes
+        (0 means: one per CPU). invalidation_mode sets the .pyc
+        invalidation mode ('timestamp', 'checked-hash' or
+        'unchecked-hash'); it defaults to the Python default.
+
     """
     if PY3:
-        import compileall
-        for optimize in (0, 1, 2):
-            compileall.compile_file(
-                filename,
-                quiet=1,
-                optimize=optimize,
-            )
+        work = [(filename, optimize, invalidation_mode)
+                for filename in filenames
+                for optimize in (0, 1, 2)]
+        if jobs == 1 or len(work) <= 1:
+            for args in work:
+                _compile_file(args)
+            return
+        import concurrent.futures
+        with concurrent.futures.ProcessPoolExecutor(jobs or None) as executor:
+            list(executor.map(_compile_file, work))
     else:
         # For Python 2 it's better to use distutils, since this supports
         # generating optimized files with different levels than the
         # running Python interpreter
         from distutils.util import byte_compile
         for optimize in (0, 1, 2):
-            byte_compile([filename], optimize=optimize, verbose=0)
+            byte_compile(filenames, optimize=optimize, verbose=0)
+
+def compile_module(filename):
+
+    """ Byte compile a Python module filename to .pyc/.pyo files.
+
+        Files for all supported optimization levels are generated (0-2).
+
+        While compiling is deferred (see main()), the file is only
+        queued and compiled together with the other queued files.
+
+    """
+    if _compile_queue is not None:
+        _compile_queue.append(filename)
+        return
+    compile_modules([filename], jobs=1)
+
+def compile_tree(dir,
+                 jobs=COMPILE_JOBS,
+                 invalidation_mode=PYC_INVALIDATION):
+
+    """ Byte compile all Python modules in the directory tree dir to
+        .pyc/.pyo files for all supported optimization levels (0-2).
+
+        See compile_modules() for the parameters.
+
+    """
+    filenames = []
+    for path, dirs, files in os.walk(dir):
+        dirs[:] = [d for d in dirs if d != '__pycache__']
+        filenames.extend(os.path.join(path, filename)
+                         for filename in files
+                         if filename.endswith('.py'))
+    print('Compiling %i modules in %s' % (len(filenames), dir))
+    compile_modules(sorted(filenames), jobs, invalidation_mode)
+
+def create_sidecar_lib(targetdir, libdir=LIBDIR):
+
+    """ Copy all stdlib modules included in regular pyrun builds from
+        libdir to the sidecar lib dir targetdir and byte compile them.
+
+        Tree-shaken pyrun builds load modules which are not frozen from
+        there (see pyrun_importtrace.py).
+
+    """
+    import shutil
+    if os.path.isdir(targetdir):
+        shutil.rmtree(targetdir)
+    count = 0
+    for mod in find_modules(libdir):
+        if mod in exclude_list or mod.endswith('.__init__'):
+            continue
+        path = mod.replace('.', os.sep)
+        if os.path.isdir(os.path.join(libdir, path)):
+            path = os.path.join(path, '__init__')
+        source = os.path.join(libdir, path + '.py')
+        if not os.path.exists(source):
+            continue
+        target = os.path.join(targetdir, path + '.py')
+        if not os.path.isdir(os.path.dirname(target)):
+            os.makedirs(os.path.dirname(target))
+        shutil.copy2(source, target)
+        count += 1
+    print('Copied %i modules to the sidecar lib dir %s' % (count, targetdir))
+    compile_tree(targetdir)
 
 def config_vars():
 
@@ -400,7 +542,8 @@ def format_template(template, **kws):
         code = code.replace('#$%s' % name, value)
     return code
 
-def patch_module(filename, find_re, replacement, flags=re.MULTILINE):
+def patch_module(filename, find_re, replacement, flags=re.MULTILINE,
+                 marker=None):
 
     """ Patch module file filename.
 
@@ -410,11 +553,18 @@ def patch_module(filename, find_re, replacement, flags=re.MULTILINE):
         re.MULTILINE mode, so '^' and '$' match on individual lines of
         the file.
 
+        If marker is given and found in the module file, the module
+        was already patched by an earlier run and is left alone. This
+        is needed for replacements which the RE would match again.
+
     """
     print('Patching module %s' % filename)
     f = open(filename, 'r', encoding=ENCODING)
     mod_src = f.read()
     f.close()
+    if marker is not None and marker in mod_src:
+        print('Module %s already patched' % filename)
+        return
     rx = re.compile(find_re, flags=flags)
     new_mod_src = rx.sub(replacement, mod_src)
     if new_mod_src == mod_src:
@@ -527,19 +677,245 @@ def patch_ssl_py(libdir=LIBDIR):
     """ Patch ssl module.
 
         We add support for the PYRUN_HTTPSVERIFY OS environment
-        variable.
+        variable. In Python 3, the default HTTPS context is shared and
+        cached (see pyrun_sslcontext).
 
     """
     # Add support for PYRUN_HTTPSVERIFY
-    patch_module(
-        os.path.join(libdir, 'ssl.py'),
-        '^_create_default_https_context = create_default_context',
+    replacement = (
         "#_create_default_https_context = create_default_context\n"
         "if int(os.environ.get('PYRUN_HTTPSVERIFY', 1)):\n"
         "    _create_default_https_context = create_default_context\n"
         "else:\n"
         "    _create_default_https_context = _create_unverified_context\n"
         )
+    if PY3:
+        # Cache the default HTTPS context
+        replacement += (
+            "import pyrun_sslcontext\n"
+            "_create_default_https_context = pyrun_sslcontext.cached_factory(\n"
+            "    _create_default_https_context)\n"
+            )
+    patch_module(
+        os.path.join(libdir, 'ssl.py'),
+        '^_create_default_https_context = create_default_context',
+        replacement)
+
+def patch_http_client_py(libdir=LIBDIR):
+
+    """ Patch http.client module.
+
+        HTTPS connections use the shared default HTTPS context (see
+        pyrun_sslcontext) only if they don't change it; otherwise they
+        get a private context. In Python 3.12+, the context is created
+        by _create_https_context(), which also gets a shared parameter
+        for use by urllib.request.
+
+    """
+    filename = os.path.join(libdir, 'http', 'client.py')
+    if PY312GE:
+        patch_module(
+            filename,
+            r'^def _create_https_context\(http_version\):$',
+            'def _create_https_context(http_version, shared=True):')
+        condition = '\\1if shared and http_version == 11:\n'
+    else:
+        condition = ('\\1if (not key_file and not cert_file and\n'
+                     '\\1    check_hostname is None and\n'
+                     '\\1    self._http_vsn == 11):\n')
+    patch_module(
+        filename,
+        r'^( +)context = ssl\._create_default_https_context\(\)$',
+        '\\1# eGenix PyRun: The shared default context cannot be changed\n'
+        '\\1# and uses the HTTP/1.1 ALPN protocol (see pyrun_sslcontext)\n' +
+        condition +
+        '\\1    context = ssl._create_default_https_context()\n'
+        '\\1else:\n'
+        '\\1    import pyrun_sslcontext\n'
+        '\\1    context = pyrun_sslcontext.private_context()',
+        marker='pyrun_sslcontext.private_context')
+
+def patch_urllib_request_py(libdir=LIBDIR):
+
+    """ Patch urllib.request module (Python 3.12+).
+
+        HTTPSHandler and URLopener change the context they get from
+        http.client._create_https_context(), so they must not use the
+        shared default HTTPS context (see pyrun_sslcontext), if they
+        set check_hostname or load a certificate.
+
+    """
+    filename = os.path.join(libdir, 'urllib', 'request.py')
+    patch_module(
+        filename,
+        r'^( +)context = http\.client\._create_https_context\(http_version\)'
+        r'(\n +if check_hostname is not None:\n)',
+        '\\1context = http.client._create_https_context(\n'
+        '\\1    http_version, shared=check_hostname is None) # eGenix PyRun'
+        '\\2')
+    patch_module(
+        filename,
+        r'^( +)context = http\.client\._create_https_context\(http_version\)'
+        r'(\n +context\.load_cert_chain\()',
+        '\\1context = http.client._create_https_context(\n'
+        '\\1    http_version, shared=False) # eGenix PyRun'
+        '\\2')
+
+def patch_inspect_py(libdir=LIBDIR):
+
+    """ Patch inspect module.
+
+        We make getdoc() look up docstrings removed at freeze time (see
+        pyrun_docstrings) and use the line tables stripped at freeze
+        time for code positions (see pyrun_linetables).
+
+    """
+    patch_module(
+        os.path.join(libdir, 'inspect.py'),
+        r'(^def getdoc\(object\):.*?'
+        r'^        doc = object\.__doc__\n'
+        r'^    except AttributeError:\n'
+        r'^        return None\n)',
+        '\\1'
+        '    if doc is None:\n'
+        '        import pyrun_docstrings\n'
+        '        doc = pyrun_docstrings.getdoc(object)\n',
+        flags=re.MULTILINE | re.DOTALL,
+        marker='pyrun_docstrings')
+    if PY311GE:
+        patch_code_positions(os.path.join(libdir, 'inspect.py'))
+
+def patch_pydoc_py(libdir=LIBDIR):
+
+    """ Patch pydoc module.
+
+        We make _getowndoc() look up docstrings removed at freeze time
+        (see pyrun_docstrings). Older pydoc versions use
+        inspect.getdoc() instead.
+
+    """
+    patch_module(
+        os.path.join(libdir, 'pydoc.py'),
+        r'(^def _getowndoc\(obj\):.*?'
+        r"^        doc = object\.__getattribute__\(obj, '__doc__'\)\n)",
+        '\\1'
+        '        if doc is None:\n'
+        '            import pyrun_docstrings\n'
+        '            doc = pyrun_docstrings.getdoc(obj)\n',
+        flags=re.MULTILINE | re.DOTALL,
+        marker='pyrun_docstrings')
+
+def patch_traceback_py(libdir=LIBDIR):
+
+    """ Patch traceback module.
+
+        We use the line tables stripped at freeze time for line numbers
+        and code positions (see pyrun_linetables).
+
+    """
+    filename = os.path.join(libdir, 'traceback.py')
+    patch_code_positions(filename)
+    patch_module(
+        filename,
+        r'^( +)yield f, f\.f_lineno$',
+        '\\1import pyrun_linetables\n'
+        '\\1yield f, pyrun_linetables.frame_lineno(f)')
+    patch_module(
+        filename,
+        r'^( +)yield tb\.tb_frame, tb\.tb_lineno$',
+        '\\1import pyrun_linetables\n'
+        '\\1yield tb.tb_frame, pyrun_linetables.tb_lineno(tb)')
+
+def patch_warnings_py(libdir=LIBDIR):
+
+    """ Patch warnings module.
+
+        We make the Python version of warn() use the line tables
+        stripped at freeze time (see pyrun_linetables) and use it
+        instead of the C version from _warnings, if the tables were
+        stripped.
+
+        Like the C version, the patched warn() doesn't pass the module
+        globals to warn_explicit(), which would otherwise fail for
+        globals without __spec__.loader in Python 3.12+.
+
+    """
+    filename = os.path.join(libdir, 'warnings.py')
+    patch_module(
+        filename,
+        r'^( +)lineno = frame\.f_lineno$',
+        '\\1import pyrun_linetables\n'
+        '\\1lineno = pyrun_linetables.frame_lineno(frame)')
+    patch_module(
+        filename,
+        r'^( +)globals, source\)$',
+        '\\1None, source)')
+    patch_module(
+        filename,
+        r'(^try:\n    from _warnings import \(filters, .*?'
+        r'^    _warnings_defaults = False\n)',
+        '_pyrun_warn = warn # eGenix PyRun\n'
+        '\\1'
+        '\n'
+        '# eGenix PyRun: The C warn() only sees the stub line tables of the\n'
+        '# frozen modules, if these were stripped at freeze time\n'
+        'import _imp\n'
+        "if _imp.is_frozen('pyrun_linetables_data'):\n"
+        '    warn = _pyrun_warn\n'
+        'del _imp, _pyrun_warn\n',
+        flags=re.MULTILINE | re.DOTALL,
+        marker='_pyrun_warn')
+
+def patch_logging_py(libdir=LIBDIR):
+
+    """ Patch logging package.
+
+        We make Logger.findCaller() use the line tables stripped at
+        freeze time for the line number of log records (see
+        pyrun_linetables).
+
+    """
+    patch_module(
+        os.path.join(libdir, 'logging', '__init__.py'),
+        r'^( +)return co\.co_filename, f\.f_lineno, co\.co_name, sinfo$',
+        '\\1import pyrun_linetables\n'
+        '\\1return (co.co_filename, pyrun_linetables.frame_lineno(f),\n'
+        '\\1        co.co_name, sinfo)')
+
+def patch_re_py(libdir=LIBDIR):
+
+    """ Patch re module.
+
+        We look up patterns missing from the cache in the patterns
+        precompiled at freeze time (see pyrun_re_cache).
+
+    """
+    if PY311GE:
+        filename = os.path.join(libdir, 're', '__init__.py')
+    else:
+        filename = os.path.join(libdir, 're.py')
+    patch_module(
+        filename,
+        r'^( +)p = (sre_compile|_compiler)\.compile\(pattern, flags\)$',
+        '\\1import pyrun_re_cache\n'
+        '\\1p = pyrun_re_cache.compile(pattern, flags)\n'
+        '\\1if p is None:\n'
+        '\\1    p = \\2.compile(pattern, flags)',
+        marker='pyrun_re_cache')
+
+def patch_code_positions(filename):
+
+    """ Patch the code position lookup helper _get_code_position() in
+        module file filename to use pyrun_linetables.restored_code().
+
+    """
+    patch_module(
+        filename,
+        r'^( +)positions_gen = code\.co_positions\(\)$',
+        '\\1import pyrun_linetables\n'
+        '\\1code = pyrun_linetables.restored_code(code)\n'
+        '\\1positions_gen = code.co_positions()',
+        marker='pyrun_linetables.restored_code')
 
 # This is no longer needed for Python 3.10+, since we're no longer
 # including lib2to3 in PyRun.
@@ -574,34 +950,27 @@ def create_pyrun_config_py(inputfile='pyrun_config_template.py',
     template = f.read()
     f.close()
 
-    # Build config vars and replace any occurrence of the PREFIX dir
-    # with a variable "prefix"
-    variable_list = sorted(config_vars().items())
-    repr_list = []
-    for name, value in variable_list:
+    # Build config vars; values containing the PREFIX dir are stored
+    # as list of the parts around it and joined with the runtime prefix
+    # when loading the config vars (see pyrun_config_template.py)
+    values = {}
+    prefixed = {}
+    for name, value in config_vars().items():
         if not isinstance(value, str):
-            repr_list.append('%r: %r,' % (name, value))
-        elif value.startswith(PREFIX) and PREFIX not in value[1:]:
-            value = value[len(PREFIX):]
-            if value:
-                repr_list.append('%r: prefix + %r,' % (name, value))
-            else:
-                repr_list.append('%r: prefix,' % name)
+            pass
         elif PREFIX in value:
-            value = value.replace('%', '%%').replace(PREFIX, '%(prefix)s')
-            repr_list.append('%r: %r %% globals(),' % (name, value))
+            prefixed[name] = value.split(PREFIX)
+            continue
         elif value.startswith(BUILDDIR):
             # Since the pyrun build dir will most likely not be
             # available at runtime, we point the settings to a most
             # likely non-existing directory.
             value = '/pyrun-build-dir' + value[len(BUILDDIR):]
-            repr_list.append('%r: %r, # dir does not exist' % (name, value))
         elif name == 'userbase':
-            repr_list.append("%r: '', # userbase is not supported by pyrun" %
-                             name)
-        else:
-            repr_list.append('%r: %r,' % (name, value))
-
+            # userbase is not supported by pyrun
+            value = ''
+        values[name] = value
+    config_data = marshal.dumps((values, prefixed))
 
     # Build list of included lib2to3 fixers
     if not PY310GE:
@@ -615,7 +984,7 @@ def create_pyrun_config_py(inputfile='pyrun_config_template.py',
     print('Creating module %s' % outputfile)
     f = open(outputfile, 'w', encoding=ENCODING)
     f.write(format_template(template,
-                            config='\n    '.join(repr_list),
+                            config=repr(config_data),
                             pyrun=pyrun_name,
                             version=pyrun_version,
                             libversion='.'.join(pyrun_version.split('.')[:2]),
@@ -683,6 +1052,12 @@ def main(pyrunfile='pyrun.py',
          libdir=LIBDIR,
          setupfile=SETUPFILE):
 
+    global _compile_queue
+
+    # Defer byte compiling the created and patched modules, so that
+    # they can be compiled in parallel
+    _compile_queue = []
+
     # Create pyrun.py script
     create_pyrun_py(inputfile='pyrun_template.py',
                     outputfile=pyrunfile,
@@ -712,11 +1087,45 @@ def main(pyrunfile='pyrun.py',
     # Patch ssl module
     patch_ssl_py(libdir)
 
+    # Patch the HTTPS clients using the shared default HTTPS context
+    if PY3:
+        patch_http_client_py(libdir)
+        if PY312GE:
+            patch_urllib_request_py(libdir)
+
+    # Patch inspect and pydoc modules
+    if PY3:
+        patch_inspect_py(libdir)
+        if PY39GE:
+            patch_pydoc_py(libdir)
+
+    # Patch traceback, warnings and logging modules
+    if PY311GE:
+        patch_traceback_py(libdir)
+        patch_warnings_py(libdir)
+        patch_logging_py(libdir)
+
+    # Patch re module
+    if PY3:
+        patch_re_py(libdir)
+
     # Patch lib2to3.pygram
     if not PY310GE:
         # Only supported in Python 2 builds of PyRun
         patch_lib2to3_pygram(libdir)
 
+    # Compile the queued modules
+    filenames = sorted(set(_compile_queue))
+    _compile_queue = None
+    compile_modules(filenames)
+
 if __name__ == '__main__':
-    main(*sys.argv[1:])
+    if sys.argv[1:2] == ['--compile']:
+        # Byte compile an installed lib dir tree
+        compile_tree(sys.argv[2])
+    elif sys.argv[1:2] == ['--sidecar']:
+        # Create the sidecar lib dir for tree-shaken builds
+        create_sidecar_lib(sys.argv[2])
+    else:
+        main(*sys.argv[1:])
 
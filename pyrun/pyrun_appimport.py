@@ -0,0 +1,725 @@
+""" eGenix PyRun app payload importer
+
+    This module provides an importer for the ZIP payload appended to
+    the pyrun binary in app mode.
+
+    Unlike zipimport, the importer maps the executable into memory
+    once (using mmap), uses a prebuilt name -> offset index stored in
+    the payload (if available) instead of parsing the central
+    directory, and unmarshals stored (uncompressed) .pyc members
+    directly from the mapped memory, without first copying them into
+    bytes objects.
+
+    Plain ZIP files are supported as well. Deflated members are
+    decompressed using zlib and source members get compiled on the
+    fly, just like zipimport does it.
+
+    The index can be added to a ZIP file using write_index() or
+    "pyrun -m pyrun_appimport <zipfile>", before or after appending
+    the ZIP file to the pyrun binary.
+
+    C extension modules stored in the payload can be loaded using
+    load_extension(). The shared library gets written to an anonymous
+    memory file (memfd_create()) and loaded from there. If this is not
+    possible, the library is extracted to a content addressed cache
+    directory and reused from there in subsequent runs:
+
+    PYRUN_MEMFD=0              - don't use memfd_create()
+    PYRUN_EXTCACHE=<dir>       - cache directory to use; defaults to
+                                 $XDG_CACHE_HOME/pyrun/extensions or
+                                 ~/.cache/pyrun/extensions
+
+    Only available for Python 3.
+
+"""
+import sys
+import os
+import marshal
+import _imp
+import _frozen_importlib as _bootstrap
+import _frozen_importlib_external as _bootstrap_external
+
+### Globals
+
+# Name of the ZIP member holding the prebuilt index
+INDEX_MEMBER = '__pyrun_index__'
+
+# ZIP archive comment prefix pointing to the index member
+INDEX_COMMENT_PREFIX = b'pyrun-index:'
+
+# Version of the index format
+INDEX_VERSION = 1
+
+# ZIP compression methods
+STORED = 0
+DEFLATED = 8
+
+# ZIP structures
+_EOCD_SIGNATURE = b'PK\x05\x06'
+_EOCD_SIZE = 22
+_CDIR_SIGNATURE = b'PK\x01\x02'
+_CDIR_SIZE = 46
+_LOCAL_SIGNATURE = b'PK\x03\x04'
+_LOCAL_SIZE = 30
+_MAX_COMMENT_SIZE = 65535
+
+# Byte code magic
+MAGIC = _bootstrap_external.MAGIC_NUMBER
+
+# Member suffixes searched for a module: (suffix, is_package)
+_SEARCH_ORDER = (
+    ('/__init__.pyc', True),
+    ('/__init__.py', True),
+    ('.pyc', False),
+    ('.py', False),
+    )
+
+# Opened payloads: path -> Payload
+_payloads = {}
+
+# Use memfd_create() for loading extension modules ?
+use_memfd = int(os.environ.get('PYRUN_MEMFD', 1))
+
+# Open memfd file descriptors used for extension modules; these have
+# to be kept open, since the dynamic linker identifies already loaded
+# libraries by path
+_memfds = []
+
+### Errors
+
+class PayloadError(ImportError):
+
+    """ The payload could not be opened or is not supported.
+
+    """
+    pass
+
+### Helpers
+
+def _u16(data, pos):
+
+    return data[pos] | (data[pos + 1] << 8)
+
+def _u32(data, pos):
+
+    return (data[pos] | (data[pos + 1] << 8) |
+            (data[pos + 2] << 16) | (data[pos + 3] << 24))
+
+def _dos_to_unix(dostime):
+
+    """ Convert the combined DOS date/time value dostime into a Unix
+        timestamp, using the same approach as zipimport.
+
+    """
+    import time
+    date = dostime >> 16
+    clock = dostime & 0xFFFF
+    return time.mktime((
+        (date >> 9) + 1980,
+        (date >> 5) & 0xF,
+        date & 0x1F,
+        clock >> 11,
+        (clock >> 5) & 0x3F,
+        (clock & 0x1F) * 2,
+        -1, -1, -1))
+
+def _date_time_to_dos(date_time):
+
+    year, month, day, hour, minute, second = date_time[:6]
+    return ((((year - 1980) << 9) | (month << 5) | day) << 16 |
+            (hour << 11) | (minute << 5) | (second // 2))
+
+def _map_file(path):
+
+    """ Return a read-only buffer with the contents of the file path.
+
+        Uses mmap, if possible, and falls back to reading the file
+        into memory.
+
+    """
+    with open(path, 'rb') as file:
+        try:
+            import mmap
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ImportError, OSError, ValueError):
+            return file.read()
+
+### Payload
+
+class Payload(object):
+
+    """ ZIP payload of a file.
+
+        The file is mapped into memory once and the member index is
+        loaded from the prebuilt index or, if not available or out of
+        date, built by scanning the central directory.
+
+    """
+    # File path
+    path = None
+
+    # Mapped file buffer and a memoryview on it
+    buffer = None
+    data = None
+
+    # Start offset of the ZIP archive in the file
+    base = 0
+
+    # Index: member name -> (data offset, compression method,
+    # compressed size, uncompressed size, DOS date/time); offsets are
+    # relative to base
+    entries = None
+
+    # True, if the prebuilt index was used
+    indexed = False
+
+    # Set of directory names ('pkg/', 'pkg/sub/') in the payload
+    _dirs = None
+
+    def __init__(self, path):
+
+        self.path = path
+        self.buffer = _map_file(path)
+        self.data = memoryview(self.buffer)
+        self.parse()
+
+    def parse(self):
+
+        """ Parse the ZIP structures and build the index.
+
+            Raises a PayloadError in case the payload is not a
+            supported ZIP file.
+
+        """
+        data = self.data
+        size = len(data)
+
+        # Find end of central directory record
+        start = max(0, size - _EOCD_SIZE - _MAX_COMMENT_SIZE)
+        pos = self.buffer.rfind(_EOCD_SIGNATURE, start)
+        if pos < 0 or pos + _EOCD_SIZE > size:
+            raise PayloadError('no ZIP payload found in %r' % self.path)
+        entry_count = _u16(data, pos + 10)
+        cdir_size = _u32(data, pos + 12)
+        cdir_offset = _u32(data, pos + 16)
+        comment_size = _u16(data, pos + 20)
+        if entry_count == 0xFFFF or cdir_offset == 0xFFFFFFFF:
+            raise PayloadError('ZIP64 payloads are not supported')
+
+        # ZIP files appended to the binary have offsets relative to the
+        # start of the ZIP file, so we have to determine where that is
+        cdir_start = pos - cdir_size
+        self.base = base = cdir_start - cdir_offset
+        if cdir_start < 0 or base < 0:
+            raise PayloadError('bad ZIP payload in %r' % self.path)
+
+        comment = bytes(data[pos + _EOCD_SIZE:
+                             pos + _EOCD_SIZE + comment_size])
+        entries = None
+        if comment.startswith(INDEX_COMMENT_PREFIX):
+            entries = self.load_index(comment, cdir_start, entry_count)
+        if entries is None:
+            entries = self.scan(cdir_start, entry_count)
+        else:
+            self.indexed = True
+        self.entries = entries
+
+    def load_index(self, comment, cdir_start, entry_count):
+
+        """ Load the prebuilt index referenced in the ZIP comment.
+
+            Returns None, if the index is not usable, e.g. because the
+            ZIP file was changed after having written the index.
+
+        """
+        data = self.data
+        try:
+            header = self.base + int(comment[len(INDEX_COMMENT_PREFIX):])
+            if data[header:header + 4] != _LOCAL_SIGNATURE:
+                return None
+            method = _u16(data, header + 8)
+            compressed_size = _u32(data, header + 18)
+            start = (header + _LOCAL_SIZE +
+                     _u16(data, header + 26) + _u16(data, header + 28))
+            # The index has to be the last member, directly in front of
+            # the central directory
+            if method != STORED or start + compressed_size != cdir_start:
+                return None
+            index = marshal.loads(data[start:start + compressed_size])
+            if (index['version'] != INDEX_VERSION or
+                index['count'] != entry_count):
+                return None
+            return index['entries']
+        except (ValueError, TypeError, KeyError, EOFError, IndexError):
+            return None
+
+    def scan(self, cdir_start, entry_count):
+
+        """ Build the index by scanning the central directory.
+
+        """
+        data = self.data
+        base = self.base
+        entries = {}
+        pos = cdir_start
+        for i in range(entry_count):
+            if data[pos:pos + 4] != _CDIR_SIGNATURE:
+                raise PayloadError('bad central directory in %r' % self.path)
+            flags = _u16(data, pos + 8)
+            method = _u16(data, pos + 10)
+            dostime = (_u16(data, pos + 14) << 16) | _u16(data, pos + 12)
+            compressed_size = _u32(data, pos + 20)
+            size = _u32(data, pos + 24)
+            name_size = _u16(data, pos + 28)
+            header_offset = _u32(data, pos + 42)
+            raw_name = bytes(data[pos + _CDIR_SIZE:
+                                  pos + _CDIR_SIZE + name_size])
+            pos += (_CDIR_SIZE + name_size +
+                    _u16(data, pos + 30) + _u16(data, pos + 32))
+            if flags & 0x800:
+                name = raw_name.decode('utf-8')
+            else:
+                try:
+                    name = raw_name.decode('ascii')
+                except UnicodeDecodeError:
+                    name = raw_name.decode('cp437')
+
+            # Find the member data
+            header = base + header_offset
+            if data[header:header + 4] != _LOCAL_SIGNATURE:
+                raise PayloadError('bad local header for %r in %r' %
+                                   (name, self.path))
+            start = (header + _LOCAL_SIZE +
+                     _u16(data, header + 26) + _u16(data, header + 28))
+            entries[name] = (start - base, method,
+                             compressed_size, size, dostime)
+        return entries
+
+    @property
+    def dirs(self):
+
+        """ Set of directory names in the payload, including the
+            trailing slash.
+
+        """
+        dirs = self._dirs
+        if dirs is None:
+            dirs = set()
+            for name in self.entries:
+                pos = name.rfind('/')
+                while pos > 0:
+                    dirname = name[:pos + 1]
+                    if dirname in dirs:
+                        break
+                    dirs.add(dirname)
+                    pos = name.rfind('/', 0, pos)
+            self._dirs = dirs
+        return dirs
+
+    def read(self, name):
+
+        """ Return the data of the member name.
+
+            Stored members are returned as memoryview on the mapped
+            file, without copying the data.
+
+        """
+        start, method, compressed_size, size, dostime = self.entries[name]
+        start += self.base
+        raw = self.data[start:start + compressed_size]
+        if method == STORED:
+            return raw
+        elif method == DEFLATED:
+            import zlib
+            return zlib.decompress(raw, -15, size)
+        raise PayloadError('unsupported compression method %i for %r' %
+                           (method, name))
+
+### Importer
+
+class PayloadImporter(object):
+
+    """ Finder and loader for modules in a Payload.
+
+        prefix gives the directory inside the payload to search,
+        e.g. 'lib/'.
+
+    """
+    def __init__(self, payload, prefix=''):
+
+        self.payload = payload
+        self.archive = payload.path
+        self.prefix = prefix
+
+    def __repr__(self):
+
+        return '<%s for %r>' % (
+            self.__class__.__name__,
+            os.path.join(self.archive, self.prefix))
+
+    def _module_path(self, fullname):
+
+        return self.prefix + fullname.rpartition('.')[2]
+
+    def _find(self, fullname):
+
+        """ Return (member name, is_package) for the module fullname.
+
+            member name is None, if the module is not available.
+
+        """
+        path = self._module_path(fullname)
+        entries = self.payload.entries
+        for suffix, is_package in _SEARCH_ORDER:
+            name = path + suffix
+            if name in entries:
+                return name, is_package
+        return None, False
+
+    def _file_path(self, name):
+
+        return self.archive + os.sep + name.replace('/', os.sep)
+
+    def _unmarshal(self, name, fullname):
+
+        """ Return the code object of the .pyc member name, or None in
+            case the byte code cannot be used.
+
+        """
+        payload = self.payload
+        data = payload.read(name)
+        if len(data) < 16 or data[:4] != MAGIC:
+            return None
+        flags = _u32(data, 4)
+        if flags & ~0b11:
+            return None
+        source_entry = payload.entries.get(name[:-1], None)
+        if source_entry is not None:
+            if flags == 0:
+                # Timestamp based .pyc: compare with the mtime and
+                # size of the source member, allowing for the DOS time
+                # resolution
+                mtime = _dos_to_unix(source_entry[4])
+                if (abs(_u32(data, 8) - mtime) > 1 or
+                    _u32(data, 12) != source_entry[3] & 0xFFFFFFFF):
+                    return None
+            elif (flags & 0b10 and
+                  _imp.check_hash_based_pycs != 'never'):
+                # Checked hash based .pyc
+                source = bytes(payload.read(name[:-1]))
+                source_hash = _imp.source_hash(
+                    _bootstrap_external._RAW_MAGIC_NUMBER, source)
+                if data[8:16] != source_hash:
+                    return None
+        return marshal.loads(data[16:])
+
+    def _compile_source(self, name, fullname):
+
+        source = bytes(self.payload.read(name))
+        source = source.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+        return compile(source, self._file_path(name), 'exec',
+                       dont_inherit=True)
+
+    # Finder API
+
+    def find_spec(self, fullname, target=None):
+
+        name, is_package = self._find(fullname)
+        if name is not None:
+            return _bootstrap.spec_from_loader(fullname, self,
+                                               is_package=is_package)
+        # Namespace package portion ?
+        path = self._module_path(fullname)
+        if path + '/' in self.payload.dirs:
+            spec = _bootstrap.ModuleSpec(fullname, None, is_package=True)
+            spec.submodule_search_locations.append(self._file_path(path))
+            return spec
+        return None
+
+    def invalidate_caches(self):
+
+        pass
+
+    # Loader API
+
+    def create_module(self, spec):
+
+        return None
+
+    def exec_module(self, module):
+
+        code = self.get_code(module.__spec__.name)
+        exec(code, module.__dict__)
+
+    def load_module(self, fullname):
+
+        return _bootstrap._load_module_shim(self, fullname)
+
+    def get_code(self, fullname):
+
+        name, is_package = self._find(fullname)
+        if name is None:
+            raise ImportError("can't find module %r" % fullname,
+                              name=fullname)
+        if name.endswith('.pyc'):
+            code = self._unmarshal(name, fullname)
+            if code is not None:
+                return code
+            # Fall back to the source member
+            name = name[:-1]
+            if name not in self.payload.entries:
+                raise ImportError('bad byte code for module %r' % fullname,
+                                  name=fullname)
+        return self._compile_source(name, fullname)
+
+    def get_source(self, fullname):
+
+        name, is_package = self._find(fullname)
+        if name is None:
+            raise ImportError("can't find module %r" % fullname,
+                              name=fullname)
+        if name.endswith('.pyc'):
+            name = name[:-1]
+            if name not in self.payload.entries:
+                return None
+        return _bootstrap_external.decode_source(
+            bytes(self.payload.read(name)))
+
+    def is_package(self, fullname):
+
+        name, is_package = self._find(fullname)
+        if name is None:
+            raise ImportError("can't find module %r" % fullname,
+                              name=fullname)
+        return is_package
+
+    def get_filename(self, fullname):
+
+        name, is_package = self._find(fullname)
+        if name is None:
+            raise ImportError("can't find module %r" % fullname,
+                              name=fullname)
+        return self._file_path(name)
+
+    def get_data(self, pathname):
+
+        """ Return the data of the member pathname as bytes.
+
+            pathname may be given relative to the payload or as path
+            including the executable path.
+
+        """
+        key = pathname
+        if key.startswith(self.archive + os.sep):
+            key = key[len(self.archive) + 1:]
+        key = key.replace(os.sep, '/')
+        if key not in self.payload.entries:
+            raise OSError(0, '', key)
+        return bytes(self.payload.read(key))
+
+### Path hook
+
+def path_hook(path):
+
+    """ sys.path_hooks entry for paths pointing to opened payloads or
+        directories inside them.
+
+    """
+    for archive, payload in _payloads.items():
+        if path == archive:
+            return PayloadImporter(payload)
+        if path.startswith(archive + os.sep):
+            prefix = path[len(archive) + 1:].replace(os.sep, '/')
+            if not prefix.endswith('/'):
+                prefix += '/'
+            if prefix not in payload.dirs:
+                raise ImportError('%r not found in payload' % prefix,
+                                  path=path)
+            return PayloadImporter(payload, prefix)
+    raise ImportError('not a pyrun app payload', path=path)
+
+### APIs
+
+def install(path=None):
+
+    """ Open the payload of path (defaults to sys.executable) and
+        register the path hook for it.
+
+        Returns a PayloadImporter for the payload root, or None in
+        case the payload cannot be used. zipimport should then be
+        used instead.
+
+    """
+    if path is None:
+        path = sys.executable
+    payload = _payloads.get(path, None)
+    if payload is None:
+        try:
+            payload = Payload(path)
+        except (OSError, ValueError, PayloadError):
+            return None
+        _payloads[path] = payload
+    if path_hook not in sys.path_hooks:
+        sys.path_hooks.insert(0, path_hook)
+    # Remove cached finders for the payload (e.g. zipimporters)
+    for entry in list(sys.path_importer_cache):
+        if entry == path or entry.startswith(path + os.sep):
+            del sys.path_importer_cache[entry]
+    return PayloadImporter(payload)
+
+### Extension modules
+
+def extension_cache_dir():
+
+    """ Return the directory to use for caching extension modules
+        extracted from payloads.
+
+    """
+    cache_dir = os.environ.get('PYRUN_EXTCACHE', None)
+    if cache_dir:
+        return cache_dir
+    cache_home = (os.environ.get('XDG_CACHE_HOME', None) or
+                  os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(cache_home, 'pyrun', 'extensions')
+
+def _memfd_path(data, filename):
+
+    """ Write data to an anonymous memory file and return a path which
+        can be used for loading it.
+
+        Raises an OSError in case this is not supported.
+
+    """
+    if not hasattr(os, 'memfd_create'):
+        raise OSError('memfd_create() not available')
+    fd = os.memfd_create(os.path.basename(filename), os.MFD_CLOEXEC)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+        path = '/proc/self/fd/%i' % fd
+        if not os.path.exists(path):
+            raise OSError('/proc file system not available')
+    except BaseException:
+        os.close(fd)
+        raise
+    _memfds.append(fd)
+    return path
+
+def _cache_path(data, filename):
+
+    """ Return the path of the extension module data in the extension
+        cache, writing it to the cache, if needed.
+
+    """
+    import hashlib
+    cache_dir = extension_cache_dir()
+    path = os.path.join(cache_dir, '%s-%s' % (
+        hashlib.sha256(data).hexdigest()[:32],
+        os.path.basename(filename)))
+    try:
+        stat = os.stat(path)
+    except OSError:
+        pass
+    else:
+        # Only use files we own and which are complete
+        if stat.st_uid == os.getuid() and stat.st_size == len(data):
+            return path
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir, 0o700)
+    temp_path = '%s.%i.tmp' % (path, os.getpid())
+    with open(temp_path, 'wb') as file:
+        file.write(data)
+    os.chmod(temp_path, 0o500)
+    os.replace(temp_path, path)
+    return path
+
+def _load_dynamic(fullname, path):
+
+    loader = _bootstrap_external.ExtensionFileLoader(fullname, path)
+    spec = _bootstrap.spec_from_loader(fullname, loader)
+    module = _bootstrap.module_from_spec(spec)
+    loader.exec_module(module)
+    return module
+
+def load_extension(fullname, data, filename):
+
+    """ Load the C extension module fullname from the shared library
+        data and return the module object.
+
+        filename is the name of the shared library in the payload. It
+        is used for naming the memory file or cache file and set as
+        __file__ of the module.
+
+        The module is registered in sys.modules.
+
+    """
+    module = None
+    if use_memfd:
+        try:
+            module = _load_dynamic(fullname, _memfd_path(data, filename))
+        except (OSError, ImportError):
+            # memfd_create() may not be available or loading from the
+            # memory file may be blocked by security policies
+            module = None
+    if module is None:
+        module = _load_dynamic(fullname, _cache_path(data, filename))
+    module.__file__ = filename
+    sys.modules[fullname] = module
+    return module
+
+### Index
+
+def write_index(filename):
+
+    """ Add the prebuilt index to the ZIP file filename.
+
+        The ZIP file can be a plain ZIP file or one which was already
+        appended to a pyrun binary. Any changes made to the ZIP file
+        after adding the index will invalidate it, causing the
+        importer to scan the central directory again.
+
+    """
+    import zipfile, struct
+    with zipfile.ZipFile(filename, 'a') as archive:
+        if INDEX_MEMBER in archive.NameToInfo:
+            raise ValueError('%r already has an index' % filename)
+        entries = {}
+        file = archive.fp
+        for info in archive.infolist():
+            file.seek(info.header_offset)
+            header = file.read(_LOCAL_SIZE)
+            if header[:4] != _LOCAL_SIGNATURE:
+                raise zipfile.BadZipFile('bad local header for %r' %
+                                         info.filename)
+            name_size, extra_size = struct.unpack('<HH', header[26:30])
+            entries[info.filename] = (
+                info.header_offset + _LOCAL_SIZE + name_size + extra_size,
+                info.compress_type,
+                info.compress_size,
+                info.file_size,
+                _date_time_to_dos(info.date_time))
+        index = marshal.dumps({
+            'version': INDEX_VERSION,
+            'count': len(entries) + 1,
+            'entries': entries,
+            })
+        # zipfile writes offsets relative to the start of the file
+        # (for appended ZIP files, it adjusts them accordingly), so we
+        # can use the plain values
+        index_offset = archive.start_dir
+        info = zipfile.ZipInfo(INDEX_MEMBER,
+                               date_time=(1980, 1, 1, 0, 0, 0))
+        info.compress_type = zipfile.ZIP_STORED
+        archive.writestr(info, index)
+        archive.comment = INDEX_COMMENT_PREFIX + b'%i' % index_offset
+
+###
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.stderr.write('usage: pyrun -m pyrun_appimport <zipfile> ...\n')
+        sys.exit(1)
+    for filename in sys.argv[1:]:
+        write_index(filename)
+        print('Added index to %s' % filename)
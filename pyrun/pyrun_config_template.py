@@ -17,7 +17,8 @@ import os
 # * pyrun    - name of the pyrun executable
 # * version  - version of the pyrun executable (the supported Python version)
 # * release  - pyrun release version
-# * config   - repr() dict list of sysconfig configuration variables
+# * config   - repr() of the marshal data of the sysconfig configuration
+#              variables (see create_pyrun_config_py())
 
 ### PyRun Configuration
 
@@ -96,10 +97,31 @@ sys.copyright = pyrun_copyright + sys.copyright
 prefix = pyrun_prefix
 pyrun = pyrun_binary
 
-# Set config vars
-config_vars = {
-    #$config
-}
+# Config vars; these are only needed by sysconfig and packaging tools,
+# so they are stored as compact marshal data and only turned into the
+# config_vars dictionary on first access. The data is a tuple (values,
+# prefixed), where prefixed maps the names of the variables containing
+# the installation prefix to the lists of parts around it.
+_config_data = #$config
+
+def _load_config_vars():
+
+    import marshal
+    values, prefixed = marshal.loads(_config_data)
+    for name, parts in prefixed.items():
+        values[name] = prefix.join(parts)
+    return values
+
+if sys.version_info >= (3, 7):
+    # Create config_vars on first access (PEP 562)
+    def __getattr__(name):
+        if name == 'config_vars':
+            # Use setdefault(), so that all threads get the same dict
+            return globals().setdefault('config_vars', _load_config_vars())
+        raise AttributeError('module %r has no attribute %r' %
+                             (__name__, name))
+else:
+    config_vars = _load_config_vars()
 
 ### Misc configuration data
 
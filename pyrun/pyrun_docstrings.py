@@ -0,0 +1,164 @@
+""" eGenix PyRun lazily loaded docstrings
+
+    When building with PYRUNFREEZELAZYDOCSTRINGS (freeze.py -D), the
+    docstrings are removed from the code objects of the frozen modules,
+    as with -OO, and stored in the frozen module pyrun_docstrings_data
+    instead, one compressed table per module. This keeps the frozen
+    data small and speeds up unmarshalling.
+
+    This module looks up the docstrings on demand. inspect.getdoc() and
+    pydoc (and thus help()) are patched to use getdoc() for objects
+    without __doc__, so they work as usual.
+
+    Code accessing __doc__ directly can use restore() to put the
+    docstrings of a module back into its __doc__ attributes.
+
+    Only available for Python 3.
+
+"""
+import sys
+
+### Globals
+
+# Name of the frozen module holding the docstring tables
+DATA_MODULE = 'pyrun_docstrings_data'
+
+# Loaded docstring tables: module name -> dict(key: docstring)
+_tables = {}
+
+# pyrun_docstrings_data module, None if not available, False if not
+# yet loaded
+_data = False
+
+### Docstring lookup
+
+def data_module():
+
+    """ Return the pyrun_docstrings_data module, or None, if docstrings
+        were not removed at freeze time.
+
+    """
+    global _data
+    if _data is False:
+        try:
+            _data = __import__(DATA_MODULE)
+        except ImportError:
+            _data = None
+    return _data
+
+def docstring_table(modname):
+
+    """ Return the docstring table for module modname.
+
+        The table maps the keys returned by docstring_key() to the
+        docstrings. It's empty, if the module has no removed
+        docstrings.
+
+    """
+    try:
+        return _tables[modname]
+    except (KeyError, TypeError):
+        pass
+    data = data_module()
+    if data is None or not isinstance(modname, str):
+        return {}
+    blob = data.DOCSTRINGS.get(modname)
+    if blob is None:
+        table = {}
+    else:
+        import marshal, zlib
+        table = marshal.loads(zlib.decompress(blob))
+    _tables[modname] = table
+    return table
+
+def docstring_key(obj):
+
+    """ Return the docstring table key for obj, or None, if obj cannot
+        have a removed docstring.
+
+        Has to match makedocstrings.docstring_key() in freeze-3.
+
+    """
+    if isinstance(obj, type(sys)):
+        return ''
+    if isinstance(obj, type):
+        return getattr(obj, '__qualname__', None)
+    code = getattr(obj, '__code__', None)
+    if code is None or not hasattr(code, 'co_firstlineno'):
+        return None
+    # co_qualname is only available in Python 3.11+
+    qualname = (getattr(code, 'co_qualname', None) or
+                getattr(obj, '__qualname__', None))
+    if qualname is None:
+        return None
+    return '%s:%i' % (qualname, code.co_firstlineno)
+
+def getdoc(obj):
+
+    """ Return the docstring removed from obj at freeze time, or None.
+
+        Bound methods, class and static methods and properties are
+        resolved to their functions, decorated functions to the
+        functions they wrap.
+
+    """
+    if data_module() is None:
+        return None
+    for i in range(100):
+        if isinstance(obj, property):
+            obj = obj.fget
+        obj = getattr(obj, '__func__', obj)
+        key = docstring_key(obj)
+        if key is not None:
+            if isinstance(obj, type(sys)):
+                modname = obj.__name__
+            else:
+                modname = getattr(obj, '__module__', None)
+            doc = docstring_table(modname).get(key)
+            if doc is None and key:
+                # The object's __module__ may have been changed, so
+                # also try the module it was defined in
+                filename = getattr(getattr(obj, '__code__', None),
+                                   'co_filename', None)
+                modname = _data.FILES.get(filename)
+                if modname is not None:
+                    doc = docstring_table(modname).get(key)
+            if doc is not None:
+                return doc
+        try:
+            obj = obj.__wrapped__
+        except AttributeError:
+            return None
+    return None
+
+def restore(module):
+
+    """ Restore the removed docstrings of module and of the classes,
+        functions and methods defined in it.
+
+    """
+    modname = module.__name__
+    if not docstring_table(modname):
+        return
+    todo = [module]
+    seen = set()
+    while todo:
+        obj = todo.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        if obj.__doc__ is None:
+            doc = getdoc(obj)
+            if doc is not None:
+                try:
+                    obj.__doc__ = doc
+                except (AttributeError, TypeError):
+                    pass
+        if isinstance(obj, (type(sys), type)):
+            for value in list(vars(obj).values()):
+                if isinstance(value, (classmethod, staticmethod)):
+                    value = value.__func__
+                if (isinstance(value, (type, property)) or
+                    hasattr(value, '__code__')):
+                    if getattr(value, '__module__', modname) == modname:
+                        todo.append(value)
@@ -0,0 +1,302 @@
+""" eGenix PyRun import timing
+
+    This module provides the PyRun equivalent of "python -X importtime".
+
+    It records the time needed for every import (frozen modules, shared
+    modules from lib-dynload and modules loaded from the file system,
+    e.g. site-packages), together with the time spent unmarshalling
+    byte code and the import nesting.
+
+    The import timing can be enabled using "pyrun -X importtime" or
+    by setting the PYRUN_IMPORTTIME env var:
+
+    PYRUN_IMPORTTIME=1           - write an import tree to stderr
+    PYRUN_IMPORTTIME=<filename>  - write the import tree as JSON data to
+                                   <filename> when the process exits
+
+    The env var has the advantage of also covering the imports done by
+    the PyRun startup code.
+
+    Only available for Python 3.
+
+"""
+import sys
+
+### Globals
+
+# Enabled ?
+_enabled = False
+
+# Output: None for stderr, a filename for JSON output
+_output = None
+
+# Stack of currently active ImportRecords
+_stack = []
+
+# Top level ImportRecords
+_roots = []
+
+# Original functions replaced by enable()
+_orig_find_and_load = None
+_orig_get_frozen_object = None
+_orig_compile_bytecode = None
+
+if sys.version_info[0] >= 3:
+    from time import perf_counter as _clock
+else:
+    from time import time as _clock
+
+### Helpers
+
+class ImportRecord(object):
+
+    """ Timing information for a single import.
+
+        All times are in seconds.
+
+    """
+    __slots__ = ('name', 'kind', 'level', 'start', 'cumulative',
+                 'self_time', 'unmarshal', 'children')
+
+    def __init__(self, name, level):
+
+        self.name = name
+        self.kind = 'unknown'
+        self.level = level
+        self.start = 0.0
+        self.cumulative = 0.0
+        self.self_time = 0.0
+        self.unmarshal = 0.0
+        self.children = []
+
+    def as_dict(self):
+
+        """ Return the record (including all children) as dictionary
+            suitable for JSON output. Times are given in microseconds.
+
+        """
+        return {
+            'name': self.name,
+            'kind': self.kind,
+            'self_us': int(self.self_time * 1e6),
+            'cumulative_us': int(self.cumulative * 1e6),
+            'unmarshal_us': int(self.unmarshal * 1e6),
+            'children': [child.as_dict() for child in self.children],
+            }
+
+def module_kind(module):
+
+    """ Return the kind of import used for loading module.
+
+        Possible values are 'frozen', 'builtin', 'dynload' (shared
+        modules), 'source', 'bytecode', 'namespace', 'failed' (module
+        not found in sys.modules) or the loader class name for other
+        loaders.
+
+    """
+    if module is None:
+        return 'failed'
+    spec = getattr(module, '__spec__', None)
+    if spec is None:
+        return 'unknown'
+    loader = spec.loader
+    if loader is None:
+        return 'namespace'
+    import _frozen_importlib as bootstrap
+    import _frozen_importlib_external as bootstrap_external
+    if loader is bootstrap.FrozenImporter:
+        return 'frozen'
+    elif loader is bootstrap.BuiltinImporter:
+        return 'builtin'
+    elif isinstance(loader, bootstrap_external.ExtensionFileLoader):
+        return 'dynload'
+    elif isinstance(loader, bootstrap_external.SourceFileLoader):
+        return 'source'
+    elif isinstance(loader, bootstrap_external.SourcelessFileLoader):
+        return 'bytecode'
+    elif isinstance(loader, type):
+        return loader.__name__
+    return loader.__class__.__name__
+
+def _write_stderr_header():
+
+    sys.stderr.write(
+        'import time: self [us] | cumulative | unmarshal | kind     '
+        '| imported package\n')
+
+def _write_stderr_record(record):
+
+    sys.stderr.write(
+        'import time: %9i | %10i | %9i | %-8s | %s%s\n' % (
+            record.self_time * 1e6,
+            record.cumulative * 1e6,
+            record.unmarshal * 1e6,
+            record.kind,
+            '  ' * record.level,
+            record.name))
+
+def _add_unmarshal_time(duration):
+
+    if _stack:
+        _stack[-1].unmarshal += duration
+
+### Import hooks
+
+def _timed_find_and_load(name, import_):
+
+    """ Replacement for importlib._bootstrap._find_and_load(), which
+        is used by the import machinery to find and load modules not
+        found in sys.modules.
+
+    """
+    record = ImportRecord(name, len(_stack))
+    _stack.append(record)
+    record.start = _clock()
+    try:
+        return _orig_find_and_load(name, import_)
+    finally:
+        record.cumulative = _clock() - record.start
+        _stack.pop()
+        record.self_time = record.cumulative - sum(
+            child.cumulative for child in record.children)
+        record.kind = module_kind(sys.modules.get(name, None))
+        if _stack:
+            _stack[-1].children.append(record)
+        else:
+            _roots.append(record)
+        if _output is None:
+            _write_stderr_record(record)
+
+def _timed_get_frozen_object(*args, **kws):
+
+    """ Replacement for _imp.get_frozen_object(), which is used by
+        the FrozenImporter to unmarshal the frozen byte code.
+
+    """
+    start = _clock()
+    try:
+        return _orig_get_frozen_object(*args, **kws)
+    finally:
+        _add_unmarshal_time(_clock() - start)
+
+def _timed_compile_bytecode(*args, **kws):
+
+    """ Replacement for importlib._bootstrap_external._compile_bytecode(),
+        which is used by the file system loaders to unmarshal
+        byte code read from .pyc files.
+
+    """
+    start = _clock()
+    try:
+        return _orig_compile_bytecode(*args, **kws)
+    finally:
+        _add_unmarshal_time(_clock() - start)
+
+### APIs
+
+def enable(output=None):
+
+    """ Enable import timing.
+
+        output may be None to have the import tree written to stderr
+        as imports complete (using the same format as "python -X
+        importtime", with additional unmarshal and kind columns), or
+        a filename to have the import tree written as JSON data when
+        the process exits.
+
+    """
+    global _enabled, _output
+    global _orig_find_and_load, _orig_get_frozen_object
+    global _orig_compile_bytecode
+
+    if _enabled:
+        _output = output
+        return
+    if sys.version_info[0] < 3:
+        raise NotImplementedError(
+            'import timing is only available for Python 3')
+    import _imp
+    import _frozen_importlib as bootstrap
+    import _frozen_importlib_external as bootstrap_external
+
+    _output = output
+    if _output is None:
+        _write_stderr_header()
+    else:
+        import atexit
+        atexit.register(write_json)
+    _orig_find_and_load = bootstrap._find_and_load
+    _orig_get_frozen_object = _imp.get_frozen_object
+    _orig_compile_bytecode = bootstrap_external._compile_bytecode
+    bootstrap._find_and_load = _timed_find_and_load
+    _imp.get_frozen_object = _timed_get_frozen_object
+    bootstrap_external._compile_bytecode = _timed_compile_bytecode
+    _enabled = True
+
+def disable():
+
+    """ Disable import timing again.
+
+        The already recorded data remains available via
+        import_tree().
+
+    """
+    global _enabled
+
+    if not _enabled:
+        return
+    import _imp
+    import _frozen_importlib as bootstrap
+    import _frozen_importlib_external as bootstrap_external
+
+    bootstrap._find_and_load = _orig_find_and_load
+    _imp.get_frozen_object = _orig_get_frozen_object
+    bootstrap_external._compile_bytecode = _orig_compile_bytecode
+    _enabled = False
+
+def enable_from_env(value):
+
+    """ Enable import timing based on the PYRUN_IMPORTTIME env var
+        value.
+
+        Empty values and '0' don't enable the import timing, '1'
+        writes to stderr, all other values are used as JSON output
+        filename.
+
+    """
+    if not value or value == '0':
+        return
+    elif value == '1':
+        enable()
+    else:
+        enable(value)
+
+def import_tree():
+
+    """ Return the recorded top level ImportRecords.
+
+    """
+    return _roots[:]
+
+def write_json(filename=None):
+
+    """ Write the recorded import tree as JSON data to filename.
+
+        filename defaults to the output set by enable().
+
+    """
+    if filename is None:
+        filename = _output
+    # Stop recording, so that imports needed for writing don't show
+    # up in the data
+    disable()
+    import json
+    data = {
+        'executable': sys.executable,
+        'argv': sys.argv,
+        'version': sys.version,
+        'total_us': int(sum(record.cumulative for record in _roots) * 1e6),
+        'imports': [record.as_dict() for record in _roots],
+        }
+    with open(filename, 'w') as file:
+        json.dump(data, file, indent=1)
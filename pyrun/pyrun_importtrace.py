@@ -0,0 +1,147 @@
+""" eGenix PyRun import tracing and sidecar stdlib support
+
+    This module provides the runtime support for application specific,
+    tree-shaken PyRun builds, which only include the stdlib modules an
+    application actually uses.
+
+    Setting the PYRUN_IMPORTTRACE env var to a filename makes pyrun
+    append the names of all modules imported by the process to that
+    file (the import manifest), one per line and in import order, when
+    the process exits:
+
+    PYRUN_IMPORTTRACE=app.imports pyrun app.py
+
+    Manifests collected from several runs can then be passed to the
+    build via PYRUNIMPORTMANIFESTS in the Makefile. The build freezes
+    only the stdlib modules listed in the manifests, plus the modules
+    they depend on, and installs the complete stdlib into the sidecar
+    lib dir lib/pythonX.Y/pyrun-stdlib. If an application imports a
+    stdlib module which is not frozen, it's loaded from there instead
+    (see SidecarFinder).
+
+    Since the modules are listed in import order, manifests can also be
+    used as layout profile for the frozen module data (see
+    PYRUNFREEZELAYOUT in the Makefile).
+
+    Only available for Python 3.
+
+"""
+import sys
+import os
+
+### Globals
+
+# Name of the sidecar lib dir inside lib/pythonX.Y
+SIDECAR_DIR = 'pyrun-stdlib'
+
+# Manifest file to write, set by enable()
+_output = None
+
+# Installed SidecarFinder, set by install_sidecar()
+_sidecar_finder = None
+
+### Import tracing
+
+def traced_modules():
+
+    """ Return a list of the names of all modules imported by the
+        process so far, in import order.
+
+    """
+    return [name
+            for name in list(sys.modules)
+            if name != '__main__' and not name.startswith('__mp_')]
+
+def write_manifest(filename=None):
+
+    """ Append the names of the imported modules to the manifest
+        filename.
+
+        filename defaults to the file passed to enable().
+
+    """
+    if filename is None:
+        filename = _output
+    data = ''.join('%s\n' % name for name in traced_modules())
+    # Use a single write in append mode, so that several processes can
+    # write to the same manifest
+    fd = os.open(filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, data.encode('utf-8'))
+    finally:
+        os.close(fd)
+
+def enable(filename):
+
+    """ Enable import tracing; the manifest is written to filename
+        when the process exits.
+
+    """
+    global _output
+    import atexit
+    if _output is None:
+        atexit.register(write_manifest)
+    _output = os.path.abspath(filename)
+
+def read_manifests(filenames):
+
+    """ Return the set of module names listed in the manifests
+        filenames.
+
+        Empty lines and lines starting with '#' are ignored.
+
+    """
+    modules = set()
+    for filename in filenames:
+        with open(filename) as file:
+            for line in file:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    modules.add(line)
+    return modules
+
+### Sidecar lib dir
+
+class SidecarFinder(object):
+
+    """ Meta path finder loading modules from the sidecar lib dir.
+
+        This is used as last resort: modules are looked up in the
+        directory corresponding to their package in the sidecar dir,
+        regardless of the package's __path__, so that submodules of
+        frozen packages can be found as well.
+
+    """
+    def __init__(self, path):
+
+        self.path = path
+
+    def find_spec(self, fullname, path=None, target=None):
+
+        from importlib.machinery import PathFinder
+        parts = fullname.split('.')
+        dir = os.path.join(self.path, *parts[:-1])
+        return PathFinder.find_spec(fullname, [dir])
+
+    def invalidate_caches(self):
+
+        pass
+
+def sidecar_dir(python_lib):
+
+    """ Return the sidecar lib dir for the PyRun lib dir python_lib.
+
+    """
+    return os.path.join(python_lib, SIDECAR_DIR)
+
+def install_sidecar(path):
+
+    """ Install a SidecarFinder for the sidecar lib dir path at the end
+        of sys.meta_path.
+
+    """
+    global _sidecar_finder
+    if _sidecar_finder is not None:
+        return
+    _sidecar_finder = SidecarFinder(path)
+    sys.meta_path.append(_sidecar_finder)
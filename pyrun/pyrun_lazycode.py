@@ -0,0 +1,180 @@
+""" eGenix PyRun lazily unmarshalled function bodies
+
+    When building with PYRUNFREEZELAZYCODE (freeze.py -Z), the code
+    objects of the larger module and class level functions of the
+    frozen modules are replaced with small stub code objects and the
+    original code objects are stored in the frozen data of the module
+    pyrun_lazycode_data. Importing a module then only has to create the
+    stubs, instead of the code objects, their names, constants and
+    tables, most of which are never used in a given process.
+
+    The stubs have the same name, signature, docstring, flags and first
+    line number as the original code. On the first call, a stub calls
+    load(), which unmarshals the original code object directly from the
+    frozen data in the binary and puts it into the function's __code__,
+    and then calls the function with its arguments. Later calls run the
+    original code directly. The stub's frame remains on the stack during
+    the first call; functions looking at the stack are therefore not
+    replaced with stubs.
+
+    Code inspecting func.__code__ of a function, which has not been
+    called yet, sees the stub. Use resolve() to load the original code
+    object explicitly.
+
+    Only available for Python 3.11+.
+
+"""
+import sys
+import gc
+import marshal
+from types import FunctionType, MethodType
+
+### Globals
+
+# Loaded code objects: id(stub code object) -> (stub code object,
+# original code object)
+_loaded = {}
+
+# Constant used in the stubs to mark them as such; has to match
+# makelazycode.STUB_MARKER in freeze-3
+STUB_MARKER = 'pyrun_lazycode'
+
+# Name of the frozen module holding the original code objects
+DATA_MODULE = 'pyrun_lazycode_data'
+
+# Frozen data of DATA_MODULE as memoryview, None if not yet loaded
+_frozen_data = None
+
+### Code loading
+
+def is_stub(code):
+
+    """ Return True, if code is a stub code object.
+
+    """
+    consts = code.co_consts
+    return (len(consts) >= 3 and
+            consts[1] == STUB_MARKER and
+            type(consts[2]) is tuple)
+
+def frozen_data():
+
+    """ Return the frozen data of DATA_MODULE as memoryview.
+
+        This references the data in the binary, so no copy is made.
+
+    """
+    global _frozen_data
+    if _frozen_data is None:
+        import _imp
+        _frozen_data = _imp.find_frozen(DATA_MODULE, withdata=True)[0]
+    return _frozen_data
+
+def original_code(code):
+
+    """ Return the original code object for the stub code object code.
+
+    """
+    entry = _loaded.get(id(code))
+    if entry is not None and entry[0] is code:
+        return entry[1]
+    offset, size = code.co_consts[2]
+    original = marshal.loads(frozen_data()[offset:offset + size])
+    # Code objects compare equal regardless of their file name, so use
+    # the id and keep the stub alive
+    _loaded[id(code)] = (code, original)
+    return original
+
+def find_functions(code, globals, qualname):
+
+    """ Return the list of function objects using the stub code object
+        code.
+
+        The function is first looked up via its qualified name qualname
+        in globals; functions which cannot be found this way (e.g.
+        because they were renamed) are searched via the garbage
+        collector.
+
+    """
+    obj = globals
+    classname = None
+    for name in qualname.split('.'):
+        if classname is not None:
+            # Class namespace; private names are mangled
+            obj = getattr(obj, '__dict__', None)
+            if name.startswith('__') and not name.endswith('__'):
+                name = '_%s%s' % (classname.lstrip('_'), name)
+        try:
+            obj = obj.get(name)
+        except AttributeError:
+            obj = None
+            break
+        classname = name
+    # Unwrap properties, static and class methods, decorated functions
+    # and decorator objects
+    candidates = [obj]
+    seen = set()
+    functions = []
+    while candidates:
+        obj = candidates.pop()
+        if obj is None or id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        if isinstance(obj, FunctionType):
+            if obj.__code__ is code:
+                functions.append(obj)
+            else:
+                candidates.append(obj.__dict__.get('__wrapped__'))
+        elif isinstance(obj, property):
+            candidates.extend((obj.fget, obj.fset, obj.fdel))
+        elif isinstance(obj, (staticmethod, classmethod, MethodType)):
+            candidates.append(obj.__func__)
+        else:
+            # Decorator objects usually keep the function in an instance
+            # attribute or slot
+            for referent in gc.get_referents(obj):
+                if isinstance(referent, dict):
+                    candidates.extend(value
+                                      for value in referent.values()
+                                      if isinstance(value, FunctionType))
+                elif isinstance(referent, FunctionType):
+                    candidates.append(referent)
+    if functions:
+        return functions
+    return [obj
+            for obj in gc.get_referrers(code)
+            if isinstance(obj, FunctionType) and obj.__code__ is code]
+
+def resolve(function):
+
+    """ Replace the stub code object of function with the original code
+        object.
+
+        Does nothing, if function doesn't use a stub code object.
+
+    """
+    code = function.__code__
+    if is_stub(code):
+        function.__code__ = original_code(code)
+
+def load(location, qualname):
+
+    """ Load the original code object of the calling stub and return the
+        function to call instead of the stub.
+
+        This is called by the stub code objects on their first call:
+        location is the (offset, size) tuple of the marshalled original
+        code object in the frozen data, qualname the qualified name of
+        the function.
+
+    """
+    frame = sys._getframe(1)
+    code = frame.f_code
+    original = original_code(code)
+    functions = find_functions(code, frame.f_globals, qualname)
+    for function in functions:
+        function.__code__ = original
+    if functions:
+        return functions[0]
+    # The stub passes all arguments, so defaults are not needed
+    return FunctionType(original, frame.f_globals, code.co_name)
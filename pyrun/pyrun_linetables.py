@@ -0,0 +1,173 @@
+""" eGenix PyRun lazily loaded line number tables
+
+    When building with PYRUNFREEZELAZYLINETABLES (freeze.py -T), the line
+    number tables of the frozen code objects are replaced with short
+    stub tables, which map all instructions to the first line of the
+    function (or class or module), and the original tables are stored
+    in the frozen module pyrun_linetables_data instead. This makes the
+    frozen data smaller and reduces the allocations per import.
+
+    This module restores the original tables on demand. The traceback
+    and inspect modules are patched to use restored_code() when looking
+    up code positions, so tracebacks and inspect.stack() show the
+    correct line numbers. pyrun also uses the traceback module for
+    printing uncaught exceptions in this case. The warnings module
+    then uses its Python version of warn() and logging's
+    Logger.findCaller(), both patched to use frame_lineno(), so
+    warnings and log records show the correct line numbers as well.
+
+    Other uses of frame.f_lineno and traceback.tb_lineno still see the
+    first line of the code object, e.g. warnings issued by C code, pdb
+    and other debuggers and sys.settrace() hooks, which also don't get
+    any line events inside the stubbed code objects. Only the frozen
+    modules are affected. Use frame_lineno() and tb_lineno() to get the
+    correct line numbers.
+
+    Only available for Python 3.11+.
+
+"""
+import sys
+
+### Globals
+
+# Name of the frozen module holding the line tables
+DATA_MODULE = 'pyrun_linetables_data'
+
+# Loaded line tables: source file name -> dict(key: line table)
+_tables = {}
+
+# Restored code objects: id(code object) -> (weak reference to the code
+# object, code object with line table or None, if the line table was not
+# stripped); entries are removed when the code object goes away
+_restored = {}
+
+# pyrun_linetables_data module, None if not available, False if not
+# yet loaded
+_data = False
+
+### Line table lookup
+
+def data_module():
+
+    """ Return the pyrun_linetables_data module, or None, if line tables
+        were not stripped at freeze time.
+
+    """
+    global _data
+    if _data is False:
+        try:
+            _data = __import__(DATA_MODULE)
+        except ImportError:
+            _data = None
+    return _data
+
+def file_linetables(filename):
+
+    """ Return the original line tables of the code objects in source
+        file filename.
+
+        The returned dictionary maps the keys returned by
+        linetable_key() to the line tables. It's empty, if no line
+        tables were stripped for the file.
+
+    """
+    try:
+        return _tables[filename]
+    except KeyError:
+        pass
+    data = data_module()
+    blob = data.LINETABLES.get(filename) if data is not None else None
+    if blob is None:
+        table = {}
+    else:
+        import marshal, zlib
+        table = marshal.loads(zlib.decompress(blob))
+    _tables[filename] = table
+    return table
+
+def linetable_key(code):
+
+    """ Return the line table key for code.
+
+        Has to match makelinetables.linetable_key() in freeze-3.
+
+    """
+    return '%s:%i:%i' % (code.co_qualname, code.co_firstlineno,
+                         len(code.co_code))
+
+def restored_code(code):
+
+    """ Return a copy of code using its original line table, or code
+        itself, if its line table was not stripped.
+
+    """
+    if data_module() is None:
+        return code
+    key = id(code)
+    entry = _restored.get(key)
+    if entry is not None and entry[0]() is code:
+        if entry[1] is None:
+            return code
+        return entry[1]
+    linetable = file_linetables(code.co_filename).get(linetable_key(code))
+    if linetable is None:
+        restored = None
+    else:
+        restored = code.replace(co_linetable=linetable)
+    # Code objects compare equal regardless of their file name, so use
+    # the id and a weak reference, which removes the entry again, so
+    # that code objects created at run time are not kept alive
+    from _weakref import ref
+    _restored[key] = (
+        ref(code, lambda r, key=key, cache=_restored:
+            cache.pop(key, None)),
+        restored)
+    if restored is None:
+        return code
+    return restored
+
+def code_lineno(code, lasti):
+
+    """ Return the line number of the instruction at byte offset lasti
+        in code, or None, if not available.
+
+    """
+    if lasti < 0:
+        return None
+    for start, end, lineno in restored_code(code).co_lines():
+        if start <= lasti < end:
+            return lineno
+    return None
+
+def frame_lineno(frame):
+
+    """ Return the current line number of frame.
+
+    """
+    if data_module() is None:
+        return frame.f_lineno
+    lineno = code_lineno(frame.f_code, frame.f_lasti)
+    if lineno is None:
+        return frame.f_lineno
+    return lineno
+
+def tb_lineno(tb):
+
+    """ Return the line number of the traceback entry tb.
+
+    """
+    if data_module() is None:
+        return tb.tb_lineno
+    lineno = code_lineno(tb.tb_frame.f_code, tb.tb_lasti)
+    if lineno is None:
+        return tb.tb_lineno
+    return lineno
+
+def excepthook(type, value, tb):
+
+    """ sys.excepthook printing the traceback using the traceback
+        module, which shows the restored line numbers.
+
+    """
+    import traceback
+    traceback.print_exception(type, value, tb, file=sys.stderr)
@@ -18,6 +18,46 @@
 
 import sys
 import os
+
+# Enable import timing as early as possible, so that the imports done
+# by the startup code are covered as well (see pyrun_importtime.py)
+if os.environ.get('PYRUN_IMPORTTIME', '0') != '0':
+    import pyrun_importtime
+    pyrun_importtime.enable_from_env(os.environ['PYRUN_IMPORTTIME'])
+
+# Record the imported modules in an import manifest for tree-shaken
+# builds (see pyrun_importtrace.py)
+if os.environ.get('PYRUN_IMPORTTRACE') and sys.version_info[0] >= 3:
+    import pyrun_importtrace
+    pyrun_importtrace.enable(os.environ['PYRUN_IMPORTTRACE'])
+
+# Print uncaught exceptions using the traceback module, if the line
+# tables of the frozen modules were stripped, so that the original line
+# numbers are shown (see pyrun_linetables.py). This is done in a helper,
+# so that no names end up in the script's globals().
+def pyrun_setup_excepthook():
+    import _imp
+    if not _imp.is_frozen('pyrun_linetables_data'):
+        return
+    def excepthook(type, value, tb):
+        import pyrun_linetables
+        pyrun_linetables.excepthook(type, value, tb)
+    sys.excepthook = excepthook
+if sys.version_info >= (3, 11):
+    pyrun_setup_excepthook()
+del pyrun_setup_excepthook
+
+# Hand over to a running pyrun fork server, if available; this does
+# not return if the server accepted the request (see pyrun_server.py).
+# The check is skipped in the server's worker processes and when
+# starting the server.
+if (os.environ.get('PYRUN_SERVER') and
+    sys.version_info[0] >= 3 and
+    'pyrun_server' not in sys.modules and
+    sys.argv[1:3] != ['-m', 'pyrun_server']):
+    import pyrun_server
+    pyrun_server.run_client(os.environ['PYRUN_SERVER'])
+
 import pyrun_config
 from pyrun_config import (
     pyrun_name,
@@ -50,12 +90,18 @@ pyrun_bytecode = False
 pyrun_ignore_environment = False
 pyrun_ignore_pth_files = False
 pyrun_skip_site_main = False
-pyrun_skip_user_site = False
+pyrun_skip_site_user_site = False
 pyrun_safe_path = int(os.environ.get('PYTHONSAFEPATH', 0))
 pyrun_inspect = int(os.environ.get('PYTHONINSPECT', 0))
 pyrun_unbuffered = int(os.environ.get('PYTHONUNBUFFERED', 0))
 pyrun_optimized = int(os.environ.get('PYTHONOPTIMIZE', 0))
 pyrun_dontwritebytecode = False
+pyrun_site_cache = int(os.environ.get('PYRUN_SITECACHE', 1))
+pyrun_app_import = int(os.environ.get('PYRUN_APPIMPORT', 1))
+
+# Site snapshot used by pyrun_setup_sys_path() and pyrun_run_site_main()
+# (see pyrun_load_site_cache())
+pyrun_site_snapshot = None
 
 ### Python 2 vs. 3
 
@@ -69,11 +115,11 @@ if PY3:
     import builtins
     pyrun_exec_code = getattr(builtins, 'exec')
 
-    # Python 3 does not include the execfile() builtin
+    # Python 3 does not include the execfile() builtin; we use a
+    # version which caches the compiled byte code (see
+    # pyrun_compile_script() below)
     def pyrun_exec_code_file(filename, globals_dict, locals_dict=None):
-        with open(filename, 'r', encoding='utf-8') as file:
-            source = file.read()
-        code = compile(source, filename, 'exec', optimize=pyrun_optimized)
+        code = pyrun_compile_script(filename)
         pyrun_exec_code(code, globals_dict, locals_dict)
 
     # Python 3 no longer has raw_input(). Use input() instead
@@ -149,9 +195,14 @@ Available PyRun command line options:
 -V:       print the pyrun version and exit
 -W arg:   add arg as warning filter
 -3:       not implemented; only for compatibility with Python
--X arg:   not implemented; only for compatibility with Python
+-X arg:   implementation specific option; only importtime is supported
 
-Most Python environment variables are supported.
+Most Python environment variables are supported. Set PYRUN_IMPORTTIME=1
+to show import timings (or to a filename to write them as JSON data).
+Set PYRUN_SERVER to the socket of a fork server started with
+"pyrun -m pyrun_server" to run the <script> via the server. Set
+PYRUN_IMPORTTRACE to a filename to append the names of all imported
+modules to it when pyrun exits.
 
 Without options, the given <script> file is loaded and run. Parameters
 are passed to the script via sys.argv as normal.
@@ -204,6 +255,8 @@ pyrun_inspect = %(pyrun_inspect)r
 pyrun_unbuffered = %(pyrun_unbuffered)r
 pyrun_optimized = %(pyrun_optimized)r
 pyrun_dontwritebytecode = %(pyrun_dontwritebytecode)r
+pyrun_site_cache = %(pyrun_site_cache)r
+pyrun_app_import = %(pyrun_app_import)r
 pyrun_safe_path = %(pyrun_safe_path)r
 
 """ % globals()).splitlines()
@@ -233,6 +286,56 @@ def pyrun_log_warning(line):
     """
     sys.stderr.write('%s warning: %s\n' % (pyrun_name, line))
 
+def pyrun_getopt(args, valid_options):
+
+    """ Parse the short options valid_options in args and return a
+        tuple (parsed_options, remaining_args), just like
+        getopt.getopt(args, valid_options) does.
+
+        We don't use getopt during startup, since it pulls in gettext,
+        re and several other modules.
+
+        Raises a ValueError for unknown options or missing option
+        arguments.
+
+    """
+    parsed_options = []
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg == '--':
+            # End of options marker
+            i += 1
+            break
+        if arg[:1] != '-' or arg == '-':
+            # First non-option argument
+            break
+        if arg[:2] == '--':
+            raise ValueError('option %s not recognized' % arg.split('=')[0])
+        i += 1
+        j = 1
+        while j < len(arg):
+            option = arg[j]
+            pos = valid_options.find(option)
+            if pos < 0 or option == ':':
+                raise ValueError('option -%s not recognized' % option)
+            if valid_options[pos + 1:pos + 2] != ':':
+                parsed_options.append(('-' + option, ''))
+                j += 1
+                continue
+            # Option with argument: use the rest of arg or the next
+            # argument
+            value = arg[j + 1:]
+            if not value:
+                if i >= len(args):
+                    raise ValueError('option -%s requires argument' %
+                                     option)
+                value = args[i]
+                i += 1
+            parsed_options.append(('-' + option, value))
+            break
+    return parsed_options, args[i:]
+
 def pyrun_parse_cmdline():
 
     """ Parse the pyrun command line arguments.
@@ -241,14 +344,12 @@ def pyrun_parse_cmdline():
         sys.argv after successfully parsing the pyrun options.
 
     """
-    import getopt
-
     # Parse sys.argv
     valid_options = 'vVmcbiESdOu3h?sBPRIW:X:'
     try:
-        parsed_options, remaining_argv = getopt.getopt(pyrun_argv[1:],
-                                                       valid_options)
-    except getopt.GetoptError as reason:
+        parsed_options, remaining_argv = pyrun_getopt(pyrun_argv[1:],
+                                                      valid_options)
+    except ValueError as reason:
         pyrun_help(['*** Problem parsing command line: %s' % reason])
         sys.exit(1)
 
@@ -374,11 +475,16 @@ def pyrun_parse_cmdline():
                 warnings._setoption(value)
 
         elif arg == '-X':
-            # Implementation specific options: not implemented
-            if pyrun_debug:
+            # Implementation specific options
+            if value == 'importtime':
+                # Show import timings (see pyrun_importtime.py)
+                import pyrun_importtime
+                pyrun_importtime.enable()
+            elif pyrun_debug:
+                # Not implemented
                 pyrun_log_warning(
-                    'Command line option -X is not supported. '
-                    'Ignoring the option.')
+                    'Command line option -X %s is not supported. '
+                    'Ignoring the option.' % value)
 
         # XXX Add more standard Python command line options here
 
@@ -454,6 +560,98 @@ def pyrun_normpath(path,
     # Convert to an absolute path
     return os.path.abspath(path)
 
+def pyrun_compile_script(filename):
+
+    """ Compile the Python script filename and return the code object.
+
+        The byte code is cached in the same way Python caches byte
+        code of imported modules, i.e. in a __pycache__ dir next to
+        the script (or under PYTHONPYCACHEPREFIX), using the script's
+        mtime and size and the optimization level as cache key.
+
+        Writing the cache file is skipped when running with -B or
+        PYTHONDONTWRITEBYTECODE set. Problems reading or writing
+        the cache file (e.g. on read-only file systems) are ignored
+        and simply cause the script to be compiled from source.
+
+        Only available for Python 3.
+
+    """
+    import marshal
+    import _imp
+    import _frozen_importlib_external as bootstrap_external
+
+    # Honor PYTHONPYCACHEPREFIX, in case the C startup code did not
+    # already set it up
+    if (getattr(sys, 'pycache_prefix', 0) is None and
+        not pyrun_ignore_environment):
+        pycache_prefix = os.environ.get('PYTHONPYCACHEPREFIX', None)
+        if pycache_prefix:
+            sys.pycache_prefix = pyrun_normpath(pycache_prefix)
+
+    # Determine the location of the cache file
+    source_stat = os.stat(filename)
+    source_mtime = int(source_stat.st_mtime) & 0xFFFFFFFF
+    source_size = source_stat.st_size & 0xFFFFFFFF
+    try:
+        bytecode_path = bootstrap_external.cache_from_source(
+            os.path.abspath(filename),
+            optimization=pyrun_optimized or '')
+    except NotImplementedError:
+        # sys.implementation.cache_tag is not set
+        bytecode_path = None
+
+    # Try to load the code object from the cache file
+    if bytecode_path is not None:
+        try:
+            with open(bytecode_path, 'rb') as file:
+                data = file.read()
+            exc_details = {'name': '__main__', 'path': bytecode_path}
+            flags = bootstrap_external._classify_pyc(
+                data, '__main__', exc_details)
+            if flags != 0:
+                # Hash based .pyc files are not used for scripts
+                raise ImportError('hash based .pyc file')
+            bootstrap_external._validate_timestamp_pyc(
+                data, source_mtime, source_size, '__main__', exc_details)
+            code = marshal.loads(memoryview(data)[16:])
+        except (OSError, ImportError, EOFError, ValueError, TypeError):
+            pass
+        else:
+            # The cache file is shared by all paths leading to the
+            # script, so use the one we were called with, just like
+            # SourceLoader does it for modules
+            _imp._fix_co_filename(code, filename)
+            if pyrun_debug > 1:
+                pyrun_log('Using cached byte code %r for %r' % (
+                    bytecode_path, filename))
+            return code
+
+    # Compile the script
+    with open(filename, 'r', encoding='utf-8') as file:
+        source = file.read()
+    code = compile(source, filename, 'exec', optimize=pyrun_optimized)
+
+    # Write the cache file
+    if (bytecode_path is not None and
+        not (pyrun_dontwritebytecode or sys.dont_write_bytecode)):
+        data = bootstrap_external._code_to_timestamp_pyc(
+            code, source_mtime, source_size)
+        try:
+            os.makedirs(os.path.dirname(bytecode_path), exist_ok=True)
+            bootstrap_external._write_atomic(
+                bytecode_path, data, source_stat.st_mode | 0o200)
+        except OSError as reason:
+            # Read-only file system, missing permissions, etc.
+            if pyrun_debug > 1:
+                pyrun_log('Could not write byte code cache %r: %s' % (
+                    bytecode_path, reason))
+        else:
+            if pyrun_debug > 1:
+                pyrun_log('Wrote byte code cache %r for %r' % (
+                    bytecode_path, filename))
+    return code
+
 def pyrun_prompt(pyrun_script='<stdin>', banner=None):
 
     """ Start an interactive pyrun prompt for pyrun_script.
@@ -514,9 +712,199 @@ def pyrun_enable_unbuffered_mode():
         sys.stdout = stdout
         sys.stderr = stderr
 
+def pyrun_site_stamp(path):
+
+    """ Return the mtime (in ns) of path for use in the site cache.
+
+        Returns -1 in case path does not exist.
+
+    """
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return -1
+
+def pyrun_scan_site_dir(sitedir):
+
+    """ Scan the .pth files in sitedir the same way site.addsitedir()
+        does and return a tuple (records, stamps).
+
+        records is a list of ('path', dir) and ('import', line)
+        entries in processing order. stamps is a list of (path, mtime)
+        entries for sitedir and all .pth files found, which is used to
+        validate the cached records.
+
+        Dirs are recorded whether they exist or not, since they may be
+        created or removed later on without changing the stamps;
+        pyrun_setup_sys_path() checks them on every startup.
+
+        Only available for Python 3.
+
+    """
+    records = []
+    stamps = [(sitedir, pyrun_site_stamp(sitedir))]
+    try:
+        names = os.listdir(sitedir)
+    except OSError:
+        return records, stamps
+    names = sorted(name
+                   for name in names
+                   if name.endswith('.pth') and not name.startswith('.'))
+    for name in names:
+        pth_file = os.path.join(sitedir, name)
+        stamps.append((pth_file, pyrun_site_stamp(pth_file)))
+        try:
+            with open(pth_file, 'rb') as file:
+                data = file.read()
+        except OSError:
+            continue
+        if data[:3] == b'\xef\xbb\xbf':
+            # Remove the UTF-8 BOM (without having to load the
+            # utf-8-sig codec)
+            data = data[3:]
+        try:
+            content = data.decode('utf-8')
+        except UnicodeDecodeError:
+            content = data.decode('latin-1')
+        for line in content.splitlines():
+            if line.startswith('#') or not line.strip():
+                continue
+            if line.startswith(('import ', 'import\t')):
+                records.append(('import', line))
+                continue
+            path = os.path.abspath(os.path.join(sitedir, line.rstrip()))
+            records.append(('path', path))
+    return records, stamps
+
+def pyrun_replay_site_records(records):
+
+    """ Apply the .pth records returned by pyrun_scan_site_dir() to
+        sys.path.
+
+        'import' lines are executed on every startup, just like
+        site.addpackage() does it.
+
+    """
+    namespace = {'sys': sys, 'os': os}
+    for kind, value in records:
+        if kind == 'path':
+            if value not in sys.path:
+                sys.path.append(value)
+        else:
+            try:
+                pyrun_exec_code(value, namespace)
+            except Exception as reason:
+                pyrun_log_error('Error processing .pth line %r: %s' % (
+                    value, reason))
+
+def pyrun_site_cache_key(sitedir):
+
+    """ Return the key identifying a valid site cache for sitedir.
+
+        The -E and -s flags are not part of the key, since the .pth
+        records of sitedir don't depend on them; the user site setting
+        is checked by pyrun_run_site_main() on every start.
+
+    """
+    return (sys.version,
+            pyrun_version,
+            sys.prefix,
+            sitedir)
+
+def pyrun_load_site_cache(cache_file, sitedir):
+
+    """ Load the site snapshot for sitedir from cache_file.
+
+        The snapshot is a dictionary with these entries:
+
+        'key'         - pyrun_site_cache_key() of the snapshot
+        'sitedir'     - the site-packages dir sitedir
+        'stamps'      - mtimes of sitedir and all .pth files
+        'records'     - .pth records as returned by pyrun_scan_site_dir()
+        'site_main'   - True, if the venv and user site setup of
+                        site.main() did not change sys.path or
+                        sys.prefix the last time it ran, False if it
+                        did, None if not yet known
+        'user_site'   - True, if the user site dir was enabled the last
+                        time site.main() ran
+        'site_stamps' - mtimes of the pyvenv.cfg files and the user site
+                        dir checked by site.main()
+
+        Returns None, if there is no cache or the cache is no longer
+        valid, e.g. because a .pth file was added, changed or removed,
+        or a pyvenv.cfg file or the user site dir was created.
+
+    """
+    import marshal
+    try:
+        with open(cache_file, 'rb') as file:
+            snapshot = marshal.load(file)
+        if snapshot['key'] != pyrun_site_cache_key(sitedir):
+            return None
+        for path, mtime in snapshot['stamps'] + snapshot['site_stamps']:
+            if pyrun_site_stamp(path) != mtime:
+                if pyrun_debug > 1:
+                    pyrun_log('Site cache %r outdated: %r changed' % (
+                        cache_file, path))
+                return None
+        snapshot['sitedir']
+        snapshot['records']
+        snapshot['site_main']
+        snapshot['user_site']
+    except (OSError, EOFError, ValueError, TypeError, KeyError):
+        return None
+    return snapshot
+
+def pyrun_write_site_cache(cache_file, snapshot):
+
+    """ Write the site snapshot to cache_file.
+
+        Errors (e.g. missing permissions to write to the installation)
+        are ignored.
+
+    """
+    import marshal
+    data = marshal.dumps(dict((key, value)
+                              for key, value in snapshot.items()
+                              if key != 'cache_file'))
+    temp_file = '%s.%i' % (cache_file, os.getpid())
+    try:
+        with open(temp_file, 'wb') as file:
+            file.write(data)
+        os.replace(temp_file, cache_file)
+    except OSError as reason:
+        try:
+            os.unlink(temp_file)
+        except OSError:
+            pass
+        if pyrun_debug > 1:
+            pyrun_log('Could not write site cache %r: %s' % (
+                cache_file, reason))
+    else:
+        if pyrun_debug > 1:
+            pyrun_log('Wrote site cache %r' % cache_file)
+
+def pyrun_venv_config_files():
+
+    """ Return the pyvenv.cfg files checked by site.venv().
+
+    """
+    executable = sys.executable
+    if sys.platform == 'darwin' and '__PYVENV_LAUNCHER__' in os.environ:
+        executable = os.environ['__PYVENV_LAUNCHER__']
+    exe_dir = os.path.dirname(os.path.abspath(executable))
+    return [os.path.join(exe_dir, 'pyvenv.cfg'),
+            os.path.join(os.path.dirname(exe_dir), 'pyvenv.cfg')]
+
 def pyrun_run_site_main():
 
-    """ Import the site module
+    """ Import the site module and run site.main()
+
+        With a site snapshot (see pyrun_setup_sys_path()), the .pth
+        files of the site-packages dir were already processed, so
+        site.main() is run step by step, without processing that dir
+        again. If the snapshot shows that the venv and user site setup
+        don't change sys.path, these steps are skipped as well.
 
     """
     if pyrun_debug > 1:
@@ -526,9 +914,61 @@ def pyrun_run_site_main():
             pyrun_log('    %s' % path)
     import site
     site.PREFIXES = [sys.prefix]
-    if pyrun_skip_user_site:
+    if pyrun_skip_site_user_site:
         site.ENABLE_USER_SITE = False
-    site.main()
+    snapshot = pyrun_site_snapshot
+    if snapshot is None:
+        site.main()
+    else:
+        orig_path = sys.path[:]
+        known_paths = site.removeduppaths()
+        if orig_path != sys.path:
+            site.abs_paths()
+        if site.ENABLE_USER_SITE is None:
+            site.ENABLE_USER_SITE = site.check_enableusersite()
+        if (snapshot['site_main'] and
+            (snapshot['user_site'] or not site.ENABLE_USER_SITE)):
+            # Warm start: the venv and user site setup did not change
+            # sys.path the last time; the pyvenv.cfg files and the user
+            # site dir were checked when validating the snapshot
+            if pyrun_debug > 1:
+                pyrun_log('  using site cache, skipping sys.path setup')
+        else:
+            orig_path = sys.path[:]
+            orig_prefixes = (sys.prefix, sys.exec_prefix)
+            known_paths = site.venv(known_paths)
+            known_paths = site.addusersitepackages(known_paths)
+            sitedir = site.makepath(snapshot['sitedir'])[1]
+            for path in site.getsitepackages(site.PREFIXES):
+                if site.makepath(path)[1] != sitedir and os.path.isdir(path):
+                    site.addsitedir(path, known_paths)
+            if (snapshot['site_main'] is None or
+                (site.ENABLE_USER_SITE and not snapshot['user_site'])):
+                # Remember whether the venv and user site setup is
+                # needed and update the cache
+                venv_stamps = [(path, pyrun_site_stamp(path))
+                               for path in pyrun_venv_config_files()]
+                site_stamps = venv_stamps[:]
+                if site.ENABLE_USER_SITE and site.USER_SITE:
+                    site_stamps.append(
+                        (site.USER_SITE, pyrun_site_stamp(site.USER_SITE)))
+                snapshot['site_main'] = (
+                    sys.path == orig_path and
+                    (sys.prefix, sys.exec_prefix) == orig_prefixes and
+                    not [path
+                         for path, mtime in venv_stamps
+                         if mtime != -1])
+                snapshot['user_site'] = bool(site.ENABLE_USER_SITE)
+                snapshot['site_stamps'] = site_stamps
+                pyrun_write_site_cache(snapshot['cache_file'], snapshot)
+        site.setquit()
+        site.setcopyright()
+        site.sethelper()
+        if not sys.flags.isolated:
+            site.enablerlcompleter()
+        site.execsitecustomize()
+        if site.ENABLE_USER_SITE:
+            site.execusercustomize()
     if pyrun_debug > 1:
         pyrun_log('  sys.path after importing site:')
         for path in sys.path:
@@ -568,6 +1008,13 @@ def pyrun_setup_sys_path(pyrun_script=None):
     python_site_package = join(python_lib, 'site-packages')
     # all path variables should be normalized now
 
+    # Tree-shaken builds load the stdlib modules which are not frozen
+    # from the sidecar lib dir
+    python_sidecar = join(python_lib, 'pyrun-stdlib')
+    if PY3 and os.path.isdir(python_sidecar):
+        import pyrun_importtrace
+        pyrun_importtrace.install_sidecar(python_sidecar)
+
     # Build sys.path
     if not pyrun_safe_path:
         # start with the script directory (location of the script to be
@@ -590,9 +1037,41 @@ def pyrun_setup_sys_path(pyrun_script=None):
     sys.path.append(python_lib_dynload)
 
     # Add site packages directory
+    existing_paths = set()
     if pyrun_ignore_pth_files:
         # Add the standard dirs without any .pth processing
         sys.path.append(python_site_package)
+    elif PY3 and pyrun_site_cache:
+        # Process .pth files using the site snapshot cache; this
+        # avoids having to read all .pth files on every startup
+        global pyrun_site_snapshot
+        cache_file = join(python_lib, 'pyrun-site.cache')
+        snapshot = pyrun_load_site_cache(cache_file, python_site_package)
+        if snapshot is None:
+            records, stamps = pyrun_scan_site_dir(python_site_package)
+            snapshot = {
+                'key': pyrun_site_cache_key(python_site_package),
+                'sitedir': python_site_package,
+                'stamps': stamps,
+                'records': records,
+                'site_main': None,
+                'user_site': False,
+                'site_stamps': [],
+                }
+            if pyrun_skip_site_main:
+                pyrun_write_site_cache(cache_file, snapshot)
+            # Otherwise written by pyrun_run_site_main()
+        elif pyrun_debug > 1:
+            pyrun_log('  using site cache %r' % cache_file)
+        snapshot['cache_file'] = cache_file
+        sys.path.append(python_site_package)
+        pyrun_replay_site_records(snapshot['records'])
+        pyrun_site_snapshot = snapshot
+        # The site-packages dir was checked when validating the
+        # snapshot; the dirs from the .pth records are checked below,
+        # since they may have been created or removed in the meantime
+        if snapshot['stamps'][0][1] != -1:
+            existing_paths.add(python_site_package)
     else:
         # Use site.addsitedir() to add site-package dirs with
         # .pth processing (needed for setuptools/pip et al.)
@@ -609,13 +1088,78 @@ def pyrun_setup_sys_path(pyrun_script=None):
     exists = os.path.exists
     sys.path = [dir
                 for dir in sys.path
-                if exists(dir)]
+                if dir in existing_paths or exists(dir)]
 
     if pyrun_debug > 1:
         pyrun_log('  sys.path final version:')
         for path in sys.path:
             pyrun_log('    %s' % path)
 
+def pyrun_run_zip_main(pyrun_script):
+
+    """ Run the __main__ module of the ZIP file pyrun_script, in the
+        same way runpy.run_path() does it, but without having to import
+        runpy and its dependencies.
+
+        The ZIP payload is imported using pyrun_appimport, if possible
+        (and not disabled via PYRUN_APPIMPORT=0), and zipimport
+        otherwise.
+
+        Returns False, if this is not supported by the Python version
+        (zipimporter.find_spec() is needed for zipimport, which is
+        available in Python 3.10+). The caller should then use runpy
+        instead.
+
+    """
+    importer = None
+    if PY3 and pyrun_app_import:
+        import pyrun_appimport
+        importer = pyrun_appimport.install(pyrun_script)
+    if importer is None:
+        import zipimport
+        if not hasattr(zipimport.zipimporter, 'find_spec'):
+            return False
+        try:
+            importer = zipimport.zipimporter(pyrun_script)
+        except zipimport.ZipImportError:
+            pyrun_log_error(
+                'Could not run %r: app missing appended ZIP package' %
+                pyrun_script)
+            sys.exit(1)
+    spec = importer.find_spec('__main__')
+    if spec is None or spec.loader is None:
+        pyrun_log_error("Could not run %r: can't find '__main__' module" %
+                        pyrun_script)
+        sys.exit(1)
+    code = importer.get_code('__main__')
+
+    # Setup the __main__ module, like runpy does
+    main_module = type(sys)('__main__')
+    main_globals = main_module.__dict__
+    main_globals.update(globals())
+    main_globals.update(__name__='__main__',
+                        __file__=spec.origin,
+                        __cached__=None,
+                        __doc__=None,
+                        __loader__=importer,
+                        __package__='',
+                        __spec__=spec)
+    saved_main = sys.modules.get('__main__', None)
+    saved_argv0 = sys.argv[0]
+    sys.modules['__main__'] = main_module
+    sys.argv[0] = pyrun_script
+    sys.path.insert(0, pyrun_script)
+    try:
+        pyrun_exec_code(code, main_globals)
+    finally:
+        sys.modules['__main__'] = saved_main
+        sys.argv[0] = saved_argv0
+        try:
+            sys.path.remove(pyrun_script)
+        except ValueError:
+            pass
+    return True
+
 def pyrun_execute_script(pyrun_script, mode='file'):
 
     """ Run pyrun_script with pyrun.
@@ -692,6 +1236,8 @@ def pyrun_execute_script(pyrun_script, mode='file'):
         #   WARNING: This is different than standard Python, which
         #   places the directory of the .py file in sys.argv[0].
         #
+        if pyrun_mode == 'app' and pyrun_run_zip_main(pyrun_script):
+            return
         import runpy
         try:
             runpy.run_path(pyrun_script, globals(), '__main__')
@@ -721,9 +1267,10 @@ def pyrun_execute_script(pyrun_script, mode='file'):
 
         import marshal
         if PY3:
-            # Python 3
-            import importlib.util
-            MAGIC = importlib.util.MAGIC_NUMBER
+            # Python 3; importlib.util would pull in several other
+            # modules, so we use the bootstrap module directly
+            import _frozen_importlib_external as bootstrap_external
+            MAGIC = bootstrap_external.MAGIC_NUMBER
         else:
             # Python 2
             import imp
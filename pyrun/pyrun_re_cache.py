@@ -0,0 +1,62 @@
+""" eGenix PyRun precompiled regular expressions
+
+    When building with PYRUNFREEZERECACHE (freeze.py -c), the constant
+    regular expressions compiled at module level by the frozen modules
+    are compiled at freeze time and stored in the frozen module
+    pyrun_re_cache_data.
+
+    The re module is patched to call compile() for patterns missing
+    from its cache, which creates the pattern objects directly from the
+    stored data using _sre.compile(), instead of running the pure
+    Python re parser and compiler.
+
+    Set the PYRUN_RECACHE env var to 0 to disable the use of the
+    precompiled patterns, e.g. for benchmarking.
+
+    Only available for Python 3.
+
+"""
+import os
+
+### Globals
+
+# Name of the frozen module holding the precompiled patterns
+DATA_MODULE = 'pyrun_re_cache_data'
+
+# pyrun_re_cache_data module, None if not available, False if not yet
+# loaded
+_data = False
+
+### Pattern lookup
+
+def data_module():
+
+    """ Return the pyrun_re_cache_data module, or None, if not
+        available or disabled.
+
+    """
+    global _data
+    if _data is False:
+        if os.environ.get('PYRUN_RECACHE', '1') == '0':
+            _data = None
+        else:
+            try:
+                _data = __import__(DATA_MODULE)
+            except ImportError:
+                _data = None
+    return _data
+
+def compile(pattern, flags):
+
+    """ Return the compiled pattern object for pattern and flags (an
+        integer), or None, if it was not precompiled.
+
+    """
+    data = data_module()
+    if data is None:
+        return None
+    args = data.PATTERNS.get((pattern, flags))
+    if args is None:
+        return None
+    import marshal, _sre
+    return _sre.compile(*marshal.loads(args))
@@ -0,0 +1,563 @@
+""" eGenix PyRun fork server
+
+    The fork server amortizes the PyRun startup costs across many
+    short running pyrun invocations: the server preloads a set of
+    modules and then listens on a Unix domain socket. For each
+    request, it forks a worker process, which runs the request using
+    the client's command line arguments, current dir, environment,
+    umask and stdio file descriptors. The worker's exit code is
+    relayed back to the client.
+
+    Usage:
+
+    pyrun -m pyrun_server [--listen <socket path>] [--preload <modules>]
+
+    --listen, -l    path of the Unix domain socket to listen on;
+                    defaults to the PYRUN_SERVER env var
+    --preload, -p   comma separated list of modules to import in the
+                    server; can be given multiple times
+    --quiet, -q     don't write status messages to stderr
+
+    Clients are enabled by setting the PYRUN_SERVER env var to the
+    socket path. pyrun then hands over the invocation to the server
+    (see run_client()) and falls back to a normal startup, in case
+    the server is not available.
+
+    Notes:
+
+    - The workers share the interpreter wide settings of the server,
+      e.g. the hash seed and the settings determined from env vars
+      during interpreter initialization (PYTHONHASHSEED, PYTHONUTF8,
+      PYTHONMALLOC, etc.). pyrun command line options and the env vars
+      handled by pyrun_main are applied per request.
+
+    - The socket is created with permissions for the server's user
+      only. On Linux, the client's uid is checked as well.
+
+    Only available for Python 3 on Unix platforms.
+
+"""
+import sys
+import os
+
+### Globals
+
+# Version of the request protocol; must match between client and
+# server
+PROTOCOL_VERSION = 1
+
+# Status messages sent from the server to the client: a one byte
+# message type followed by a 4 byte signed int
+MSG_PID = b'P'
+MSG_EXIT = b'X'
+MSG_SIZE = 5
+
+# Max. number of fds accepted with a request
+MAX_FDS = 3
+
+# Signals forwarded by the client to the worker process
+FORWARDED_SIGNALS = ('SIGINT', 'SIGTERM', 'SIGHUP', 'SIGQUIT',
+                     'SIGUSR1', 'SIGUSR2', 'SIGWINCH', 'SIGCONT')
+
+# Print status messages ?
+_verbose = True
+
+# Stdio streams replaced in the worker processes
+_old_stdio = []
+
+### Helpers
+
+def _log(message):
+
+    if _verbose:
+        sys.stderr.write('pyrun_server: %s\n' % message)
+        sys.stderr.flush()
+
+def _pack_int(value):
+
+    return value.to_bytes(4, 'little', signed=True)
+
+def _unpack_int(data):
+
+    return int.from_bytes(data, 'little', signed=True)
+
+def _recv_exact(sock, size):
+
+    """ Receive exactly size bytes from sock.
+
+        Returns less data, if the connection was closed by the peer.
+
+    """
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+def _request_version():
+
+    """ Return the version tuple which has to match between client and
+        server.
+
+    """
+    return (PROTOCOL_VERSION, sys.version)
+
+### Client
+
+def run_client(address):
+
+    """ Run the current pyrun invocation via the fork server listening
+        on the Unix domain socket address.
+
+        Does not return, if the server accepted the request: the
+        process exits with the exit code of the worker process. Returns
+        in case the server is not available or rejected the request,
+        so that the caller can continue with a normal startup.
+
+        This function is called very early by pyrun_main and only uses
+        builtin modules to keep the client startup fast.
+
+    """
+    import marshal
+    import _socket
+
+    # Build the request
+    fds = []
+    for fd in range(MAX_FDS):
+        try:
+            os.fstat(fd)
+        except OSError:
+            continue
+        fds.append(fd)
+    umask = os.umask(0o077)
+    os.umask(umask)
+    try:
+        cwd = os.getcwd()
+    except OSError:
+        return
+    request = marshal.dumps({
+        'version': _request_version(),
+        'argv': sys.argv,
+        'executable': sys.executable,
+        'cwd': cwd,
+        'env': dict(os.environ),
+        'umask': umask,
+        'fds': fds,
+        })
+    data = _pack_int(len(request)) + request
+    fds_data = b''.join(fd.to_bytes(4, sys.byteorder, signed=True)
+                        for fd in fds)
+
+    # Send the request together with our stdio fds
+    sock = _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+    try:
+        sock.connect(address)
+        sent = sock.sendmsg(
+            [data],
+            [(_socket.SOL_SOCKET, _socket.SCM_RIGHTS, fds_data)])
+        if sent < len(data):
+            sock.sendall(data[sent:])
+        reply = _recv_exact(sock, MSG_SIZE)
+    except OSError:
+        sock.close()
+        return
+    if len(reply) < MSG_SIZE or reply[:1] != MSG_PID:
+        # Request was not accepted
+        sock.close()
+        return
+
+    # From here on, the request is being run by the worker process,
+    # so we can no longer fall back to a normal startup
+
+    # Forward signals to the worker
+    import _signal
+    worker_pid = _unpack_int(reply[1:])
+    def forward_signal(signum, frame):
+        try:
+            os.kill(worker_pid, signum)
+        except OSError:
+            pass
+    for name in FORWARDED_SIGNALS:
+        signum = getattr(_signal, name, None)
+        if signum is not None:
+            _signal.signal(signum, forward_signal)
+
+    # Wait for the exit code
+    try:
+        reply = _recv_exact(sock, MSG_SIZE)
+    except OSError:
+        reply = b''
+    if len(reply) < MSG_SIZE or reply[:1] != MSG_EXIT:
+        sys.stderr.write('pyrun: lost connection to pyrun server %r\n' %
+                         address)
+        os._exit(1)
+    rc = _unpack_int(reply[1:])
+    if rc < 0:
+        # Worker was killed by a signal: kill ourselves in the same way
+        _signal.signal(-rc, _signal.SIG_DFL)
+        os.kill(os.getpid(), -rc)
+        rc = 128 - rc
+    os._exit(rc)
+
+### Worker
+
+def _reopen_stdio():
+
+    """ Recreate sys.stdin/stdout/stderr for the fds 0, 1 and 2.
+
+    """
+    import io
+    for fd, name in ((0, 'stdin'), (1, 'stdout'), (2, 'stderr')):
+        old_stream = getattr(sys, name)
+        # The old streams may own the fd (e.g. when using unbuffered
+        # mode), so we have to keep them alive to prevent them from
+        # closing the fd
+        _old_stdio.append(old_stream)
+        if fd == 0:
+            mode = 'r'
+            buffering = -1
+        else:
+            mode = 'w'
+            if fd == 2 or os.isatty(fd):
+                # Use line buffering
+                buffering = 1
+            else:
+                buffering = -1
+        stream = io.open(fd, mode,
+                         buffering=buffering,
+                         encoding=old_stream.encoding,
+                         errors=old_stream.errors,
+                         newline='\n',
+                         closefd=False)
+        setattr(sys, name, stream)
+        setattr(sys, '__%s__' % name, stream)
+
+def _exit_code(exc):
+
+    """ Return the process exit code for the SystemExit exception exc.
+
+    """
+    code = exc.code
+    if code is None:
+        return 0
+    elif isinstance(code, int):
+        return code
+    sys.stderr.write('%s\n' % code)
+    return 1
+
+def _run_worker(request, fds):
+
+    """ Run the request in the current (forked) process.
+
+        Never returns.
+
+    """
+    rc = 1
+    try:
+        import signal
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+        # Install the client's stdio fds; fds not passed in by the
+        # client get redirected to /dev/null
+        for target in range(MAX_FDS):
+            if target in request['fds']:
+                fd = fds[request['fds'].index(target)]
+                os.dup2(fd, target)
+            else:
+                devnull = os.open(os.devnull, os.O_RDWR)
+                os.dup2(devnull, target)
+                os.close(devnull)
+        for fd in fds:
+            if fd >= MAX_FDS:
+                os.close(fd)
+        _reopen_stdio()
+
+        # Setup the process environment
+        os.chdir(request['cwd'])
+        os.umask(request['umask'])
+        os.environ.clear()
+        os.environ.update(request['env'])
+        sys.argv[:] = request['argv']
+        sys.dont_write_bytecode = bool(
+            os.environ.get('PYTHONDONTWRITEBYTECODE'))
+        for flag in ('optimize', 'verbose', 'debug', 'inspect',
+                     'dont_write_bytecode'):
+            sys._setflag(flag, 0)
+
+        # Re-init pyrun_config and pyrun_main for the request
+        if request['executable'] != sys.executable:
+            sys.executable = request['executable']
+            sys.modules.pop('pyrun_config', None)
+        import pyrun_config
+        pyrun_config.pyrun_argv = request['argv'][:]
+        sys.modules.pop('pyrun_main', None)
+        import pyrun_main
+
+        # Run the request
+        try:
+            pyrun_main.pyrun_main()
+            rc = 0
+        except SystemExit as exc:
+            rc = _exit_code(exc)
+        except BaseException:
+            # Report the exception without the worker frame
+            exc_type, exc_value, exc_tb = sys.exc_info()
+            exc_value.__traceback__ = exc_tb.tb_next
+            sys.excepthook(exc_type, exc_value, exc_tb.tb_next)
+            rc = 1
+
+        # Shutdown, much like the interpreter does it at exit
+        if 'threading' in sys.modules:
+            sys.modules['threading']._shutdown()
+        import atexit
+        atexit._run_exitfuncs()
+
+    except BaseException as reason:
+        sys.stderr.write('pyrun_server: could not run request: %s\n' %
+                         reason)
+
+    finally:
+        for stream in (sys.stdout, sys.stderr):
+            try:
+                stream.flush()
+            except Exception:
+                pass
+        os._exit(rc & 0xFF)
+
+### Server
+
+def _receive_request(conn):
+
+    """ Receive a request from the client connection conn.
+
+        Returns a tuple (request, fds). request is None in case the
+        request could not be read or is not compatible.
+
+    """
+    import socket
+    import marshal
+
+    fds = []
+    data, ancdata, flags, address = conn.recvmsg(
+        65536, socket.CMSG_SPACE(MAX_FDS * 4))
+    for level, type, fds_data in ancdata:
+        if level == socket.SOL_SOCKET and type == socket.SCM_RIGHTS:
+            fds.extend(int.from_bytes(fds_data[i:i + 4], sys.byteorder,
+                                      signed=True)
+                       for i in range(0, len(fds_data) - 3, 4))
+    if len(data) < 4:
+        return None, fds
+    size = _unpack_int(data[:4])
+    data = data[4:]
+    if len(data) < size:
+        data += _recv_exact(conn, size - len(data))
+    try:
+        request = marshal.loads(data)
+    except (EOFError, ValueError, TypeError):
+        return None, fds
+    if (not isinstance(request, dict) or
+        request.get('version') != _request_version() or
+        len(request.get('fds', ())) != len(fds)):
+        return None, fds
+    return request, fds
+
+def _check_peer(conn):
+
+    """ Check that the client runs under the same uid as the server.
+
+        Only supported on Linux; returns True on other platforms.
+
+    """
+    import socket
+    import struct
+
+    SO_PEERCRED = getattr(socket, 'SO_PEERCRED', None)
+    if SO_PEERCRED is None:
+        return True
+    creds = conn.getsockopt(socket.SOL_SOCKET, SO_PEERCRED,
+                            struct.calcsize('3i'))
+    pid, uid, gid = struct.unpack('3i', creds)
+    return uid == os.getuid()
+
+def _handle_connection(conn, listener):
+
+    """ Handle the client connection conn in a forked handler process.
+
+        The handler forks the worker process, sends its pid to the
+        client, waits for it to finish and then sends the exit code.
+
+    """
+    if not _check_peer(conn):
+        _log('rejected connection from a different user')
+        return
+    request, fds = _receive_request(conn)
+    if request is None:
+        _log('rejected incompatible request')
+        for fd in fds:
+            os.close(fd)
+        return
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        # Worker process
+        listener.close()
+        conn.close()
+        _run_worker(request, fds)
+    for fd in fds:
+        os.close(fd)
+    conn.sendall(MSG_PID + _pack_int(pid))
+    pid, status = os.waitpid(pid, 0)
+    if os.WIFSIGNALED(status):
+        rc = -os.WTERMSIG(status)
+    else:
+        rc = os.WEXITSTATUS(status)
+    conn.sendall(MSG_EXIT + _pack_int(rc))
+
+def _reap_children():
+
+    while True:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if not pid:
+            return
+
+def preload(modules):
+
+    """ Import the given list of modules.
+
+    """
+    for name in modules:
+        try:
+            __import__(name)
+        except Exception as reason:
+            _log('could not preload module %r: %s' % (name, reason))
+        else:
+            _log('preloaded module %r' % name)
+
+def serve(address, preload_modules=()):
+
+    """ Run the fork server on the Unix domain socket address.
+
+        preload_modules is a list of module names to import before
+        accepting requests.
+
+    """
+    import socket
+    import signal
+
+    if os.path.exists(address):
+        # Check for an already running server
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(address)
+        except OSError:
+            # Stale socket file
+            os.unlink(address)
+        else:
+            raise RuntimeError('server already running on %r' % address)
+        finally:
+            probe.close()
+
+    preload(preload_modules)
+    # Make sure pyrun_main does not try to connect to the server in the
+    # worker processes
+    sys.modules.setdefault('pyrun_server', sys.modules[__name__])
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0o077)
+    try:
+        listener.bind(address)
+    finally:
+        os.umask(umask)
+    listener.listen(128)
+    listener.settimeout(1.0)
+
+    def terminate(signum, frame):
+        raise SystemExit(0)
+    signal.signal(signal.SIGTERM, terminate)
+
+    _log('listening on %r (pid %i)' % (address, os.getpid()))
+    server_pid = os.getpid()
+    try:
+        while True:
+            _reap_children()
+            try:
+                conn, client_address = listener.accept()
+            except socket.timeout:
+                continue
+            sys.stdout.flush()
+            sys.stderr.flush()
+            pid = os.fork()
+            if pid == 0:
+                # Handler process
+                try:
+                    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                    _handle_connection(conn, listener)
+                except Exception as reason:
+                    _log('error handling request: %s' % reason)
+                finally:
+                    os._exit(0)
+            conn.close()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if os.getpid() == server_pid:
+            listener.close()
+            try:
+                os.unlink(address)
+            except OSError:
+                pass
+            _log('stopped')
+
+def main(argv=None):
+
+    """ Command line interface of the fork server.
+
+    """
+    import getopt
+    global _verbose
+
+    if argv is None:
+        argv = sys.argv[1:]
+    try:
+        options, args = getopt.getopt(argv, 'l:p:qh',
+                                      ['listen=', 'preload=', 'quiet',
+                                       'help'])
+    except getopt.GetoptError as reason:
+        sys.stderr.write('pyrun_server: %s\n' % reason)
+        return 1
+    address = os.environ.get('PYRUN_SERVER', '')
+    preload_modules = []
+    for option, value in options:
+        if option in ('-l', '--listen'):
+            address = value
+        elif option in ('-p', '--preload'):
+            preload_modules.extend(name.strip()
+                                   for name in value.split(',')
+                                   if name.strip())
+        elif option in ('-q', '--quiet'):
+            _verbose = False
+        elif option in ('-h', '--help'):
+            sys.stderr.write(__doc__)
+            return 0
+    if not address:
+        sys.stderr.write('pyrun_server: missing --listen option\n')
+        return 1
+    try:
+        serve(address, preload_modules)
+    except RuntimeError as reason:
+        sys.stderr.write('pyrun_server: %s\n' % reason)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    # Run the server via the imported module, so that the workers
+    # find it in sys.modules (see pyrun_main)
+    import pyrun_server
+    sys.exit(pyrun_server.main())
@@ -0,0 +1,238 @@
+""" eGenix PyRun cached default SSL context
+
+    Creating an SSL context with ssl.create_default_context() loads the
+    system CA certificates, which takes several milliseconds and a lot
+    of memory. The stdlib HTTPS clients (http.client, urllib.request,
+    xmlrpc.client) create a new context for every connection via
+    ssl._create_default_https_context().
+
+    The ssl module is patched to wrap _create_default_https_context
+    with cached_factory(), so that these calls return a process wide
+    shared context, which is created on first use:
+
+    - The context is created again, when the CA file or directory used
+      by OpenSSL change (checked using os.stat() on each call) or the
+      SSL_CERT_FILE or SSL_CERT_DIR env vars point to other ones.
+
+    - The context is created under a lock, so that all threads share
+      the same context. SSL contexts can safely be used by several
+      threads at the same time.
+
+    - Forked child processes drop the context of the parent and create
+      their own on first use.
+
+    - The context is shared and thus read-only: setting an attribute to
+      its current value (as http.client does) is allowed, other changes
+      raise a ValueError, since they would affect all other users of the
+      context. ALPN protocols can only be set once. Use
+      ssl.create_default_context() to get a context you can change.
+
+    - http.client and urllib.request are patched to use a new context
+      from private_context() instead, when they are going to change it:
+      for check_hostname, key_file and cert_file arguments and for
+      connections not using HTTP/1.1, since the shared context uses the
+      ALPN protocol of the HTTP/1.1 connections.
+
+    Set the PYRUN_SSLCONTEXTCACHE env var to 0 to disable the cache.
+
+    Only available for Python 3.
+
+"""
+import os
+import weakref
+import _thread
+
+### Globals
+
+# Cached contexts: context factory -> (stamp, context)
+_contexts = {}
+
+# Lock protecting the creation of contexts
+_lock = _thread.allocate_lock()
+
+# Methods of SharedSSLContext which change the context
+_CHANGING_METHODS = (
+    'load_cert_chain',
+    'load_default_certs',
+    'load_dh_params',
+    'load_verify_locations',
+    'set_ciphers',
+    'set_default_verify_paths',
+    'set_ecdh_curve',
+    'set_npn_protocols',
+    'set_psk_client_callback',
+    'set_psk_server_callback',
+    'set_servername_callback',
+    )
+
+# ALPN protocols set for the shared contexts: context -> protocols
+_alpn_protocols = weakref.WeakKeyDictionary()
+
+# SharedSSLContext class, None if not yet created
+_shared_context_class = None
+
+### Shared context
+
+def _read_only(name):
+
+    def method(self, *args, **kws):
+        raise ValueError(
+            'the shared default HTTPS context cannot be changed '
+            '(%s() called); use ssl.create_default_context() or set '
+            'PYRUN_SSLCONTEXTCACHE=0' % name)
+    method.__name__ = name
+    return method
+
+def shared_context_class():
+
+    """ Return the SSLContext subclass used for the shared contexts.
+
+        The class is created on first use, since the ssl module is still
+        being imported, when it calls cached_factory().
+
+    """
+    global _shared_context_class
+    if _shared_context_class is not None:
+        return _shared_context_class
+    import ssl
+
+    class SharedSSLContext(ssl.SSLContext):
+
+        """ Read-only SSL context shared by all default HTTPS
+            connections.
+
+        """
+        # Keep the layout of SSLContext, so that __class__ can be set
+        __slots__ = ()
+
+        def __setattr__(self, name, value):
+            try:
+                current = getattr(self, name)
+            except AttributeError:
+                pass
+            else:
+                if current == value:
+                    return
+            raise ValueError(
+                'the shared default HTTPS context cannot be changed '
+                '(%s set); use ssl.create_default_context() or set '
+                'PYRUN_SSLCONTEXTCACHE=0' % name)
+
+        def set_alpn_protocols(self, alpn_protocols):
+            alpn_protocols = list(alpn_protocols)
+            current = _alpn_protocols.get(self)
+            if current is None:
+                with _lock:
+                    current = _alpn_protocols.setdefault(self,
+                                                         alpn_protocols)
+                    if current is alpn_protocols:
+                        ssl.SSLContext.set_alpn_protocols(
+                            self, alpn_protocols)
+            if current != alpn_protocols:
+                _read_only('set_alpn_protocols')(self)
+
+    for name in _CHANGING_METHODS:
+        if hasattr(ssl.SSLContext, name):
+            setattr(SharedSSLContext, name, _read_only(name))
+    _shared_context_class = SharedSSLContext
+    return SharedSSLContext
+
+def shared_context(context):
+
+    """ Turn the SSL context context into a shared read-only context
+        and return it.
+
+    """
+    # http.client enables post handshake authentication for all its
+    # contexts, so do this before making the context read-only
+    if getattr(context, 'post_handshake_auth', None) is not None:
+        context.post_handshake_auth = True
+    context.__class__ = shared_context_class()
+    return context
+
+### Cache
+
+def stamp():
+
+    """ Return a value, which changes whenever the CA file or directory
+        used for the default contexts change.
+
+        The process id is included, so that forked processes don't use
+        the context of the parent on Pythons without os.register_at_fork().
+
+    """
+    import ssl
+    paths = ssl.get_default_verify_paths()
+    stamp = [os.getpid()]
+    for path in (paths.cafile, paths.capath):
+        if not path:
+            stamp.append(None)
+            continue
+        try:
+            st = os.stat(path)
+        except OSError:
+            stamp.append((path, None))
+        else:
+            stamp.append((path, st.st_ino, st.st_size, st.st_mtime_ns))
+    return tuple(stamp)
+
+def default_context(factory):
+
+    """ Return the shared context created by calling factory.
+
+    """
+    current = stamp()
+    entry = _contexts.get(factory)
+    if entry is not None and entry[0] == current:
+        return entry[1]
+    with _lock:
+        entry = _contexts.get(factory)
+        if entry is not None and entry[0] == current:
+            return entry[1]
+        context = shared_context(factory())
+        _contexts[factory] = (current, context)
+    return context
+
+def private_context():
+
+    """ Return a new default HTTPS context, which is not shared and can
+        be changed.
+
+    """
+    import ssl
+    factory = ssl._create_default_https_context
+    return getattr(factory, '__wrapped__', factory)()
+
+def cached_factory(factory):
+
+    """ Return a replacement for the context factory factory (used as
+        ssl._create_default_https_context), which returns the shared
+        context, if called without arguments.
+
+        Returns factory itself, if the cache is disabled.
+
+    """
+    if os.environ.get('PYRUN_SSLCONTEXTCACHE', '1') == '0':
+        return factory
+
+    def _create_default_https_context(*args, **kws):
+        if args or kws:
+            return factory(*args, **kws)
+        return default_context(factory)
+
+    _create_default_https_context.__wrapped__ = factory
+    return _create_default_https_context
+
+def clear():
+
+    """ Drop the cached contexts.
+
+    """
+    global _lock
+    _contexts.clear()
+    _alpn_protocols.clear()
+    # The lock may have been held by another thread when forking
+    _lock = _thread.allocate_lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=clear)
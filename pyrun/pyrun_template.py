@@ -69,5 +69,14 @@ sys.exit(0)
 #$imports
 
 # PyRun specific modules to include
+import pyrun_appimport
 import pyrun_config
+import pyrun_docstrings
 import pyrun_extras
+import pyrun_importtime
+import pyrun_importtrace
+import pyrun_lazycode
+import pyrun_linetables
+import pyrun_re_cache
+import pyrun_server
+import pyrun_sslcontext
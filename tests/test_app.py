@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+#
+# Test pyrun app mode (ZIP payload appended to the pyrun binary) using
+# plain ZIP payloads and payloads with a prebuilt pyrun_appimport
+# index.
+#
+# Note: This test only works on Unix platforms and for Python 3.
+#
+
+import os, sys, subprocess, shutil, tempfile, zipfile, struct, time
+
+PYRUN = 'pyrun'
+
+MAIN = '''\
+import os, sys, pkg, pkg.sub, mod
+print(sys.argv[1:])
+print(pkg.VALUE, pkg.sub.VALUE, mod.VALUE)
+print(pkg.__loader__.get_data(os.path.join(pkg.__path__[0], 'data.txt')))
+try:
+    import extra
+except ImportError:
+    print(None)
+else:
+    print(extra.VALUE)
+payload = getattr(pkg.__loader__, 'payload', None)
+print(type(pkg.__loader__).__name__, getattr(payload, 'indexed', None))
+'''
+
+# Shared module stub template used by the pyrun CLI for loading shared
+# modules from the payload
+CLI_TEMPLATES = os.environ.get(
+    'PYRUN_CLI_TEMPLATES',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                 os.pardir, 'cli', 'pyrun_cli', 'templates'))
+EXTENSION_STUB = os.path.join(CLI_TEMPLATES, 'sharedmod_stub.py')
+
+EXTENSION_MAIN = '''\
+import _decimal
+print(_decimal.__spec__.origin.startswith(%(origin_prefix)r))
+print(_decimal.Decimal(1) / 8)
+'''
+
+FALLBACK_MAIN = '''\
+import os, _decimal
+print(os.path.dirname(_decimal.__file__) == %(so_dir)r)
+print(_decimal.Decimal(1) / 8)
+'''
+
+# Double check that asserts work
+try:
+    assert False
+except AssertionError:
+    pass
+else:
+    raise RuntimeError('asserts are disabled - cannot run tests')
+
+def run(args, env=None):
+
+    run_env = dict(os.environ)
+    run_env.pop('PYRUN_SERVER', None)
+    if env:
+        run_env.update(env)
+    pipe = subprocess.Popen(args,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE,
+                            env=run_env)
+    stdout_data, stderr_data = pipe.communicate()
+    assert pipe.returncode == 0, stderr_data
+    return stdout_data.decode('utf-8').splitlines()
+
+def bytecode(runtime, source, filename):
+
+    """ Return .pyc data for source, compiled by runtime.
+
+    """
+    return subprocess.check_output(
+        [runtime, '-c',
+         'import sys, marshal, _frozen_importlib_external as b; '
+         'sys.stdout.buffer.write(b.MAGIC_NUMBER + bytes(12) + '
+         'marshal.dumps(compile(sys.stdin.read(), %r, "exec")))' %
+         filename],
+        input=source.encode('utf-8'))
+
+def extension_stub(so_file):
+
+    """ Return the shared module stub for so_file, created from the
+        template used by the pyrun CLI.
+
+    """
+    with open(EXTENSION_STUB) as file:
+        return file.read().format(so_file=so_file)
+
+def build_app(runtime, tempdir, name, members,
+              compression=zipfile.ZIP_STORED):
+
+    """ Create an app by appending a ZIP file with the given members
+        (a list of (name, data) tuples) to a copy of runtime.
+
+    """
+    zip_file = os.path.join(tempdir, name + '.zip')
+    archive = zipfile.ZipFile(zip_file, 'w', compression)
+    for member, data in members:
+        archive.writestr(member, data)
+    archive.close()
+    app_file = os.path.join(tempdir, name)
+    with open(app_file, 'wb') as app:
+        with open(runtime, 'rb') as file:
+            shutil.copyfileobj(file, app)
+        with open(zip_file, 'rb') as file:
+            shutil.copyfileobj(file, app)
+    os.chmod(app_file, 0o755)
+    return app_file
+
+def test_app(runtime=PYRUN):
+
+    if os.sep not in runtime and hasattr(shutil, 'which'):
+        runtime = shutil.which(runtime) or runtime
+    runtime = os.path.abspath(runtime)
+    tempdir = tempfile.mkdtemp()
+    members = [
+        ('__main__.py', MAIN),
+        ('pkg/__init__.py', 'VALUE = 1\n'),
+        ('pkg/data.txt', 'data'),
+        ('pkg/sub.pyc', bytecode(runtime, 'VALUE = 2\n', 'pkg/sub.py')),
+        ('mod.py', 'VALUE = 3\n'),
+        ]
+    expected = [
+        "['a', 'b']",
+        '1 2 3',
+        "b'data'",
+        'None',
+        ]
+
+    # Plain ZIP payloads
+    for compression in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+        app = build_app(runtime, tempdir, 'app%i' % compression,
+                        members, compression)
+        output = run([app, 'a', 'b'])
+        assert output == expected + ['PayloadImporter False'], output
+
+        # zipimport is used, if pyrun_appimport is disabled
+        output = run([app, 'a', 'b'], env={'PYRUN_APPIMPORT': '0'})
+        assert output == expected + ['zipimporter None'], output
+
+    # Payload with prebuilt index
+    app = build_app(runtime, tempdir, 'indexed', members)
+    run([runtime, '-m', 'pyrun_appimport', app])
+    output = run([app, 'a', 'b'])
+    assert output == expected + ['PayloadImporter True'], output
+
+    # Changing the ZIP file invalidates the index
+    archive = zipfile.ZipFile(app, 'a')
+    archive.writestr('extra.py', 'VALUE = 4\n')
+    archive.close()
+    output = run([app, 'a', 'b'])
+    assert output[3:] == ['4', 'PayloadImporter False'], output
+
+    # Shared modules included in the payload
+    so_path = subprocess.check_output(
+        [runtime, '-c',
+         'import _decimal; print(getattr(_decimal, "__file__", ""))']
+        ).decode('utf-8').strip()
+    if so_path:
+        so_file = os.path.basename(so_path)
+        with open(so_path, 'rb') as file:
+            so_data = file.read()
+        cache_dir = os.path.join(tempdir, 'cache')
+        tests = [
+            ({'PYRUN_MEMFD': '0', 'PYRUN_EXTCACHE': cache_dir}, cache_dir),
+            ]
+        if sys.platform.startswith('linux'):
+            tests.append(({}, '/proc/self/fd/'))
+        for env, origin_prefix in tests:
+            app = build_app(runtime, tempdir, 'extapp', [
+                ('__main__.py',
+                 EXTENSION_MAIN % {'origin_prefix': origin_prefix}),
+                ('_decimal.py', extension_stub(so_file)),
+                (so_file, so_data),
+                ])
+            for i in range(2):
+                # The second run reuses the cache, if used
+                output = run([app], env=env)
+                assert output == ['True', '0.125'], output
+
+        # The stub falls back to the shared module next to the binary,
+        # if the extraction cache cannot be used
+        shutil.copy(so_path, os.path.join(tempdir, so_file))
+        app = build_app(runtime, tempdir, 'extapp', [
+            ('__main__.py', FALLBACK_MAIN % {'so_dir': tempdir}),
+            ('_decimal.py', extension_stub(so_file)),
+            (so_file, so_data),
+            ])
+        output = run([app], env={
+            'PYRUN_MEMFD': '0',
+            'PYRUN_EXTCACHE': os.path.join(os.devnull, 'cache')})
+        assert output == ['True', '0.125'], output
+
+    shutil.rmtree(tempdir)
+
+def test_stale_bytecode(runtime=PYRUN):
+
+    if os.sep not in runtime and hasattr(shutil, 'which'):
+        runtime = shutil.which(runtime) or runtime
+    runtime = os.path.abspath(runtime)
+    tempdir = tempfile.mkdtemp()
+    date_time = (2020, 1, 1, 12, 0, 0)
+    mtime = int(time.mktime(date_time + (-1, -1, -1)))
+    source = "VALUE = 'source'\n"
+    pyc = bytecode(runtime, "VALUE = 'bytecode'\n", 'mod.py')
+
+    # Timestamp based .pyc members are only used, if both the mtime and
+    # the size match the source member
+    for size, expected in ((len(source), 'bytecode'),
+                           (len(source) + 1, 'source')):
+        app = build_app(runtime, tempdir, 'staleapp', [
+            ('__main__.py', 'import mod; print(mod.VALUE)\n'),
+            (zipfile.ZipInfo('mod.py', date_time), source),
+            ('mod.pyc', pyc[:8] + struct.pack('<II', mtime, size) + pyc[16:]),
+            ])
+        for env in (None, {'PYRUN_APPIMPORT': '0'}):
+            output = run([app], env=env)
+            assert output == [expected], (size, env, output)
+
+    shutil.rmtree(tempdir)
+
+###
+
+if __name__ == '__main__':
+    try:
+        runtime = sys.argv[1]
+    except IndexError:
+        runtime = sys.executable
+        print('Using %s as runtime.' % runtime)
+    test_app(runtime)
+    test_stale_bytecode(runtime)
+    print('%s passes all app mode tests' % runtime)
@@ -267,6 +267,231 @@ def test_B_flag(runtime=PYRUN):
     assert not os.path.exists(PYC_FILE)
     assert not os.path.exists(PYC_CACHE)
 
+def test_script_bytecode_cache(runtime=PYRUN):
+
+    os.chdir(TESTDIR)
+
+    if python_version(runtime) < '3':
+        # Scripts are only cached in Python 3
+        return
+
+    PYC_CACHE = '__pycache__'
+    if os.path.exists(PYC_CACHE):
+        shutil.rmtree(PYC_CACHE)
+
+    # -B must not write the cache file
+    result = run('%s -B hello.py' % runtime)
+    assert match_result(
+        result,
+        'Hello world !\n'
+        )
+    assert not os.path.exists(PYC_CACHE)
+
+    # First run writes the cache file, second run uses it
+    for i in range(2):
+        result = run('%s hello.py' % runtime)
+        assert match_result(
+            result,
+            'Hello world !\n'
+            )
+        pyc_files = [filename
+                     for filename in os.listdir(PYC_CACHE)
+                     if filename.startswith('hello.')]
+        assert len(pyc_files) == 1, pyc_files
+
+    # -O uses a separate cache file
+    result = run('%s -O hello.py' % runtime)
+    assert match_result(
+        result,
+        'Hello world !\n'
+        )
+    assert [filename
+            for filename in os.listdir(PYC_CACHE)
+            if filename.startswith('hello.') and '.opt-1.' in filename]
+    shutil.rmtree(PYC_CACHE)
+
+    # Code loaded from the cache file has to use the path the script
+    # was run with, not the one used when writing the cache file
+    SCRIPT = 'pyrun_test_cofilename.py'
+    open(SCRIPT, 'w').write(
+        'import sys\n'
+        'print(sys._getframe().f_code.co_filename)\n')
+    try:
+        for path in (SCRIPT,
+                     os.path.join('..', os.path.basename(TESTDIR), SCRIPT),
+                     os.path.join(TESTDIR, SCRIPT)):
+            result = run('%s %s' % (runtime, path))
+            assert result.strip() == path, (result, path)
+        assert [filename
+                for filename in os.listdir(PYC_CACHE)
+                if filename.startswith('pyrun_test_cofilename.')]
+    finally:
+        os.remove(SCRIPT)
+        shutil.rmtree(PYC_CACHE)
+
+def test_site_cache(runtime=PYRUN):
+
+    os.chdir(TESTDIR)
+
+    # Find the site-packages dir of the runtime
+    site_packages = run(
+        '%s -c "import sys; '
+        'print([p for p in sys.path if p.endswith(\'site-packages\')][-1])"' %
+        runtime).strip()
+    assert os.path.isdir(site_packages), site_packages
+    is_pyrun = not run('%s -c "import pyrun_config"' % runtime)
+    is_py3 = python_version(runtime) >= '3'
+    SITE_CACHE = os.path.join(os.path.dirname(site_packages),
+                              'pyrun-site.cache')
+    PTH_FILE = os.path.join(site_packages, 'pyrun-test-sitecache.pth')
+    PTH_DIR = os.path.join(site_packages, 'pyrun-test-sitecache')
+    CHECK = ('%s -c "import sys, os; '
+             'print(%r in sys.path, os.environ.get(\'PYRUN_TEST_PTH\'))"' %
+             (runtime, PTH_DIR))
+
+    os.mkdir(PTH_DIR)
+    try:
+        open(PTH_FILE, 'w').write(
+            '# pyrun site cache test\n'
+            'pyrun-test-sitecache\n'
+            'import os; os.environ["PYRUN_TEST_PTH"] = '
+            'os.environ.get("PYRUN_TEST_PTH", "") + "ok"\n')
+
+        # First run scans the .pth files, second run uses the cache;
+        # import lines have to be run exactly once in both cases, also
+        # when site.main() is not told to skip the user site dir with -s
+        # (Python 2 runs them again in site.main())
+        if is_py3:
+            expected = 'True ok\n'
+        else:
+            expected = 'True (ok)+\n'
+        for i in range(2):
+            result = run(CHECK)
+            assert match_result(
+                result,
+                expected
+                )
+            if is_pyrun and is_py3:
+                assert os.path.exists(SITE_CACHE)
+
+        # Dirs outside site-packages referenced by a cached .pth file
+        # have to be checked on every start: they may be created or
+        # removed without invalidating the cache
+        OUTSIDE_DIR = os.path.join(TESTDIR, 'pyrun-test-sitecache-dir')
+        OUTSIDE_CHECK = ('%s -c "import sys; print(%r in sys.path)"' %
+                         (runtime, OUTSIDE_DIR))
+        open(PTH_FILE, 'a').write(OUTSIDE_DIR + '\n')
+        try:
+            for exists in (False, True, False):
+                if exists:
+                    os.mkdir(OUTSIDE_DIR)
+                elif os.path.exists(OUTSIDE_DIR):
+                    os.rmdir(OUTSIDE_DIR)
+                for i in range(2):
+                    result = run(OUTSIDE_CHECK)
+                    assert result.strip() == str(exists), (result, exists)
+        finally:
+            if os.path.exists(OUTSIDE_DIR):
+                os.rmdir(OUTSIDE_DIR)
+
+        # Removing the .pth file has to invalidate the cache
+        os.remove(PTH_FILE)
+        result = run(CHECK)
+        assert match_result(
+            result,
+            'False None\n'
+            )
+
+        # PYRUN_SITECACHE=0 disables the cache
+        open(PTH_FILE, 'w').write('pyrun-test-sitecache\n')
+        result = run('PYRUN_SITECACHE=0 ' + CHECK)
+        assert match_result(
+            result,
+            'True None\n'
+            )
+
+    finally:
+        if os.path.exists(PTH_FILE):
+            os.remove(PTH_FILE)
+        shutil.rmtree(PTH_DIR)
+
+def test_X_importtime(runtime=PYRUN):
+
+    os.chdir(TESTDIR)
+
+    if python_version(runtime) < '3':
+        # Import timing is only available in Python 3
+        return
+    if run('%s -c "import pyrun_config"' % runtime):
+        # Not a pyrun runtime
+        return
+
+    # Import tree on stderr
+    result = run('%s -X importtime -c "import json"' % runtime)
+    assert match_result(
+        result,
+        r'import time: self \[us\] \| cumulative \| unmarshal \| kind .*\n'
+        '(.*\n)*'
+        r'import time: +[0-9]+ \| +[0-9]+ \| +[0-9]+ \| [a-z]+ +\| json\n'
+        ), result
+
+    # JSON output
+    JSON_FILE = 'importtime.json'
+    if os.path.exists(JSON_FILE):
+        os.remove(JSON_FILE)
+    result = run('PYRUN_IMPORTTIME=%s %s -c "import json"' % (
+        JSON_FILE, runtime))
+    assert not result, result
+    import json
+    with open(JSON_FILE) as file:
+        data = json.load(file)
+    os.remove(JSON_FILE)
+    names = [record['name'] for record in data['imports']]
+    assert 'json' in names, names
+    # pyrun_config gets imported by the startup code
+    assert 'pyrun_config' in names, names
+
+def test_config_vars(runtime=PYRUN):
+
+    os.chdir(TESTDIR)
+
+    if run('%s -c "import pyrun_config"' % runtime):
+        # Not a pyrun runtime
+        return
+
+    # pyrun_config.config_vars is created on first access (PEP 562) and
+    # shared with sysconfig; the result must not depend on which one is
+    # used first. The script prints a hash of the config vars.
+    SCRIPT = 'pyrun_test_config_vars.py'
+    open(SCRIPT, 'w').write(
+        'import sys, hashlib, pyrun_config\n'
+        'if sys.argv[1] == "sysconfig":\n'
+        '    import sysconfig\n'
+        '    config_vars = sysconfig.get_config_vars()\n'
+        'else:\n'
+        '    if "sysconfig" not in sys.modules and sys.version_info >= (3, 7):\n'
+        '        assert "config_vars" not in vars(pyrun_config)\n'
+        '    config_vars = pyrun_config.config_vars\n'
+        '    assert vars(pyrun_config)["config_vars"] is config_vars\n'
+        '    import sysconfig\n'
+        'assert pyrun_config.config_vars is config_vars\n'
+        'assert sysconfig.get_config_vars() is config_vars\n'
+        'assert sysconfig.get_config_var("prefix") == pyrun_config.prefix\n'
+        '# Values using the installation prefix refer to the runtime prefix\n'
+        'libdest = sysconfig.get_config_var("LIBDEST")\n'
+        'assert libdest.startswith(pyrun_config.prefix + "/"), libdest\n'
+        'assert not [value for value in config_vars.values()\n'
+        '            if isinstance(value, str) and "%(prefix)s" in value]\n'
+        'print(hashlib.sha256(\n'
+        '    repr(sorted(config_vars.items())).encode("utf-8")).hexdigest())\n')
+    try:
+        direct = run('%s %s direct' % (runtime, SCRIPT)).strip()
+        assert re.match('^[0-9a-f]{64}$', direct), direct
+        result = run('%s %s sysconfig' % (runtime, SCRIPT)).strip()
+        assert result == direct, (result, direct)
+    finally:
+        os.remove(SCRIPT)
+
 def test_R_flag(runtime=PYRUN):
 
     os.chdir(TESTDIR)
@@ -392,8 +617,12 @@ if __name__ == '__main__':
     test_v_flag(runtime)
     test_s_flag(runtime)
     test_B_flag(runtime)
+    test_script_bytecode_cache(runtime)
+    test_site_cache(runtime)
+    test_config_vars(runtime)
     test_R_flag(runtime)
     test_W_flag(runtime)
+    test_X_importtime(runtime)
     test_m_flag(runtime)
     test_c_flag(runtime)
     test_E_flag(runtime)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+#
+# Test that frozen modules referencing the shared constant pool
+# (PYRUNFREEZECONSTPOOL, makeconstpool) load correctly and share the
+# pool objects.
+#
+# Note: This test only works for Python 3.
+#
+
+import sys, types
+
+# Double check that asserts work
+try:
+    assert False
+except AssertionError:
+    pass
+else:
+    raise RuntimeError('asserts are disabled - cannot run tests')
+
+# Name of the frozen module holding the pool and header of module data
+# using it; see makeconstpool in freeze-3
+DATA_MODULE = 'pyrun_constpool_data'
+POOL_MAGIC = b'PYRP'
+
+# Modules to load and use
+MODULES = ('argparse', 'json', 'textwrap', 'email.message', 'http.client',
+           'dataclasses', 'logging')
+
+def frozen_data(name):
+
+    import _imp
+    return bytes(_imp.find_frozen(name, withdata=True)[0])
+
+def walk_code(code):
+
+    yield code
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            yield from walk_code(const)
+
+def test_pool():
+
+    import _imp
+    if (not hasattr(_imp, 'find_frozen') or
+        not _imp.is_frozen(DATA_MODULE)):
+        print('pyrun was built without constant pool')
+        return False
+    # The pool module itself is an empty module
+    __import__(DATA_MODULE)
+    pooled = [name for name in MODULES
+              if frozen_data(name).startswith(POOL_MAGIC)]
+    assert pooled, 'no module uses the constant pool'
+    for name in pooled:
+        code = _imp.get_frozen_object(name)
+        assert isinstance(code, types.CodeType), name
+        # Loading the module again has to give the same result
+        assert _imp.get_frozen_object(name) == code, name
+    return True
+
+def test_sharing():
+
+    # Objects used by several modules have to be the same objects, while
+    # unmarshalling the modules separately creates separate objects
+    import _imp
+    seen = {}
+    shared = 0
+    for name in MODULES:
+        for code in walk_code(_imp.get_frozen_object(name)):
+            for obj in (code.co_qualname, code.co_names,
+                        code.co_linetable, code.co_exceptiontable):
+                if len(obj) <= 1:
+                    continue
+                if isinstance(obj, str) and obj.isidentifier():
+                    # Interned anyway
+                    continue
+                module, first = seen.setdefault(obj, (name, obj))
+                if module != name and first is obj:
+                    shared += 1
+    assert shared, 'no shared objects found'
+
+def test_modules():
+
+    import argparse, json, textwrap, dataclasses
+    parser = argparse.ArgumentParser(prog='test')
+    parser.add_argument('-n', type=int)
+    assert parser.parse_args(['-n', '2']).n == 2
+    assert json.loads(json.dumps({'a': [1, 2.5, None]})) == {'a': [1, 2.5, None]}
+    assert textwrap.wrap('a b c', width=3) == ['a b', 'c']
+    @dataclasses.dataclass
+    class Point:
+        x: int
+        y: int = 0
+    assert Point(1) == Point(1, 0)
+
+###
+
+if __name__ == '__main__':
+    if test_pool():
+        test_sharing()
+    test_modules()
+    print('pyrun passes all constant pool tests')
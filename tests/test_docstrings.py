@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+#
+# Test that docstrings of the frozen stdlib are available to inspect,
+# pydoc and help(), also when they were moved out of the code objects at
+# freeze time (PYRUNFREEZELAZYDOCSTRINGS, pyrun_docstrings).
+#
+# Note: This test only works for Python 3.
+#
+
+import sys, inspect, pydoc, json, json.decoder, argparse
+
+# Double check that asserts work
+try:
+    assert False
+except AssertionError:
+    pass
+else:
+    raise RuntimeError('asserts are disabled - cannot run tests')
+
+def test_docstrings():
+
+    # Modules, classes, functions and methods
+    assert inspect.getdoc(json).startswith('JSON (JavaScript Object')
+    assert inspect.getdoc(json.dumps).startswith('Serialize ``obj``')
+    assert inspect.getdoc(json.JSONDecoder).startswith('Simple JSON')
+    assert inspect.getdoc(json.JSONDecoder.decode).startswith(
+        'Return the Python representation')
+    assert inspect.getdoc(json.JSONDecoder().decode).startswith(
+        'Return the Python representation')
+    assert inspect.getdoc(argparse.ArgumentParser).startswith(
+        'Object for parsing command line strings')
+
+    # pydoc, as used by help()
+    assert 'Serialize ``obj``' in pydoc.render_doc(json.dumps)
+    assert 'JSON (JavaScript Object' in pydoc.render_doc(json)
+
+    # Restoring __doc__
+    import pyrun_docstrings
+    pyrun_docstrings.restore(json.decoder)
+    assert json.decoder.__doc__.startswith('Implementation of JSONDecoder')
+    assert json.decoder.JSONDecoder.raw_decode.__doc__.startswith(
+        'Decode a JSON document')
+
+###
+
+if __name__ == '__main__':
+    test_docstrings()
+    print('%s passes all docstring tests' % sys.executable)
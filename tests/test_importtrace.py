@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+#
+# Test the import tracing and sidecar lib dir support used for
+# tree-shaken builds (pyrun_importtrace).
+#
+# Note: This test only works for Python 3.
+#
+
+import os, sys, subprocess, tempfile, shutil
+
+# Double check that asserts work
+try:
+    assert False
+except AssertionError:
+    pass
+else:
+    raise RuntimeError('asserts are disabled - cannot run tests')
+
+SIDECAR_TEST = """\
+import sys
+import pyrun_importtrace
+pyrun_importtrace.install_sidecar(sys.argv[1])
+import sidecarpkg
+# Simulate a frozen package without usable __path__
+sidecarpkg.__path__ = []
+import sidecarpkg.sub
+print(sidecarpkg.sub.VALUE)
+"""
+
+def run_runtime(runtime, args, env=None):
+
+    runtime_env = dict(os.environ)
+    runtime_env.pop('PYRUN_SERVER', None)
+    runtime_env.pop('PYRUN_IMPORTTRACE', None)
+    if env:
+        runtime_env.update(env)
+    pipe = subprocess.Popen([runtime] + args,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE,
+                            env=runtime_env)
+    stdout_data, stderr_data = pipe.communicate()
+    return (pipe.returncode,
+            stdout_data.decode('utf-8'),
+            stderr_data.decode('utf-8'))
+
+def test_importtrace(runtime):
+
+    tempdir = tempfile.mkdtemp()
+    manifest = os.path.join(tempdir, 'app.imports')
+
+    # Traced runs append to the manifest
+    env = {'PYRUN_IMPORTTRACE': manifest}
+    rc, stdout, stderr = run_runtime(
+        runtime, ['-c', 'import json'], env)
+    assert rc == 0, (rc, stdout, stderr)
+    rc, stdout, stderr = run_runtime(
+        runtime, ['-c', 'import email.message'], env)
+    assert rc == 0, (rc, stdout, stderr)
+    with open(manifest) as file:
+        modules = file.read().splitlines()
+    assert 'json' in modules, modules
+    assert 'email.message' in modules, modules
+    assert '__main__' not in modules, modules
+
+    # Without the env var, nothing is written
+    os.remove(manifest)
+    rc, stdout, stderr = run_runtime(runtime, ['-c', 'import json'])
+    assert rc == 0, (rc, stdout, stderr)
+    assert not os.path.exists(manifest)
+
+    # Modules can be loaded from a sidecar lib dir, even if the
+    # package's __path__ doesn't point there
+    sidecar = os.path.join(tempdir, 'sidecar')
+    os.makedirs(os.path.join(sidecar, 'sidecarpkg'))
+    with open(os.path.join(sidecar, 'sidecarpkg', '__init__.py'), 'w') as file:
+        file.write('')
+    with open(os.path.join(sidecar, 'sidecarpkg', 'sub.py'), 'w') as file:
+        file.write('VALUE = 42\n')
+    script = os.path.join(tempdir, 'sidecar_test.py')
+    with open(script, 'w') as file:
+        file.write(SIDECAR_TEST)
+    rc, stdout, stderr = run_runtime(runtime, [script, sidecar])
+    assert rc == 0, (rc, stdout, stderr)
+    assert stdout.strip() == '42', stdout
+
+    shutil.rmtree(tempdir)
+
+###
+
+if __name__ == '__main__':
+    try:
+        runtime = sys.argv[1]
+    except IndexError:
+        runtime = sys.executable
+        print('Using %s as runtime.' % runtime)
+    test_importtrace(runtime)
+    print('%s passes all import trace tests' % runtime)
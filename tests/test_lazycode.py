@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+#
+# Test that functions work the same, when their code objects were
+# replaced with lazily loaded stubs at freeze time (PYRUNFREEZELAZYCODE,
+# pyrun_lazycode).
+#
+# Note: This test only works for Python 3.
+#
+
+import sys, inspect, warnings
+
+# Double check that asserts work
+try:
+    assert False
+except AssertionError:
+    pass
+else:
+    raise RuntimeError('asserts are disabled - cannot run tests')
+
+# Modules with larger functions, which are not used by pyrun itself
+MODULES = ('argparse', 'email.message', 'http.cookiejar', 'textwrap')
+
+def stub_functions(module):
+
+    """ Return the functions and methods of module using stubs.
+
+    """
+    import pyrun_lazycode
+    functions = []
+    for obj in list(vars(module).values()):
+        if inspect.isclass(obj) and obj.__module__ == module.__name__:
+            candidates = vars(obj).values()
+        else:
+            candidates = [obj]
+        for candidate in candidates:
+            if (inspect.isfunction(candidate) and
+                pyrun_lazycode.is_stub(candidate.__code__)):
+                functions.append(candidate)
+    return functions
+
+def test_stubs():
+
+    import _imp
+    if (sys.version_info < (3, 11) or
+        not _imp.is_frozen('pyrun_lazycode_data')):
+        print('pyrun was built without lazy function code')
+        return False
+    import importlib, pyrun_lazycode
+    for name in MODULES:
+        module = importlib.import_module(name)
+        functions = stub_functions(module)
+        assert functions, name
+        for function in functions:
+            signature = inspect.signature(function)
+            doc = function.__doc__
+            stub = function.__code__
+            pyrun_lazycode.resolve(function)
+            assert function.__code__ is not stub, function
+            assert not pyrun_lazycode.is_stub(function.__code__), function
+            assert inspect.signature(function) == signature, function
+            assert function.__doc__ == doc, function
+            assert (function.__code__.co_firstlineno ==
+                    stub.co_firstlineno), function
+    return True
+
+def test_calls():
+
+    # Uses functions of argparse and textwrap for the first time
+    import argparse
+    parser = argparse.ArgumentParser(prog='test', description='x ' * 50)
+    parser.add_argument('-n', type=int, default=1)
+    parser.add_argument('files', nargs='*')
+    args = parser.parse_args(['-n', '3', 'a', 'b'])
+    assert args.n == 3 and args.files == ['a', 'b'], args
+    assert 'usage: test' in parser.format_help()
+
+def test_first_call_warnings():
+
+    # Warnings issued by a function on its first call have to point to
+    # the caller, not to the stub
+    import http.cookiejar
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        http.cookiejar.CookieJar()
+    assert not caught or caught[0].filename == __file__, caught
+
+###
+
+if __name__ == '__main__':
+    if test_stubs():
+        test_calls()
+        test_first_call_warnings()
+    print('pyrun passes all lazy function code tests')
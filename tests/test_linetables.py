@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+#
+# Test that tracebacks, inspect, warnings and logging show the correct
+# line numbers for frozen stdlib code, also when the line tables were
+# stripped at freeze time (PYRUNFREEZELAZYLINETABLES, pyrun_linetables).
+#
+# Note: This test only works for Python 3.
+#
+
+import os, sys, re, subprocess, traceback, inspect, json
+import warnings, logging
+import pyrun_linetables
+
+# Double check that asserts work
+try:
+    assert False
+except AssertionError:
+    pass
+else:
+    raise RuntimeError('asserts are disabled - cannot run tests')
+
+# First line of the function raising the exceptions used by the tests;
+# the reported line numbers have to be larger than this
+RAW_DECODE_FIRSTLINENO = json.JSONDecoder.raw_decode.__code__.co_firstlineno
+
+def test_traceback():
+
+    try:
+        json.loads('[')
+    except ValueError:
+        entries = traceback.extract_tb(sys.exc_info()[2])
+    else:
+        raise AssertionError('no exception raised')
+    entry = entries[-1]
+    assert entry.name == 'raw_decode', entries
+    assert entry.lineno > RAW_DECODE_FIRSTLINENO, entries
+
+def test_inspect():
+
+    stacks = []
+    def hook(obj):
+        stacks.append(inspect.stack())
+        return obj
+    json.loads('{}', object_hook=hook)
+    frames = [frame for frame in stacks[0] if frame.function == 'raw_decode']
+    assert frames, stacks[0]
+    assert frames[0].lineno > RAW_DECODE_FIRSTLINENO, frames
+
+def test_warnings():
+
+    # stacklevel=2 attributes the warning to raw_decode(), which calls
+    # the hook
+    def hook(obj):
+        warnings.warn('test warning', stacklevel=2)
+        return obj
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        json.loads('{}', object_hook=hook)
+    assert len(caught) == 1, caught
+    message = caught[0]
+    assert message.filename.endswith('decoder.py'), message
+    assert message.lineno > RAW_DECODE_FIRSTLINENO, message
+    text = warnings.formatwarning(message.message, message.category,
+                                  message.filename, message.lineno)
+    assert (':%i: UserWarning' % message.lineno) in text, text
+
+def test_logging():
+
+    records = []
+    class Handler(logging.Handler):
+        def emit(self, record):
+            records.append(record)
+    logger = logging.getLogger('test_linetables')
+    logger.propagate = False
+    logger.addHandler(Handler())
+    # stacklevel=2 attributes the record to raw_decode(), which calls
+    # the hook
+    def hook(obj):
+        logger.warning('test record', stacklevel=2)
+        return obj
+    json.loads('{}', object_hook=hook)
+    assert len(records) == 1, records
+    record = records[0]
+    assert record.funcName == 'raw_decode', record
+    assert record.lineno > RAW_DECODE_FIRSTLINENO, record
+
+def test_restored_cache():
+
+    if pyrun_linetables.data_module() is None:
+        print('pyrun was built without stripped line tables')
+        return
+    code = json.JSONDecoder.raw_decode.__code__
+    restored = pyrun_linetables.restored_code(code)
+    assert pyrun_linetables.restored_code(code) is restored
+    # Entries of code objects created at run time go away with them
+    code = compile('x = 1', '<test_linetables>', 'exec')
+    key = id(code)
+    assert pyrun_linetables.restored_code(code) is code
+    assert key in pyrun_linetables._restored
+    del code
+    assert key not in pyrun_linetables._restored
+
+def test_uncaught(runtime):
+
+    env = dict(os.environ)
+    env.pop('PYRUN_SERVER', None)
+    pipe = subprocess.Popen([runtime, '-c', 'import json; json.loads("[")'],
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE,
+                            env=env)
+    stdout_data, stderr_data = pipe.communicate()
+    stderr = stderr_data.decode('utf-8')
+    assert pipe.returncode == 1, (pipe.returncode, stderr)
+    match = re.search(r'line (\d+), in raw_decode', stderr)
+    assert match is not None, stderr
+    assert int(match.group(1)) > RAW_DECODE_FIRSTLINENO, stderr
+
+###
+
+if __name__ == '__main__':
+    try:
+        runtime = sys.argv[1]
+    except IndexError:
+        runtime = sys.executable
+        print('Using %s as runtime.' % runtime)
+    test_traceback()
+    test_inspect()
+    test_warnings()
+    if sys.version_info >= (3, 8):
+        # Logger methods support stacklevel since Python 3.8
+        test_logging()
+    test_restored_cache()
+    test_uncaught(runtime)
+    print('%s passes all line number tests' % runtime)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+#
+# Test that the regular expressions precompiled at freeze time
+# (PYRUNFREEZERECACHE, pyrun_re_cache) match those compiled by the re
+# module.
+#
+# Note: This test only works for Python 3.
+#
+
+import re
+
+try:
+    # Python 3.11+
+    from re import _compiler as sre_compiler
+except ImportError:
+    import sre_compile as sre_compiler
+
+import pyrun_re_cache
+
+# Double check that asserts work
+try:
+    assert False
+except AssertionError:
+    pass
+else:
+    raise RuntimeError('asserts are disabled - cannot run tests')
+
+def test_patterns():
+
+    data = pyrun_re_cache.data_module()
+    if data is None:
+        print('pyrun was built without precompiled regular expressions')
+        return
+    assert data.PATTERNS
+    for pattern, flags in data.PATTERNS:
+        cached = pyrun_re_cache.compile(pattern, flags)
+        compiled = sre_compiler.compile(pattern, flags)
+        assert cached == compiled, (pattern, flags)
+        assert cached.groups == compiled.groups, (pattern, flags)
+        assert cached.groupindex == compiled.groupindex, (pattern, flags)
+
+def test_missing():
+
+    assert pyrun_re_cache.compile('pyrun-not-precompiled-\\d+', 0) is None
+    assert re.match('pyrun-not-precompiled-\\d+', 'pyrun-not-precompiled-1')
+
+def test_module():
+
+    # textwrap compiles its patterns at module level
+    import textwrap
+    assert textwrap.dedent('  a\n  b\n') == 'a\nb\n'
+
+###
+
+if __name__ == '__main__':
+    test_patterns()
+    test_missing()
+    test_module()
+    print('pyrun passes all precompiled regular expression tests')
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+#
+# Test the pyrun fork server (pyrun_server).
+#
+# Note: This test only works on Unix platforms and for Python 3.
+#
+
+import os, sys, subprocess, time, tempfile, shutil
+
+PYRUN = 'pyrun'
+TESTDIR = os.environ.get('TESTDIR', os.path.abspath('tests'))
+if not os.path.exists(TESTDIR):
+    TESTDIR = os.path.abspath('../tests')
+
+# Double check that asserts work
+try:
+    assert False
+except AssertionError:
+    pass
+else:
+    raise RuntimeError('asserts are disabled - cannot run tests')
+
+def run_client(runtime, args, socket_path, stdin=b'', cwd=None, env=None):
+
+    client_env = dict(os.environ)
+    if env:
+        client_env.update(env)
+    if socket_path is None:
+        client_env.pop('PYRUN_SERVER', None)
+    else:
+        client_env['PYRUN_SERVER'] = socket_path
+    pipe = subprocess.Popen([runtime] + args,
+                            stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE,
+                            cwd=cwd,
+                            env=client_env)
+    stdout_data, stderr_data = pipe.communicate(stdin)
+    return (pipe.returncode,
+            stdout_data.decode('utf-8'),
+            stderr_data.decode('utf-8'))
+
+def start_server(runtime, socket_path):
+
+    env = dict(os.environ)
+    env.pop('PYRUN_SERVER', None)
+    server = subprocess.Popen([runtime, '-m', 'pyrun_server',
+                               '--listen', socket_path,
+                               '--preload', 'json',
+                               '--quiet'],
+                              env=env)
+    for i in range(100):
+        if os.path.exists(socket_path):
+            break
+        time.sleep(0.1)
+    else:
+        server.kill()
+        raise AssertionError('server did not start')
+    return server
+
+def test_server(runtime=PYRUN):
+
+    if os.sep in runtime:
+        # The clients are run in a different dir
+        runtime = os.path.abspath(runtime)
+    tempdir = tempfile.mkdtemp()
+    socket_path = os.path.join(tempdir, 'pyrun.sock')
+    script = os.path.join(tempdir, 'script.py')
+    with open(script, 'w') as file:
+        file.write(
+            'import sys, os\n'
+            'print(sys.argv[1:])\n'
+            'print(os.getcwd())\n'
+            'print(os.environ.get("PYRUN_TEST_VAR"))\n'
+            'print("json" in sys.modules)\n'
+            'print(sys.stdin.read().strip())\n'
+            'sys.stderr.write("stderr output\\n")\n'
+            'sys.exit(int(sys.argv[1]))\n')
+
+    server = start_server(runtime, socket_path)
+    try:
+        # Requests are run by the server, using the client's argv,
+        # cwd, env and stdio; the exit code gets relayed
+        rc, stdout, stderr = run_client(
+            runtime, [script, '3', 'abc'], socket_path,
+            stdin=b'input data',
+            cwd=tempdir,
+            env={'PYRUN_TEST_VAR': 'value'})
+        assert rc == 3, (rc, stdout, stderr)
+        assert stdout.splitlines() == [
+            "['3', 'abc']",
+            os.path.realpath(tempdir),
+            'value',
+            # json was preloaded by the server
+            'True',
+            'input data',
+            ], stdout
+        assert stderr == 'stderr output\n', stderr
+
+        # Exceptions
+        rc, stdout, stderr = run_client(
+            runtime, ['-c', '1/0'], socket_path)
+        assert rc == 1, rc
+        assert 'ZeroDivisionError' in stderr, stderr
+        assert 'pyrun_server' not in stderr, stderr
+
+        # Signals get forwarded to the worker
+        client = subprocess.Popen(
+            [runtime, '-c', 'import time; time.sleep(10)'],
+            env=dict(os.environ, PYRUN_SERVER=socket_path))
+        time.sleep(1)
+        client.terminate()
+        assert client.wait() == -15, client.returncode
+
+    finally:
+        server.terminate()
+        server.wait()
+
+    # The server removes the socket on exit
+    assert not os.path.exists(socket_path)
+
+    # Without server, the client falls back to a normal startup
+    rc, stdout, stderr = run_client(
+        runtime, [script, '0'], socket_path,
+        cwd=tempdir,
+        env={'PYRUN_TEST_VAR': 'value'})
+    assert rc == 0, (rc, stdout, stderr)
+    assert stdout.splitlines()[-1] == '', stdout
+    assert stdout.splitlines()[-2] == 'False', stdout
+
+    shutil.rmtree(tempdir)
+
+###
+
+if __name__ == '__main__':
+    try:
+        runtime = sys.argv[1]
+    except IndexError:
+        runtime = sys.executable
+        print('Using %s as runtime.' % runtime)
+    test_server(runtime)
+    print('%s passes all fork server tests' % runtime)
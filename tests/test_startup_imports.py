@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+#
+# Test the set of modules imported by pyrun during startup in the
+# various run modes, to catch regressions which add avoidable imports
+# to the startup path.
+#
+# Note: This test currently only works on Unix platforms.
+#
+
+import os, sys, subprocess, shutil, tempfile, zipfile
+
+PYRUN = 'pyrun'
+
+# Max. number of modules loaded when the user code starts to run;
+# can be adjusted via the env var PYRUN_TEST_MAX_MODULES
+MAX_MODULES = int(os.environ.get('PYRUN_TEST_MAX_MODULES', 60))
+
+# Max. number of extra modules which may be loaded by a run mode,
+# compared to "pyrun -c"
+MAX_EXTRA_MODULES = {
+    'script': 0,
+    # pyrun_appimport and mmap
+    'app': 2,
+    '-S': 0,
+    '-I': 0,
+    # runpy and its dependencies
+    '-m': 20,
+    }
+
+# Modules which must not be loaded during startup
+FORBIDDEN_MODULES = (
+    'getopt',
+    'gettext',
+    're',
+    'enum',
+    'locale',
+    'importlib.util',
+    'importlib.machinery',
+    'runpy',
+    )
+
+# Probe code to run in the various modes
+PROBE = 'import sys; sys.stdout.write(" ".join(sorted(sys.modules)))\n'
+
+# Enable debug output ?
+_debug = 0
+
+# Double check that asserts work
+try:
+    assert False
+except AssertionError:
+    pass
+else:
+    raise RuntimeError('asserts are disabled - cannot run tests')
+
+def run(args, cwd=None):
+
+    if _debug:
+        print ('Running %s' % ' '.join(args))
+    env = dict(os.environ)
+    for name in ('PYRUN_SERVER', 'PYRUN_IMPORTTIME', 'PYTHONSTARTUP'):
+        env.pop(name, None)
+    pipe = subprocess.Popen(args,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE,
+                            cwd=cwd,
+                            env=env)
+    stdout_data, stderr_data = pipe.communicate()
+    assert pipe.returncode == 0, stderr_data
+    return set(stdout_data.decode('utf-8').split())
+
+def python_version(runtime):
+
+    return subprocess.check_output(
+        [runtime, '-c', 'import sys; sys.stdout.write(sys.version)']
+        ).decode('utf-8').split()[0]
+
+def is_pyrun(runtime):
+
+    return subprocess.call(
+        [runtime, '-c', 'import pyrun_config'],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE) == 0
+
+def startup_modules(runtime, tempdir):
+
+    """ Return a dictionary mapping run modes to the set of modules
+        loaded when the user code starts to run.
+
+    """
+    probe_file = os.path.join(tempdir, 'probe.py')
+    with open(probe_file, 'w') as file:
+        file.write(PROBE)
+    modules = {
+        '-c': run([runtime, '-c', PROBE]),
+        'script': run([runtime, probe_file]),
+        '-m': run([runtime, '-m', 'probe'], cwd=tempdir),
+        '-S': run([runtime, '-S', probe_file]),
+        '-I': run([runtime, '-I', probe_file]),
+        }
+    if is_pyrun(runtime):
+        # App mode: copy pyrun using a different name and append a
+        # ZIP file with the probe as __main__ module
+        app_file = os.path.join(tempdir, 'probeapp')
+        zip_file = os.path.join(tempdir, 'probeapp.zip')
+        archive = zipfile.ZipFile(zip_file, 'w')
+        archive.writestr('__main__.py', PROBE)
+        archive.close()
+        with open(app_file, 'wb') as app:
+            with open(runtime, 'rb') as file:
+                shutil.copyfileobj(file, app)
+            with open(zip_file, 'rb') as file:
+                shutil.copyfileobj(file, app)
+        os.chmod(app_file, 0o755)
+        modules['app'] = run([app_file])
+    return modules
+
+def test_startup_imports(runtime=PYRUN):
+
+    if os.sep not in runtime and hasattr(shutil, 'which'):
+        runtime = shutil.which(runtime) or runtime
+    runtime = os.path.abspath(runtime)
+    version = tuple(int(x) for x in python_version(runtime).split('.')[:2])
+    tempdir = tempfile.mkdtemp()
+    try:
+        modules = startup_modules(runtime, tempdir)
+    finally:
+        shutil.rmtree(tempdir)
+
+    reference = modules['-c']
+    for mode, loaded in sorted(modules.items()):
+        print ('%-6s: %i modules' % (mode, len(loaded)))
+        if _debug:
+            print ('        %s' % ' '.join(sorted(loaded)))
+
+        # Check forbidden modules
+        forbidden = set(FORBIDDEN_MODULES)
+        if mode == '-m':
+            # runpy is needed for running modules
+            forbidden = set()
+        elif mode == 'app' and version < (3, 0):
+            # App mode only avoids runpy in Python 3
+            forbidden.discard('runpy')
+            forbidden.discard('importlib.util')
+            forbidden.discard('importlib.machinery')
+        found = sorted(forbidden & loaded)
+        assert not found, (mode, found)
+
+        # Check counts
+        assert len(loaded) <= MAX_MODULES, (mode, len(loaded))
+        if mode in MAX_EXTRA_MODULES:
+            extra = sorted(loaded - reference)
+            assert len(extra) <= MAX_EXTRA_MODULES[mode], (mode, extra)
+
+###
+
+if __name__ == '__main__':
+    try:
+        runtime = sys.argv[1]
+    except IndexError:
+        runtime = sys.executable
+        print('Using %s as runtime.' % runtime)
+    test_startup_imports(runtime)
+    print('%s passes all startup import tests' % runtime)